@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Answer-key verification for computational questions.
+
+validate_question trusts the option the model labels "CA" and marks option 0
+when none is labelled. This module computes the answer instead. A stem that is
+a single arithmetic expression ("What is 3/4 + 1/8?") gives the answer directly.
+Otherwise the answer comes from the last calculation written in the solution
+("Step 2: 96 ÷ 4 = 24"), evaluated exactly rather than read from its right-hand
+side. Option texts such as "24", "$4.50", "1 1/2 cups" or "7/8" are compared
+to it with exact rational math.
+
+Results per question:
+  verified   the CA option has the computed value
+  corrected  another option has it and is re-marked CA
+  mismatch   the stem's expression matches no option (the question is flagged)
+  ambiguous  several options have the computed value (flagged)
+  unchecked  nothing to compute, or options that are not numbers
+
+A solution's last calculation is not always the answer (a closing check such
+as "24 × 4 = 96"). So a CA whose value appears in any of the solution's
+calculations counts as verified, and a solution-derived key is re-marked only
+when the CA appears in none of them. Only a stem expression can flag a mismatch.
+
+Bulk check of a stored bank (generate_batch results, or a JSON list of questions):
+
+  python answer_key.py results.jsonl
+  python answer_key.py results.jsonl --fix --output fixed.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import arithmetic_engine
+import distractors
+import metrics
+
+ANSWER_KEY_VERIFY = os.getenv('ANSWER_KEY_VERIFY', 'true').lower() not in ('0', 'false', 'no')
+# Re-mark the CA when another option has the computed answer (otherwise only report)
+ANSWER_KEY_FIX = os.getenv('ANSWER_KEY_FIX', 'true').lower() not in ('0', 'false', 'no')
+
+RESULTS = ('verified', 'corrected', 'mismatch', 'ambiguous', 'unchecked')
+
+_NUMBER = r'\$?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?'
+_TERM = rf'\(*[ \t]*{_NUMBER}[ \t]*\)*(?:[ \t]*[-+*/×xX÷−–·][ \t]*\(*[ \t]*{_NUMBER}[ \t]*\)*)*'
+# "12 × 8 = 96" and chains such as "3/4 + 1/8 = 6/8 + 1/8 = 7/8"
+_CALCULATION = re.compile(rf'(?<![\w.]){_TERM}(?:[ \t]*=[ \t]*{_TERM})+')
+_MIXED_NUMBER = re.compile(r'(?<![\d./])(\d+)[ \t]+(\d+)/(\d+)(?![\d.])')
+_OPERATOR = re.compile(r'\d[ \t)]*[-+*/×xX÷−–·][ \t(]*\$?\d')
+
+
+def option_value(text):
+    """The exact value of a numeric option text, or None"""
+    answer = distractors.parse_answer(text)
+    return answer.value if answer is not None else None
+
+
+def _evaluate(term):
+    try:
+        return arithmetic_engine.evaluate(term.replace('$', '').replace(',', ''))
+    except (SyntaxError, ValueError, ZeroDivisionError):
+        return None
+
+
+def solution_values(solution):
+    """Exact values of the calculations in a solution, in order (each chain's left-hand side)"""
+    values = []
+    # "2 1/2" is 2 + 1/2
+    text = _MIXED_NUMBER.sub(r'(\1 + \2/\3)', str(solution or ''))
+    for match in _CALCULATION.finditer(text):
+        left = match.group().split('=')[0]
+        if _OPERATOR.search(left):
+            value = _evaluate(left)
+            if value is not None:
+                values.append(value)
+    return values
+
+
+def expected_answer(question):
+    """(value, source) where source is 'stem' or 'solution', or (None, None) if nothing can be computed"""
+    parsed = arithmetic_engine.parse_arithmetic(question.get('question', ''))
+    if parsed is not None:
+        return parsed['value'], 'stem'
+    values = solution_values(question.get('solution'))
+    if values:
+        return values[-1], 'solution'
+    return None, None
+
+
+def _check_against_solution(values, marked, solution):
+    computed = solution_values(solution)
+    if not computed:
+        return 'unchecked', None
+    if marked and values[marked[0]] in computed:
+        return 'verified', marked[0]
+    # The CA appears in no calculation: re-mark only if the final one picks out exactly one option
+    matches = [idx for idx, value in enumerate(values) if value == computed[-1]]
+    if len(matches) == 1:
+        return 'corrected', matches[0]
+    return ('ambiguous', None) if matches else ('unchecked', None)
+
+
+def check_question(question):
+    """(result, index of the option with the computed answer or None)"""
+    options = question.get('options') or []
+    values = [option_value(option.get('text', '')) if isinstance(option, dict) else None for option in options]
+    if not options or any(value is None for value in values):
+        return 'unchecked', None
+    marked = [idx for idx, option in enumerate(options) if option.get('logic') == 'CA']
+    parsed = arithmetic_engine.parse_arithmetic(question.get('question', ''))
+    if parsed is None:
+        return _check_against_solution(values, marked, question.get('solution'))
+    matches = [idx for idx, value in enumerate(values) if value == parsed['value']]
+    if len(matches) > 1:
+        return 'ambiguous', None
+    if not matches:
+        return 'mismatch', None
+    return ('verified' if marked == matches else 'corrected'), matches[0]
+
+
+def verify_question(question, fix=ANSWER_KEY_FIX):
+    """Check a validated question's answer key, re-marking it (and flagging problems) when fix is set"""
+    result, correct_idx = check_question(question)
+    metrics.ANSWER_KEY_CHECKS.labels(result=result).inc()
+    if not fix:
+        return result
+    if result == 'corrected':
+        for idx, option in enumerate(question['options']):
+            if idx == correct_idx:
+                option['logic'] = 'CA'
+            elif option.get('logic') == 'CA':
+                option['logic'] = 'Plausible distractor'
+    elif result in ('mismatch', 'ambiguous'):
+        # Left for a reviewer: the computed answer is not exactly one of the options
+        question['answer_check'] = result
+    return result
+
+
+def summarize(results):
+    """Counts per result, and the share of checkable questions whose key the model got right"""
+    report = {result: 0 for result in RESULTS}
+    for result in results:
+        report[result] += 1
+    checked = report['verified'] + report['corrected'] + report['mismatch']
+    report['checked'] = checked
+    report['accuracy'] = round(report['verified'] / checked, 4) if checked else None
+    return report
+
+
+def verify_batch(questions, fix=ANSWER_KEY_FIX):
+    return summarize([verify_question(question, fix=fix) for question in questions])
+
+
+def _read_bank(path):
+    """Records with a 'questions' list: generate_batch JSONL results, a JSON list of questions or {"questions": [...]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return 'jsonl', [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, list):
+        return 'list', [{'questions': data}]
+    return 'json', [data]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('bank', help='Results JSONL from generate_batch.py, or a JSON file of questions')
+    parser.add_argument('--fix', action='store_true', help='Re-mark wrong keys and flag unresolved questions')
+    parser.add_argument('--output', help='Write the (fixed) bank here in the same format')
+    parser.add_argument('--show', type=int, default=10, help='Print up to this many corrected or flagged questions')
+    args = parser.parse_args(argv)
+
+    layout, records = _read_bank(args.bank)
+    results = []
+    shown = 0
+    for record in records:
+        for question in record.get('questions') or []:
+            result = verify_question(question, fix=args.fix)
+            results.append(result)
+            if result in ('corrected', 'mismatch', 'ambiguous') and shown < args.show:
+                shown += 1
+                expected, source = expected_answer(question)
+                print(f"{result.upper()}: {question.get('question', '')[:100]!r} "
+                      f"(computed {expected} from the {source})")
+
+    report = summarize(results)
+    print(f"{len(results)} questions: " + ', '.join(f"{report[result]} {result}" for result in RESULTS))
+    if report['accuracy'] is not None:
+        print(f"Answer-key accuracy: {report['accuracy']:.1%} of {report['checked']} checkable questions")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            if layout == 'jsonl':
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                json.dump(records[0]['questions'] if layout == 'list' else records[0], f, ensure_ascii=False,
+                          indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,43 +1,117 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
+import csv
+import io
 import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from openai import OpenAI
 from dotenv import load_dotenv
+from question_parser import IncrementalQuestionParser, extract_questions
+from option_detector import detect_options, split_options
+import arithmetic_engine
+import answer_key
+import compact_format
+import distractors
+import response_schema
+import response_cache
+import curriculum_store
+import near_duplicates
+import usage_stats
+from job_queue import JobRunner, JobStore
+from prompt_templates import LEAN_SYSTEM_PROMPTS, SYSTEM_PROMPT_VARIANTS
+import rate_limiter
+import metrics
+import tracing
+from rate_limiter import RateLimitExceeded
 
 load_dotenv()
 
+# Large requests are split into chunks of this many questions that run concurrently (0 disables fan-out)
+GENERATION_CHUNK_SIZE = int(os.getenv('GENERATION_CHUNK_SIZE', '5'))
+# Maximum number of chunk requests in flight per generation
+GENERATION_MAX_WORKERS = int(os.getenv('GENERATION_MAX_WORKERS', '4'))
+# Maximum number of concurrent DALL-E requests per generation
+IMAGE_MAX_WORKERS = int(os.getenv('IMAGE_MAX_WORKERS', '5'))
+# Per-image timeout in seconds; questions whose image is not ready by then get no image
+IMAGE_TIMEOUT_SECONDS = float(os.getenv('IMAGE_TIMEOUT_SECONDS', '60'))
+# Missing questions are re-requested up to this many times, within the overall generation deadline
+TOPUP_MAX_ROUNDS = int(os.getenv('TOPUP_MAX_ROUNDS', '2'))
+# Seconds after which a generation stops starting top-up rounds and returns what it has
+GENERATION_DEADLINE_SECONDS = float(os.getenv('GENERATION_DEADLINE_SECONDS', '150'))
+# Batch endpoint: items processed concurrently by default, the per-request cap, and the item limit
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '3'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+# Learned max-token budgets: headroom over the observed per-question percentile, and the hard cap
+TOKEN_BUDGET_MARGIN = float(os.getenv('TOKEN_BUDGET_MARGIN', '1.25'))
+TOKEN_BUDGET_MAX = int(os.getenv('TOKEN_BUDGET_MAX', '16000'))
+
 app = Flask(__name__, static_folder='static')
 CORS(app)
 
-# Initialize OpenAI client (always reload from environment to allow key updates)
+# Shared OpenAI client: created once per worker so its keep-alive connection pool and TLS
+# sessions are reused. It is rebuilt only when .env changes on disk and the key in it changed.
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+_client_lock = threading.Lock()
+_client_state = {'client': None, 'api_key': None, 'env_mtime': None}
+
+def _env_file_mtime():
+    try:
+        return os.stat(ENV_FILE).st_mtime
+    except OSError:
+        return None
+
 def get_openai_client():
-    # Reload environment variables to get the latest API key
-    load_dotenv(override=True)
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key or api_key == 'your_openai_api_key_here':
-        raise Exception("Please set your OPENAI_API_KEY in the .env file")
-    # Always create a new client to ensure we use the latest API key from .env
-    return OpenAI(api_key=api_key)
-
-# Load curriculum data
-CURRICULUM_DATA = {}
-try:
-    with open('data/curriculum.json', 'r') as f:
-        CURRICULUM_DATA = json.load(f)
-except FileNotFoundError:
-    print("Warning: curriculum.json not found. Using empty curriculum data.")
-
-def load_curriculum_subskills(grade, curriculum):
-    """Load relevant subskills for the given grade and curriculum"""
-    curriculum_key = curriculum.replace(' ', '_').upper()
-    grade_key = f"Grade_{grade}" if grade != 'K' else "Kindergarten"
-    
-    if curriculum_key in CURRICULUM_DATA:
-        return CURRICULUM_DATA[curriculum_key].get(grade_key, [])
-    return []
-
-def generate_image_for_question(question_text, image_description=None, base_images=None):
+    env_mtime = _env_file_mtime()
+    client = _client_state['client']
+    if client is not None and env_mtime == _client_state['env_mtime']:
+        return client
+    
+    with _client_lock:
+        # Another thread may have refreshed the client while we waited
+        if _client_state['client'] is not None and env_mtime == _client_state['env_mtime']:
+            return _client_state['client']
+        
+        # First call or .env changed: reload environment variables to get the latest API key
+        if env_mtime is not None:
+            load_dotenv(ENV_FILE, override=True)
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key or api_key == 'your_openai_api_key_here':
+            raise Exception("Please set your OPENAI_API_KEY in the .env file")
+        
+        if _client_state['client'] is None or api_key != _client_state['api_key']:
+            if _client_state['client'] is not None:
+                print("DEBUG: OPENAI_API_KEY changed, rebuilding OpenAI client")
+            # Retries are done by rate_limiter so they can back off across workers
+            _client_state['client'] = OpenAI(api_key=api_key, max_retries=0)
+            _client_state['api_key'] = api_key
+        _client_state['env_mtime'] = env_mtime
+        return _client_state['client']
+
+def warm_openai_client():
+    """Create the shared client and open a connection in the background so the first request skips the TLS handshake"""
+    def warm():
+        try:
+            get_openai_client().with_options(timeout=10, max_retries=0).models.list()
+            print("DEBUG: OpenAI connection pre-warmed")
+        except Exception as e:
+            print(f"WARNING: Could not pre-warm OpenAI connection: {str(e)}")
+    
+    threading.Thread(target=warm, name='openai-warmup', daemon=True).start()
+
+@contextmanager
+def timed_stage(stage):
+    """Time a generation stage for both the Prometheus histogram and the current request trace"""
+    with metrics.stage_timer(stage), tracing.span(stage):
+        yield
+
+def generate_image_for_question(question_text, image_description=None, base_images=None, timeout=None):
     """Generate an image for a question using DALL-E"""
     try:
         openai_client = get_openai_client()
@@ -49,14 +123,19 @@ def generate_image_for_question(question_text, image_description=None, base_imag
             # Extract key visual elements from question
             prompt = f"Educational diagram or illustration for this math problem: {question_text[:200]}. Clean, simple, professional style suitable for educational materials, showing relevant numbers, shapes, or objects."
         
-        # Generate image using DALL-E
-        response = openai_client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1
-        )
+        # Generate image using DALL-E (only override the client timeout when one is given)
+        request_options = {"timeout": timeout} if timeout is not None else {}
+        with timed_stage('image_generation'):
+            response = rate_limiter.generate_image(
+                openai_client,
+                max_wait=timeout,
+                model="dall-e-3",
+                prompt=prompt,
+                size="1024x1024",
+                quality="standard",
+                n=1,
+                **request_options
+            )
         
         # Return the image URL
         if response.data and len(response.data) > 0:
@@ -67,75 +146,53 @@ def generate_image_for_question(question_text, image_description=None, base_imag
         print(f"Error generating image: {str(e)}")
         return None
 
-def parse_number_of_options(base_question):
-    """Parse the base question to detect the number of options"""
-    import re
-    
-    found_options = set()
-    
-    # Pattern 1: A), B), C), D) - letter followed by closing paren and space
-    pattern1 = r'\b([A-Z])\)\s'
-    matches1 = re.findall(pattern1, base_question, re.IGNORECASE)
-    for letter in matches1:
-        found_options.add(letter.upper())
-    
-    # Pattern 2: A. B. C. D. - letter followed by period and space
-    pattern2 = r'\b([A-Z])\.\s'
-    matches2 = re.findall(pattern2, base_question, re.IGNORECASE)
-    for letter in matches2:
-        found_options.add(letter.upper())
-    
-    # Pattern 3: (A), (B), (C), (D) - letter in parentheses
-    pattern3 = r'\(([A-Z])\)'
-    matches3 = re.findall(pattern3, base_question, re.IGNORECASE)
-    for letter in matches3:
-        found_options.add(letter.upper())
-    
-    # Pattern 4: Option A, Option B, Option C, Option D
-    pattern4 = r'Option\s+([A-Z])[:\s]'
-    matches4 = re.findall(pattern4, base_question, re.IGNORECASE)
-    for letter in matches4:
-        found_options.add(letter.upper())
-    
-    # Pattern 5: A) Text, B) Text (no space after paren)
-    pattern5 = r'\b([A-Z])\)[^\s]'
-    matches5 = re.findall(pattern5, base_question, re.IGNORECASE)
-    for letter in matches5:
-        found_options.add(letter.upper())
-    
-    # If we found letter options, determine the count
-    if found_options:
-        # Find the maximum letter (A=1, B=2, C=3, D=4, etc.)
-        max_letter = max(found_options)
-        # Convert letter to number (A=1, B=2, C=3, D=4)
-        num_options = ord(max_letter) - ord('A') + 1
-        # Ensure it's reasonable (between 2 and 10)
-        if 2 <= num_options <= 10:
-            return num_options
-    
-    # Check for numbered options as fallback
-    numbered_patterns = [
-        r'\b(\d+)\)\s',  # 1), 2), 3), 4)
-        r'\b(\d+)\.\s',  # 1. 2. 3. 4.
-    ]
-    
-    numbers = []
-    for pattern in numbered_patterns:
-        matches = re.findall(pattern, base_question)
-        for num_str in matches:
-            try:
-                numbers.append(int(num_str))
-            except ValueError:
-                pass
+def generate_images_for_questions(questions, base_images=None, max_workers=None, timeout=None):
+    """Generate images for a list of questions concurrently, updating each question's image field in place.
     
-    if numbers:
-        max_num = max(numbers)
-        # Ensure it's reasonable (between 2 and 10)
-        if 2 <= max_num <= 10:
-            return max_num
+    Each image gets its own timeout, counted from when its request starts rather than while it waits
+    for a worker; questions whose image fails or times out get an empty image. Total time is close to
+    a single DALL-E call per max_workers questions rather than one call per question.
+    """
+    if not questions:
+        return questions
+    max_workers = IMAGE_MAX_WORKERS if max_workers is None else max_workers
+    timeout = IMAGE_TIMEOUT_SECONDS if timeout is None else timeout
     
-    # Default to 4 if no options detected
-    return 4
+    def generate(question):
+        # Use image description if provided, otherwise generate from question
+        image_desc = question.get('image', '')
+        # The request timeout (and the rate limiter wait) enforce this image's timeout from its own start
+        return generate_image_for_question(
+            question_text=question['question'],
+            image_description=image_desc if image_desc and len(image_desc) > 10 else None,
+            base_images=base_images if base_images else None,
+            timeout=timeout
+        )
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(questions))))
+    try:
+        futures = [executor.submit(tracing.bind(generate), question) for question in questions]
+        failed = 0
+        for idx, (question, future) in enumerate(zip(questions, futures)):
+            try:
+                generated_image_url = future.result()
+            except Exception as e:
+                print(f"Warning: Could not generate image for question {idx}: {str(e)}")
+                generated_image_url = None
+            # Clear the description if generation failed so it is not shown as an image URL
+            question['image'] = generated_image_url or ''
+            if not generated_image_url:
+                failed += 1
+        if failed:
+            print(f"WARNING: {failed}/{len(questions)} images could not be generated")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return questions
+
+def parse_number_of_options(base_question):
+    """Parse the base question to detect the number of options (4 if none are listed)"""
+    detected = detect_options(base_question)
+    return detected['count'] if detected else 4
 
 def determine_question_type(base_question, notes):
     """Determine if the question is mathematical or a word problem with real-life context"""
@@ -153,44 +210,200 @@ def determine_question_type(base_question, notes):
     
     return 'word_problem' if has_context else 'mathematical'
 
-def generate_questions_with_gpt(base_question, notes, solution, images, image_files, num_options, num_questions, 
-                                difficulty, grade, curriculum, model='gpt-5', question_type_from_url=None):
-    """Generate copy questions using specified LLM model"""
+def resolve_question_type(base_question, notes, question_type_from_url=None):
+    """Map the URL question type parameter to the internal type, detecting it when not given"""
+    if question_type_from_url == 'word-problems':
+        return 'word_problem'
+    if question_type_from_url == 'mathematical':
+        return 'mathematical'
+    if question_type_from_url == 'image-based':
+        return 'image_based'
+    return determine_question_type(base_question, notes)
+
+def split_question_count(num_questions, chunk_size):
+    """Split a question count into balanced chunk sizes (e.g. 12 by 5 -> [4, 4, 4])"""
+    if not chunk_size or chunk_size <= 0 or num_questions <= chunk_size:
+        return [num_questions]
+    num_chunks = -(-num_questions // chunk_size)  # Ceiling division
+    base_size, remainder = divmod(num_questions, num_chunks)
+    return [base_size + 1 if i < remainder else base_size for i in range(num_chunks)]
+
+def generate_questions_with_gpt(base_question, notes, solution, images, image_files, num_options, num_questions,
+                                difficulty, grade, curriculum, model='gpt-5', question_type_from_url=None,
+                                chunk_size=None, max_workers=None, max_topup_rounds=None, local_arithmetic=None,
+                                lean_output=None, compact_output=None, structured_output=None):
+    """Generate copy questions, fanning large requests out into concurrent chunks"""
+    local_questions = generate_local_arithmetic(base_question, notes, images, image_files, num_options,
+                                                num_questions, question_type_from_url, local_arithmetic)
+    if local_questions is not None:
+        return local_questions
+
+    chunk_size = GENERATION_CHUNK_SIZE if chunk_size is None else chunk_size
+    max_workers = GENERATION_MAX_WORKERS if max_workers is None else max_workers
+    max_topup_rounds = TOPUP_MAX_ROUNDS if max_topup_rounds is None else max_topup_rounds
+    deadline = time.monotonic() + GENERATION_DEADLINE_SECONDS
+    chunk_sizes = split_question_count(num_questions, chunk_size)
+
+    chunk_kwargs = dict(base_question=base_question, notes=notes, solution=solution, images=images,
+                        image_files=image_files, num_options=num_options, difficulty=difficulty,
+                        grade=grade, curriculum=curriculum, model=model,
+                        question_type_from_url=question_type_from_url,
+                        lean_output=distractors.LEAN_OUTPUT_ENABLED if lean_output is None else lean_output,
+                        compact_output=(compact_format.COMPACT_OUTPUT_ENABLED if compact_output is None
+                                        else compact_output),
+                        structured_output=(response_schema.STRUCTURED_OUTPUT_ENABLED if structured_output is None
+                                           else structured_output))
+
+    with tracing.span('chunks', questions=num_questions, chunks=len(chunk_sizes)):
+        if len(chunk_sizes) == 1:
+            questions = generate_question_chunk(num_questions=num_questions, **chunk_kwargs)
+        else:
+            questions = generate_question_chunks(chunk_sizes, max_workers, chunk_kwargs)
+
+    # Drop questions that repeat another one with only a name changed; top-up replaces them
+    duplicates = near_duplicates.DuplicateIndex(base_question)
+    with timed_stage('deduplication'):
+        questions = duplicates.filter(questions)
+    if duplicates.dropped['batch'] or duplicates.dropped['history']:
+        tracing.event('near_duplicates_dropped', **duplicates.dropped)
+
+    # Ask only for the missing questions instead of returning a short list
+    if len(questions) < num_questions:
+        with tracing.span('top_up', missing=num_questions - len(questions)):
+            questions = top_up_questions(questions, num_questions, chunk_kwargs, max_topup_rounds, deadline,
+                                         duplicates)
+    duplicates.remember()
+
+    # Generate images for all validated questions concurrently if the base question had images
+    if images or image_files:
+        with tracing.span('images', count=len(questions)):
+            generate_images_for_questions(questions, base_images=images)
+
+    return questions
+
+def generate_local_arithmetic(base_question, notes, images, image_files, num_options, num_questions,
+                              question_type_from_url=None, local_arithmetic=None):
+    """Copy questions computed by arithmetic_engine, or None when the model should write them
+    
+    Only used for mathematical base questions without notes or images, whose stem is a single
+    numeric expression. Anything the engine cannot handle falls back to the model.
+    """
+    enabled = arithmetic_engine.LOCAL_ARITHMETIC_ENABLED if local_arithmetic is None else local_arithmetic
+    if not enabled or notes or images or image_files:
+        return None
+    if resolve_question_type(base_question, notes, question_type_from_url) != 'mathematical':
+        return None
+    with timed_stage('local_arithmetic'):
+        generated = arithmetic_engine.generate_copies(base_question, num_questions, num_options)
+        if generated is None:
+            return None
+        questions = []
+        for idx, question in enumerate(generated):
+            validated = validate_question(question, idx, num_options)
+            if validated:
+                questions.append(validated)
+    if len(questions) < num_questions:
+        return None
+    tracing.event('local_arithmetic', questions=len(questions))
+    return questions
+
+def top_up_questions(questions, num_questions, chunk_kwargs, max_rounds, deadline, duplicates=None):
+    """Request just the missing questions until num_questions are reached, max_rounds are used or the deadline passes
+    
+    Each round tells the model which stems already exist so it doesn't repeat them. New questions that
+    duplicate one already in `duplicates` (a near_duplicates.DuplicateIndex of questions) are skipped.
+    """
+    questions = list(questions)
+    if duplicates is None:
+        duplicates = near_duplicates.DuplicateIndex()
+        duplicates.filter(questions)
+    rounds = 0
+    while len(questions) < num_questions and rounds < max_rounds and time.monotonic() < deadline:
+        rounds += 1
+        missing = num_questions - len(questions)
+        tracing.event('top_up_round', round=rounds, max_rounds=max_rounds, missing=missing)
+        try:
+            extra_questions = generate_question_chunk(num_questions=missing,
+                                                      existing_stems=[question['question'] for question in questions],
+                                                      **chunk_kwargs)
+        except Exception as e:
+            print(f"WARNING: Top-up round {rounds} failed: {str(e)}")
+            continue
+        for question in extra_questions:
+            if len(questions) < num_questions and duplicates.add(question['question']):
+                questions.append(question)
     
-    # Load relevant subskills (limit to prevent long prompts)
-    # Only load if grade and curriculum are provided
+    if len(questions) < num_questions:
+        print(f"WARNING: Returning {len(questions)} of {num_questions} questions after {rounds} top-up rounds")
+    return questions
+
+def generate_question_chunks(chunk_sizes, max_workers, chunk_kwargs):
+    """Run chunked generation requests concurrently and merge the results"""
+    num_questions = sum(chunk_sizes)
+    tracing.event('split_chunks', questions=num_questions, chunk_sizes=chunk_sizes, max_workers=max_workers)
+
+    # Run chunks on a bounded pool; wall-clock time is set by the slowest chunk
+    results = [None] * len(chunk_sizes)
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(tracing.bind(generate_question_chunk), num_questions=size,
+                            variation_hint=(idx + 1, len(chunk_sizes)), **chunk_kwargs): idx
+            for idx, size in enumerate(chunk_sizes)
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                print(f"WARNING: Chunk {idx + 1}/{len(chunk_sizes)} failed: {str(e)}")
+                errors.append(e)
+
+    # Merge chunk results in submission order so output order is stable
+    merged = [question for chunk in results if chunk for question in chunk]
+    if not merged:
+        raise errors[0] if errors else Exception("No valid questions were generated. Please try again.")
+
+    tracing.event('merged_chunks', questions=len(merged), ok_chunks=len(chunk_sizes) - len(errors),
+                  chunks=len(chunk_sizes))
+    return merged[:num_questions]
+
+def use_lean_output(question_type, lean_output):
+    """Lean output (answers only, options computed locally) applies to question types with numeric answers"""
+    return bool(lean_output) and question_type in LEAN_SYSTEM_PROMPTS
+
+def budget_question_type(question_type, lean, compact=False):
+    """Key for learned token budgets; lean and compact responses are much shorter, so they are tracked apart"""
+    return question_type + ('_lean' if lean else '') + ('_compact' if compact else '')
+
+def use_structured_output(model, structured_output):
+    """Structured output (a strict JSON schema) applies to models that support it; compact output yields to it"""
+    return bool(structured_output) and response_schema.supports(model)
+
+def build_generation_prompts(base_question, notes, solution, images, image_files, num_options, num_questions,
+                             difficulty, grade, curriculum, question_type_from_url=None, variation_hint=None,
+                             existing_stems=None, lean_output=False, compact_output=False, structured_output=False):
+    """Build the system and user prompts for a copy question generation request"""
+    
+    # The first few subskills, precomputed per (curriculum, grade); only if both are provided
     if grade and curriculum:
-        subskills = load_curriculum_subskills(grade, curriculum)
-        # Take only first 3-4 subskills to keep prompt concise
-        subskills_text = ', '.join(subskills[:4]) if subskills else 'General math concepts'
+        subskills_text = curriculum_store.subskills_text(curriculum, grade)
     else:
-        subskills_text = 'General math concepts'
+        subskills_text = curriculum_store.DEFAULT_SUBSKILLS_TEXT
     
     # Determine question type - use from URL if provided, otherwise determine from question
-    if question_type_from_url:
-        # Map URL parameter to internal question type
-        if question_type_from_url == 'word-problems':
-            question_type = 'word_problem'
-        elif question_type_from_url == 'mathematical':
-            question_type = 'mathematical'
-        elif question_type_from_url == 'image-based':
-            question_type = 'image_based'
-        else:
-            question_type = determine_question_type(base_question, notes)
-    else:
-        question_type = determine_question_type(base_question, notes)
+    question_type = resolve_question_type(base_question, notes, question_type_from_url)
+    
+    # The system message is a fixed per-type template so providers can cache it as a prompt prefix;
+    # everything that varies per request goes in the user message below
+    lean = use_lean_output(question_type, lean_output)
+    wire_format = 'structured' if structured_output else 'compact' if compact_output else 'json'
+    system_prompt = SYSTEM_PROMPT_VARIANTS[(wire_format, lean)][question_type]
+
+    # Send the base question's options as a JSON list rather than leaving them in the free text
+    stem, base_options = split_options(base_question)
+    options_text = f"\nBase Options: {json.dumps(base_options, ensure_ascii=False)}" if base_options else ""
     
-    # Build the prompt
-    system_prompt = """You are an expert educational content generator specializing in creating mathematical questions aligned with US curricula standards.
-You generate high-quality, pedagogically sound multiple-choice questions that test specific skills and concepts.
-
-CRITICAL: When generating copy questions, you MUST:
-1. Preserve the EXACT format and structure of the base question
-2. Keep the SAME wording, phrasing, and style as the base question
-3. Maintain the SAME question type and presentation style
-4. Only change the numbers (for mathematical) or context (for word problems)
-5. Match the base question's punctuation, capitalization, and formatting exactly"""
-
     solution_text = f"\nBase Solution: {solution}" if solution else ""
     
     # Prepare image information for prompt
@@ -210,51 +423,12 @@ CRITICAL: When generating copy questions, you MUST:
     else:
         image_instruction = ""
     
-    # Build explicit requirement at the start - optimized for mathematical questions
     if question_type == 'mathematical':
-        # Shorter, more concise prompt for mathematical questions
-        num_questions_requirement = f"""Generate EXACTLY {num_questions} questions. Return JSON array starting with [ and ending with ].
-"""
-        prompt_intro = f"""Generate {num_questions} MCQ questions with {num_options} options each. Base Question: {base_question}
+        # Concise request for mathematical questions
+        per_question = "" if lean else f" with {num_options} options each"
+        user_prompt = f"""REQUEST
+Generate EXACTLY {num_questions} questions{per_question}. Base Question: {stem}{options_text}
 """
-    else:
-        # Full prompt for word problems and image-based
-        num_questions_requirement = f"""
-{'='*80}
-⚠️⚠️⚠️ CRITICAL: YOU MUST GENERATE EXACTLY {num_questions} QUESTIONS ⚠️⚠️⚠️
-{'='*80}
-If this says {num_questions}, you MUST return {num_questions} question objects.
-If {num_questions} = 5, return 5 questions.
-If {num_questions} = 3, return 3 questions.
-DO NOT return only 1 question. DO NOT return fewer than {num_questions}.
-FAILURE TO RETURN {num_questions} QUESTIONS WILL CAUSE AN ERROR.
-
-🔥 YOUR RESPONSE MUST START WITH [ AND END WITH ] 🔥
-🔥 DO NOT START WITH {{ OR RETURN A SINGLE OBJECT 🔥
-🔥 YOU MUST RETURN AN ARRAY: [{{...}}, {{...}}, ...] 🔥
-{'='*80}
-
-"""
-        # For word problems and image-based, include base question in prompt_intro
-        prompt_intro = f"""{num_questions_requirement}You MUST generate EXACTLY {num_questions} distinct MCQ questions with {num_options} options each.
-
-BASE QUESTION (STUDY THIS CAREFULLY):
-{base_question}
-
-"""
-    
-    # Build user prompt based on question type
-    if question_type == 'mathematical':
-        # Concise prompt for mathematical questions - much shorter for faster generation
-        user_prompt = f"""{num_questions_requirement}{prompt_intro}
-Rules:
-- Keep EXACTLY the SAME phrasing and structure, change ONLY the numbers
-- Each question MUST have EXACTLY {num_options} options (same as base question)
-- ONE option per question must be marked "CA" (Correct Answer)
-- Incorrect options logic must be SHORT (3-6 words) based on student errors
-- Examples: "CA", "Added instead of multiplied", "Forgot to carry over"
-"""
-        # Add SME notes, solution, and image info if provided (same for all types)
         if notes:
             user_prompt += f"""SME NOTES: {notes}
 """
@@ -264,423 +438,315 @@ Rules:
         if image_info:
             user_prompt += f"""{image_info}
 """
-        # Add JSON format requirement (concise for mathematical)
-        user_prompt += f"""Return JSON array: [{{"question": "...", "options": [{{"text": "...", "logic": "..."}}, ...], "image": "", "solution": "..."}}, ...]
-Return {num_questions} questions. Each with {num_options} options.
+        if image_instruction:
+            user_prompt += f"""{image_instruction.strip()}
 """
     else:
-        # Full prompt for word problems and image-based
-        user_prompt = f"""{prompt_intro}
-CRITICAL: The BASE QUESTION shown above is the question you must create variations of. DO NOT create questions about different topics or concepts. ALL copy questions must be DIRECT variations of the base question, only changing context (names, items, scenarios) and numbers while preserving the EXACT same mathematical concept, structure, and phrasing.
-
-CRITICAL REQUIREMENT: Generate {num_questions} SEPARATE and DISTINCT questions. Each question must be a DIFFERENT variation of the base question.
-DO NOT generate only one question. You MUST return {num_questions} questions.
-REPEAT: {num_questions} questions required. Not 1. Not {num_questions - 1}. EXACTLY {num_questions}.
-
-CRITICAL: STUDY THE BASE QUESTION SHOWN ABOVE
-The base question is displayed at the beginning of this prompt. You MUST closely follow the base question's:
-- Format and structure (same sentence structure, same question type, same presentation)
-- Wording and phrasing (keep the EXACT same style and language - word-for-word where possible)
-- Question type (if it's fill-in-the-blank, keep it fill-in-the-blank; if it's multiple choice, keep it multiple choice)
-- Number of options: The base question has {num_options} options, so ALL copy questions MUST have EXACTLY {num_options} options (same as base question)
-- Mathematical operation (same operation, just different numbers)
-- Punctuation and capitalization (match exactly)
-- Overall style and presentation (same format, same layout)
-
-CRITICAL: Each copy question MUST be a DIRECT VARIATION of the base question, preserving:
-- The exact wording and phrasing structure
-- The same question format and presentation
-- The same sentence structure and style
-- For word problems: Only change the context (names, locations, items, scenarios) and numbers while keeping the EXACT same sentence structure, word order, and phrasing pattern
-- For mathematical questions: Only the numbers should change
+        context_line = (f"Curriculum: {curriculum} | Grade: {grade} | Difficulty: {difficulty}" if curriculum and grade
+                        else f"Difficulty: {difficulty}" if difficulty else "")
+        options_line = "" if lean else f"\nOPTIONS PER QUESTION: {num_options}"
+        user_prompt = f"""REQUEST
+QUESTIONS TO GENERATE: {num_questions}{options_line}
 
-"""
-        # Add SME notes, solution, and image info for non-mathematical
-        user_prompt += f"""SME NOTES (CRITICAL - MUST FOLLOW IN ADDITION TO ALL PROMPT INSTRUCTIONS):
+BASE QUESTION (STUDY THIS CAREFULLY):
+{stem}{options_text}
+
+SME NOTES (CRITICAL - MUST FOLLOW IN ADDITION TO ALL PROMPT INSTRUCTIONS):
 {notes if notes else 'None - No specific notes provided'}
-YOU MUST FOLLOW THE SME NOTES ABOVE IN ADDITION TO ALL OTHER INSTRUCTIONS
-SME NOTES PROVIDE SPECIFIC GUIDANCE THAT OVERRIDES OR SUPPLEMENTS GENERAL PROMPT INSTRUCTIONS
-READ SME NOTES CAREFULLY AND FOLLOW THEM EXACTLY WHEN GENERATING COPY QUESTIONS
 {solution_text}{image_info}
-{f"Curriculum: {curriculum} | Grade: {grade} | Difficulty: {difficulty}" if curriculum and grade else f"Difficulty: {difficulty}" if difficulty else ""}
-Subskills: {subskills_text[:200]}
-
+{context_line}
+Subskills: {subskills_text}
 """
-        # Add image-based questions specific instructions
-        if question_type == 'image_based':
-            user_prompt += f"""IMAGE-BASED QUESTIONS GENERATION INSTRUCTIONS
-This is an IMAGE-BASED question. Follow these specific instructions:
-
-You are an expert educational content creator specializing in visual question generation. Your task is to create a NEW question with an image, graph, or table that is similar in style, format, and visual presentation to the base question provided.
-
-## INPUT
-
-You will receive:
-
-1. A base question containing an image, graph, or table
-
-2. The subject/topic area
-
-3. Grade level (if applicable)
-
-4. Any specific standards alignment (optional)
-
-## YOUR TASK
-
-Create a completely NEW question that:
-
-### Visual Similarity Requirements
-
-- Uses the SAME type of visual (if base has a bar graph, create a bar graph; if it has a diagram, create a similar diagram)
-
-- Matches the visual style: colors, layout, labeling conventions, scale, and overall aesthetic
-
-- Uses similar complexity level in the visual presentation
-
-- Maintains comparable visual clarity and readability
-
-- Includes similar elements (e.g., if base has gridlines, axis labels, legends - include these)
-
-### Content Requirements
-
-- Tests the SAME or similar mathematical/scientific concept or skill
-
-- Maintains similar difficulty level
-
-- Changes the specific numbers, data, objects, or scenario to create a fresh question
-
-- Uses different context or real-world application when appropriate
-
-- Ensures the question is pedagogically sound and has a clear, unambiguous answer
-
-### Format Requirements
-
-- Match the question structure (multiple choice, open-ended, fill-in-the-blank, etc.)
-
-- Preserve any special formatting from the base question
-
-- Include answer choices if the original has them (with similar format) - CRITICAL: The base question has {num_options} options, so ALL copy questions MUST have EXACTLY {num_options} options (same as base question)
-
-- Provide the correct answer and explanation
-
-## OUTPUT FORMAT
-
-Provide:
-
-1. **New Question Text**: The complete question stem
-
-2. **Image/Graph/Table Description**: Detailed description of the visual to be created, including:
-
-   - Type of visual
-
-   - Specific data/values to display
-
-   - Colors, labels, and styling details
-
-   - Dimensions and scale
-
-3. **Answer Choices** (if applicable) - MUST have EXACTLY {num_options} options
-
-4. **Correct Answer**
-
-5. **Solution Explanation**: Brief explanation of how to solve
-
-## EXAMPLE WORKFLOW
-
-If given a bar graph showing fruit sales with blue bars on a white grid:
-
-- Create a bar graph with a DIFFERENT topic (e.g., temperature over days)
-
-- Use similar blue bars on white grid
-
-- Match the axis labeling style
-
-- Create a new question about the same skill (e.g., reading values from a bar graph)
-
-- Maintain similar difficulty
+        extra_rules = []
+        if solution:
+            extra_rules.append("- IMPORTANT: Generate a solution for each question based on the base solution. Adapt the steps to match each question's numbers/context while keeping the same solution approach.")
+        if image_instruction:
+            extra_rules.append(image_instruction.strip())
+        if extra_rules:
+            user_prompt += "\nAdditional rules for this request:\n" + '\n'.join(extra_rules) + "\n"
+
+    # When a request is fanned out, tell each chunk it is one of several so they vary from each other
+    if variation_hint:
+        chunk_number, chunk_count = variation_hint
+        user_prompt += f"\nThis is batch {chunk_number} of {chunk_count} generated in parallel. Use numbers and contexts that are unlikely to appear in the other batches.\n"
+
+    # Top-up requests list the questions that already exist so the model doesn't repeat them
+    if existing_stems:
+        stem_lines = '\n'.join(f"- {stem[:200]}" for stem in existing_stems)
+        user_prompt += f"\nThese copy questions ALREADY EXIST. Do NOT repeat them or reuse their numbers and contexts:\n{stem_lines}\n"
+
+    if structured_output:
+        answers = "its answer, no options" if lean else f"{num_options} options"
+        user_prompt += f"\nReturn {num_questions} questions, each with {answers}."
+    elif compact_output and lean:
+        user_prompt += f"\nReturn {num_questions} questions as Q:, A: and S: lines. Each with its answer, no options."
+    elif compact_output:
+        user_prompt += f"\nReturn {num_questions} questions as Q:, O: and S: lines. Each with EXACTLY {num_options} O: lines."
+    elif lean:
+        user_prompt += f"\nReturn [{num_questions} questions]. Each with its answer, no options. JSON array format."
+    elif question_type == 'mathematical':
+        user_prompt += f"\nReturn [{num_questions} questions]. Each with {num_options} options. JSON array format."
+    else:
+        user_prompt += f"\n⚠️⚠️⚠️ FINAL REMINDER: Return EXACTLY {num_questions} questions, each with EXACTLY {num_options} options, in an array. Start with [ and end with ]. No other text."
+
+    return system_prompt, user_prompt
+
+def build_api_params(model, system_prompt, user_prompt, num_options, num_questions, question_type=None,
+                     response_format=None):
+    """Build chat completion parameters for the given model and request size"""
+    # Prepare API parameters based on model
+    api_params = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    }
+    
+    # Strict structured output (response_schema.py): the API itself holds the response to the question schema
+    if response_format is not None:
+        api_params["response_format"] = response_format
+    
+    tokens_needed = estimate_max_tokens(model, question_type, num_options, num_questions)
+    
+    if model == "gpt-5":
+        api_params["max_completion_tokens"] = tokens_needed
+        # GPT-5 may need different handling - ensure we have minimum tokens
+        if tokens_needed < 100:
+            api_params["max_completion_tokens"] = 100
+    else:
+        api_params["max_tokens"] = tokens_needed
+        api_params["temperature"] = 0.7
+    
+    return api_params
+
+def estimate_max_tokens(model, question_type, num_options, num_questions):
+    """Size the output token budget from observed usage, falling back to a static formula"""
+    observed = usage_stats.tokens_per_question_estimate(model, question_type, num_options) if question_type else None
+    if observed:
+        # High percentile of recent usage per question, plus headroom for the array wrapper
+        return min(TOKEN_BUDGET_MAX, int(observed * num_questions * TOKEN_BUDGET_MARGIN) + 200)
+    
+    # GPT-5 uses max_completion_tokens, other models use max_tokens and temperature
+    # Increase tokens for multiple questions to ensure complete generation
+    # Each question needs roughly 400-600 tokens (question text, options, solution, image desc)
+    # Be generous to ensure all questions are generated
+    tokens_per_question = max(500, 400 * num_options)  # More options = more tokens, be generous
+    tokens_needed = max(1500, tokens_per_question * num_questions)  # Ensure enough for all questions + buffer
+    tokens_needed = min(8000, tokens_needed)  # Increased cap to ensure all questions fit
+    # If requesting multiple questions, add extra buffer
+    if num_questions > 1:
+        tokens_needed = int(tokens_needed * 1.2)  # Add 20% buffer for multiple questions
+    return tokens_needed
+
+def validate_question(question, idx, num_options):
+    """Validate and fix a single generated question, returning None if it is unusable"""
+    try:
+        # Ensure question has required fields
+        if 'question' not in question or not question['question']:
+            return None  # Skip invalid questions
+
+        # Fix image field
+        if 'image' not in question:
+            question['image'] = ''
+
+        # Lean output gives only the answer; compute the distractors from it
+        if 'options' not in question and question.get('answer') not in (None, ''):
+            question['options'] = distractors.build_options(question['answer'], num_options, question['question'],
+                                                            question.get('solution', ''))
+        question.pop('answer', None)
+
+        # Validate and fix options
+        if 'options' not in question or not isinstance(question['options'], list):
+            return None  # Skip if no options (or a lean answer that is not a number)
+
+        options = question['options']
+
+        # CRITICAL: Ensure we have exactly num_options (same as base question requirement)
+        if len(options) != num_options:
+            print(f"WARNING: Question {idx + 1} has {len(options)} options but should have {num_options}")
+            # Missing options are added below, once the correct answer is known
+            if len(options) > num_options:
+                # Remove extra options (keep first num_options)
+                original_count = len(options)
+                options = options[:num_options]
+                print(f"WARNING: Removed {original_count - num_options} extra options from question {idx + 1}")
+
+        # Validate each option
+        valid_options = []
+        has_correct_answer = False
+
+        for opt_idx, option in enumerate(options):
+            if not isinstance(option, dict):
+                continue
 
-Now, analyze the base question provided and create your similar question following all the requirements above.
+            # Ensure option has text and logic
+            if 'text' not in option or not option['text']:
+                continue
 
-CRITICAL: The base question has {num_options} options, so ALL copy questions MUST have EXACTLY {num_options} options (same as base question).
+            if 'logic' not in option:
+                option['logic'] = "Plausible distractor"
 
-"""
-        # Add word problems specific instructions if needed
-        if question_type == 'word_problem':
-            user_prompt += f"""WORD PROBLEMS GENERATION INSTRUCTIONS
-This is a WORD PROBLEM question. Follow these specific instructions:
-
-Prompt for Generating Similar Word Problems from Base Question
-
-Objective:
-Generate similar word problems based on a provided "Base Question" while maintaining the same mathematical concept, difficulty level, and problem-solving approach.
-
-Instructions:
-Given the Base Word Problem shown above, create multiple similar word problems that:
-
-1. Analyze the Base Question (DISPLAYED ABOVE)
-
-The base question is shown at the beginning of this prompt. First, identify these key elements from THAT base question:
-
-- Mathematical Concept: What operation(s) or concept is being tested?
-- Problem Structure: Single-step or multi-step? What's the solution path?
-- Numerical Complexity: Size of numbers, decimals, fractions, etc.
-- Context/Scenario: What real-world situation is used?
-- Given Information: What data is provided?
-- Unknown/Question: What needs to be found?
-- Units: What measurements are involved?
-
-2. Variation Strategies
-
-Context Substitution:
-- Change the scenario while keeping the mathematical structure identical
-- Replace characters with different names (maintain diversity)
-- Use equivalent contexts: shopping → dining, travel → sports, cooking → crafting
-- Keep the situation relatable and realistic for the target audience
-
-Numerical Variation:
-- Modify numbers while maintaining the same mathematical relationships
-- Keep computational difficulty consistent
-- Scale proportionally (if base uses 12 and 8, copies might use 15 and 10)
-- Maintain number types (whole numbers, decimals, fractions) unless varying difficulty
-
-Object/Entity Replacement:
-- Substitute items with equivalents from the same category
-- Examples: apples → oranges, cars → bikes, dollars → euros
-- Ensure the replacement makes sense in the new context
-- Keep units and measurements appropriate
-
-Time/Location Changes:
-- Modify temporal or spatial elements
-- Different days, times, seasons, locations
-- Maintain logical consistency within the problem
-
-3. Preserve Problem Structure
-
-CRITICAL: Keep these elements consistent:
-
-✓ Same sentence structure and phrasing as the base question
-✓ Same word order and sentence flow
-✓ Same grammatical structure and style
-✓ Same number of steps to solve
-✓ Same mathematical operations required
-✓ Same level of complexity
-✓ Same cognitive demand (Bloom's taxonomy level)
-✓ Same problem type (find total, find difference, find rate, etc.)
-✓ Similar word count and reading level
-✓ CRITICAL: The base question has {num_options} options, so ALL copy questions MUST have EXACTLY {num_options} options (same as base question)
-
-4. Quality Control Checks
-
-Before finalizing each similar problem:
-
-✓ Does it test the exact same mathematical concept?
-✓ Does it match the base question's sentence structure and phrasing?
-✓ Is the word order and grammatical structure the same as the base question?
-✓ Is the difficulty level equivalent?
-✓ Does it require the same solution approach?
-✓ Are all necessary details included?
-✓ Is there no extraneous information (unless in base question)?
-✓ Is the context realistic and engaging?
-✓ Are numbers and units appropriate?
-✓ Is the question clearly stated?
-✓ Does it have EXACTLY {num_options} options (same as base question)?
-
-CRITICAL REMINDERS:
-- The base question has {num_options} options → ALL copy questions MUST have EXACTLY {num_options} options (same as base question)
-- These word problem instructions are in addition to all other instructions. Follow them carefully when generating copy questions.
+            # Check if this is the correct answer
+            logic_upper = str(option['logic']).upper()
+            if logic_upper == 'CA' or 'correct' in logic_upper or 'right' in logic_upper:
+                if not has_correct_answer:
+                    option['logic'] = 'CA'
+                    has_correct_answer = True
+                else:
+                    # Multiple CA found, mark this as distractor
+                    option['logic'] = 'Plausible distractor'
+
+            valid_options.append(option)
+
+        # If no correct answer found, mark first option as CA
+        if not has_correct_answer and len(valid_options) > 0:
+            valid_options[0]['logic'] = 'CA'
+
+        # Ensure we have enough valid options: computed distractors when the answer is a number,
+        # placeholders otherwise
+        if len(valid_options) < num_options:
+            metrics.OPTION_PADDING.inc()
+            valid_options.extend(distractors.fill_options(valid_options, num_options, question['question'],
+                                                          question.get('solution', '')))
+        while len(valid_options) < num_options:
+            valid_options.append({
+                "text": f"Option {chr(65 + len(valid_options))}",
+                "logic": "Plausible distractor"
+            })
+
+        # Trim to exact number needed
+        valid_options = valid_options[:num_options]
+
+        # Update question with validated options
+        question['options'] = valid_options
+
+        # Final validation: ensure question text is not empty
+        question_text = str(question['question']).strip()
+        if len(question_text) < 5:  # Too short to be valid
+            return None
+
+        question['question'] = question_text
+
+        # Ensure solution field exists (even if empty)
+        if 'solution' not in question:
+            question['solution'] = ''
+        else:
+            # Ensure solution is a string
+            question['solution'] = str(question['solution']).strip()
 
-"""
+        # Ensure image field exists and is a valid URL or empty
+        if 'image' not in question:
+            question['image'] = ''
+        else:
+            # Ensure image is a string and trim whitespace
+            image_str = str(question['image']).strip()
+            question['image'] = image_str if image_str else ''
         
-        user_prompt += f"""Rules:
-- {question_type}: CHANGE ONLY the context/real-life scenario, keep the SAME math operation, structure, and question format. Preserve the same wording style and structure.
-- CRITICAL: Each copy question MUST match the base question's sentence structure, phrasing, word order, and grammatical style
-- CRITICAL: Each copy question MUST match the base question's format, structure, and style
-- CRITICAL: Number of options MUST match the base question: Each question MUST have EXACTLY {num_options} options (same as the base question). DO NOT generate more or fewer options.
-- CRITICAL: The base question has {num_options} options, so ALL copy questions MUST also have EXACTLY {num_options} options to match the base question format
-- ONE option per question must be marked "CA" (Correct Answer)
-- ALL copy questions must have the SAME number of options ({num_options} options) as the base question
-- CRITICAL: Incorrect options MUST be based on ACTUAL ERRORS students would make when solving the BASE QUESTION or similar problems
-- For each incorrect option, the logic must describe:
-  1. What mistake a student would make when solving THIS type of question
-  2. Common errors specific to the base question's concept/operation
-  3. Realistic misconceptions students have about this problem type
-- Logic must be SHORT (3-6 words) and SPECIFIC to the question type
-- Examples: "CA", "Added instead of multiplied", "Forgot to carry over", "Wrong order of operations", "Place value mistake", "Used subtraction instead"
-- {"IMPORTANT: Generate a solution for each question based on the base solution. Adapt the steps to match each question's numbers/context while keeping the same solution approach." if solution else ""}{image_instruction}
-
-CRITICAL: COPY QUESTION FORMAT REQUIREMENT
-Each copy question MUST:
-1. Match the base question's sentence structure and phrasing EXACTLY
-2. Use the same word order and grammatical structure as the base question
-3. Match the base question's structure and format EXACTLY
-4. Use the same wording style and phrasing as the base question
-5. Keep the same question type (fill-in-the-blank, multiple choice, etc.)
-6. Have EXACTLY {num_options} options (same as the base question) - this is CRITICAL
-7. Only change the numbers (for mathematical) or context (for word problems)
-8. Preserve the same punctuation, capitalization, and presentation style
-9. Follow the same format as shown in the base question above
-
-Example for Word Problems: If base question is "Sarah bought 3 apples for $2 each. How much did she spend in total?" with {num_options} options
-Then copy questions should be: "Tom bought 5 oranges for $3 each. How much did he spend in total?" with EXACTLY {num_options} options
-Notice: Same sentence structure, same phrasing pattern, same question format, SAME NUMBER OF OPTIONS ({num_options}) - only context (names, items, numbers) changed while preserving the exact structure.
-
-IMPORTANT: Each distractor logic should reflect a REALISTIC mistake a student would make while solving problems similar to the base question. Base the logic on actual student errors, not generic mistakes.
-
-CRITICAL JSON FORMAT REQUIREMENTS
-- Your FIRST character MUST be [ (opening square bracket)
-- Your LAST character MUST be ] (closing square bracket)
-- Return ONLY a valid JSON array starting with [ and ending with ]
-- DO NOT start with {{ (curly brace) - that means a single object, which is WRONG
-- DO NOT return a single object - you MUST return an array
-- NO markdown code blocks (no ```json or ```)
-- NO explanations or text before or after the JSON
-- NO comments or notes
-- NO text before the opening bracket [
-- NO text after the closing bracket ]
-- Start response immediately with [
-- End response with ]
-- Ensure all strings are properly quoted with double quotes
-- Ensure all brackets and braces are properly matched
-- Do NOT include any text outside the JSON array
-
-VERIFY BEFORE RESPONDING: Your response starts with [ and ends with ], not {{ and }}
-
-⚠️⚠️⚠️ CRITICAL: You MUST return EXACTLY {num_questions} question objects in a JSON array. DO NOT return only one question.
-
-Your response must be ONLY a JSON array containing EXACTLY {num_questions} question objects. Each object must have "question", "options", "image", and "solution" fields.
-
-🔥🔥🔥 CRITICAL: YOUR RESPONSE MUST START WITH [ AND END WITH ] 🔥🔥🔥
-
-DO NOT START WITH {{ (curly brace)
-DO NOT RETURN A SINGLE OBJECT LIKE {{"question": ...}}
-YOU MUST RETURN AN ARRAY: [{{...}}, {{...}}, ...]
-
-Your response should look like this (example for 5 questions):
-[{{"question": "...", "options": [...], "image": "", "solution": "..."}}, {{"question": "...", "options": [...], "image": "", "solution": "..."}}, {{"question": "...", "options": [...], "image": "", "solution": "..."}}, {{"question": "...", "options": [...], "image": "", "solution": "..."}}, {{"question": "...", "options": [...], "image": "", "solution": "..."}}]
-
-WRONG FORMAT (DO NOT DO THIS):
-{{"question": "...", "options": [...], "image": "", "solution": "..."}}
-
-CORRECT FORMAT (DO THIS):
-[{{"question": "...", "options": [...], "image": "", "solution": "..."}}, {{"question": "...", "options": [...], "image": "", "solution": "..."}}]
-
-You MUST return an array with {num_questions} objects, starting with [ and ending with ].
-
-⚠️ IMPORTANT: If {num_questions} > 1, you MUST generate {num_questions} DIFFERENT questions, each with different numbers or contexts. DO NOT duplicate the same question.
-
-IMPORTANT: Study the base question format above and replicate it EXACTLY in your copy questions.
-
-Example for Word Problems (if base question was "Sarah bought 3 apples for $2 each. How much did she spend in total?"):
-[{{"question": "Tom bought 5 oranges for $3 each. How much did he spend in total?", "options": [{{"text": "$15", "logic": "CA"}}, {{"text": "$8", "logic": "Added instead of multiplied"}}, {{"text": "$6", "logic": "Multiplied price by quantity incorrectly"}}, {{"text": "$10", "logic": "Wrong calculation"}}], "image": "", "solution": "Step 1: Multiply 5 oranges × $3 each. Step 2: 5 × 3 = 15. Step 3: Tom spent $15 in total."}}, {{"question": "Emma bought 4 bananas for $1.50 each. How much did she spend in total?", "options": [{{"text": "$6", "logic": "CA"}}, {{"text": "$5.50", "logic": "Added instead of multiplied"}}, {{"text": "$4", "logic": "Multiplied price by quantity incorrectly"}}, {{"text": "$3", "logic": "Wrong calculation"}}], "image": "", "solution": "Step 1: Multiply 4 bananas × $1.50 each. Step 2: 4 × 1.50 = 6. Step 3: Emma spent $6 in total."}}]
-
-Notice: Same exact sentence structure "[Name] bought [number] [items] for $[price] each. How much did [he/she] spend in total?" - only the context (names, items, numbers) changed while preserving the exact wording pattern and structure.
-
-CRITICAL REMINDERS:
-1. Base question has {num_options} options → ALL copy questions MUST have EXACTLY {num_options} options
-2. SME NOTES (if provided) contain SPECIFIC instructions that MUST be followed in addition to all other prompt instructions
-3. Follow SME NOTES exactly as they provide targeted guidance for generating the copy questions
-
-⚠️⚠️⚠️ FINAL REMINDER: Return EXACTLY {num_questions} questions in an array. Start with [ and end with ]. No other text.
-"""
+        return question
+        
+    except Exception as e:
+        # Log error but continue with other questions
+        print(f"Error validating question {idx}: {str(e)}")
+        return None
+
+def parse_questions_from_content(content, compact=False, complete=True, structured=False):
+    """Extract the list of question objects from a model response, raising if none can be parsed
+    
+    The response is scanned once; surrounding prose, code fences and trailing commas are tolerated,
+    and every complete question is kept even if the array was cut off mid-object. compact responses
+    are decoded from the line format; complete=False (the token limit was hit) drops their last question.
+    structured responses conform to the JSON schema and are read with a single json.loads.
+    """
+    content = content.strip()
+    
+    # Check if content is empty
+    if not content:
+        raise Exception("GPT returned empty content after stripping whitespace.")
     
-    # Add final checklist only for non-mathematical questions
-    if question_type != 'mathematical':
-        separator = '=' * 80
-        final_checklist = f"""
-🔥 CRITICAL: Check that your response starts with [ (not {{) and ends with ] (not }}) 🔥
-🔥 If you see {{ at the start, you're returning a single object - that's WRONG! 🔥
-🔥 You MUST return an array: [{{...}}, {{...}}, ...] 🔥
-
-{separator}
-FINAL CHECKLIST BEFORE RESPONDING - COUNT YOUR QUESTIONS:
-{separator}
-1. Count how many question objects you are returning: it should be EXACTLY {num_questions}
-2. Verify: Your JSON array should contain {num_questions} objects (count the opening braces)
-3. Each question must be different (different numbers, different context, or different phrasing)
-4. Each question MUST match the base question's format and structure exactly
-5. Each question MUST use the same wording style as the base question
-6. Your JSON array should start with [ and end with ]
-7. NO other text before [ or after ]
-
-CRITICAL VERIFICATION:
-- If {num_questions} = 5, your array should look like: [{{...}}, {{...}}, {{...}}, {{...}}, {{...}}]
-- If {num_questions} = 3, your array should look like: [{{...}}, {{...}}, {{...}}]
-- If you return only 1 object when {num_questions} = {num_questions}, THE REQUEST WILL FAIL
-- Each copy question must match the base question's format: same structure, same wording style, same type
-
-DOUBLE-CHECK: 
-1. Count the question objects in your response. You need {num_questions} objects.
-2. Verify each question matches the base question's format and structure
-3. Ensure each question uses the same wording style as the base question
-4. Verify each question has EXACTLY {num_options} options (same as base question)
-5. Ensure you followed ALL SME NOTES instructions (if provided)
-{separator}"""
-        user_prompt += final_checklist
+    if structured:
+        # Only a response that breaks the schema (e.g. cut off at the token limit) needs the scanner below
+        questions = response_schema.parse_questions(content)
+        if questions:
+            return questions
+    
+    if compact:
+        questions, truncated = compact_format.extract_questions(content, complete)
     else:
-        # Shorter final reminder for mathematical questions
-        user_prompt += f"\nReturn [{num_questions} questions]. Each with {num_options} options. JSON array format."
+        questions, truncated = extract_questions(content)
+    if truncated:
+        metrics.PARSE_FALLBACKS.labels(strategy='truncated_salvage').inc()
+        print(f"WARNING: Response ends inside a question object; salvaged {len(questions)} complete questions")
+    
+    # If no valid JSON, raise descriptive error
+    if not questions:
+        # Log the full response for debugging (first 1000 chars)
+        preview = content[:1000]
+        error_msg = f"Failed to parse JSON array from response.\n"
+        error_msg += f"Response length: {len(content)} characters\n"
+        error_msg += f"Response preview:\n{preview}"
+        if len(content) > 1000:
+            error_msg += "..."
+        raise Exception(error_msg)
+    
+    return questions
+
+def record_trace_usage(usage):
+    """Add a completion's token usage to the current request trace"""
+    if usage is None:
+        return
+    tracing.add(prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                completion_tokens=getattr(usage, 'completion_tokens', None),
+                cached_tokens=usage_stats.cached_tokens(usage))
+
+def generate_question_chunk(base_question, notes, solution, images, image_files, num_options, num_questions,
+                            difficulty, grade, curriculum, model='gpt-5', question_type_from_url=None,
+                            variation_hint=None, existing_stems=None, lean_output=False, compact_output=False,
+                            structured_output=False):
+    """Generate copy questions using specified LLM model in a single completion"""
+    structured = use_structured_output(model, structured_output)
+    compact = compact_output and not structured
+    with timed_stage('prompt_build'):
+        system_prompt, user_prompt = build_generation_prompts(
+            base_question, notes, solution, images, image_files, num_options, num_questions,
+            difficulty, grade, curriculum, question_type_from_url=question_type_from_url,
+            variation_hint=variation_hint, existing_stems=existing_stems, lean_output=lean_output,
+            compact_output=compact, structured_output=structured
+        )
+    question_type = resolve_question_type(base_question, notes, question_type_from_url)
+    lean = use_lean_output(question_type, lean_output)
+    budget_type = budget_question_type(question_type, lean, compact)
 
     try:
         openai_client = get_openai_client()
+        api_params = build_api_params(
+            model, system_prompt, user_prompt, num_options, num_questions, question_type=budget_type,
+            response_format=response_schema.response_format(num_questions, num_options, lean) if structured else None
+        )
         
-        # Prepare API parameters based on model
-        api_params = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        }
-        
-        # Try to force JSON response format (if supported by model)
-        # NOTE: When using response_format json_object, we need to wrap in an object
-        # But we prefer array format, so we'll handle both in parsing
-        use_json_object_format = False
-        try:
-            # Some models support response_format to force JSON
-            # But json_object requires wrapping in an object, which complicates things
-            # For now, let's NOT use response_format and rely on strong prompts
-            # This allows the model to return arrays directly
-            if False and model in ["gpt-4o", "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo"]:
-                # Disabled for now - we want array format, not object format
-                use_json_object_format = True
-                api_params["response_format"] = {"type": "json_object"}
-                # Update prompt to mention JSON object format
-                user_prompt += "\n\nCRITICAL: Since response_format is json_object, you MUST return: {{\"questions\": [{{...}}, {{...}}, ...]}}"
-                user_prompt += f"\nThe 'questions' key must contain an array with EXACTLY {num_questions} question objects."
-        except:
-            pass  # If not supported, continue without it
-        
-        # GPT-5 uses max_completion_tokens, other models use max_tokens and temperature
-        # Increase tokens for multiple questions to ensure complete generation
-        # Each question needs roughly 400-600 tokens (question text, options, solution, image desc)
-        # Be generous to ensure all questions are generated
-        tokens_per_question = max(500, 400 * num_options)  # More options = more tokens, be generous
-        tokens_needed = max(1500, tokens_per_question * num_questions)  # Ensure enough for all questions + buffer
-        tokens_needed = min(8000, tokens_needed)  # Increased cap to ensure all questions fit
-        # If requesting multiple questions, add extra buffer
-        if num_questions > 1:
-            tokens_needed = int(tokens_needed * 1.2)  # Add 20% buffer for multiple questions
-        
-        if model == "gpt-5":
-            api_params["max_completion_tokens"] = tokens_needed
-            # GPT-5 may need different handling - ensure we have minimum tokens
-            if tokens_needed < 100:
-                api_params["max_completion_tokens"] = 100
-        else:
-            api_params["max_tokens"] = tokens_needed
-            api_params["temperature"] = 0.7
-        
-        # Log API call parameters for debugging
-        print(f"DEBUG: Calling {model} with max_completion_tokens={api_params.get('max_completion_tokens')} or max_tokens={api_params.get('max_tokens')}")
-        print(f"DEBUG: Number of questions requested: {num_questions}")
-        print(f"DEBUG: Full user prompt length: {len(user_prompt)} characters")
+        tracing.add(prompt_chars=len(system_prompt) + len(user_prompt))
+        tracing.event('chat_request', model=model, questions=num_questions,
+                      max_tokens=api_params.get('max_completion_tokens') or api_params.get('max_tokens'),
+                      user_prompt_chars=len(user_prompt))
         
         try:
-            response = openai_client.chat.completions.create(**api_params)
+            with timed_stage('chat_completion'):
+                response = rate_limiter.create_chat_completion(openai_client, **api_params)
+        except RateLimitExceeded:
+            raise
         except Exception as api_error:
+            if structured and response_schema.is_schema_rejection(api_error):
+                # Fall back to the JSON prompt for this model from now on
+                response_schema.mark_unsupported(model)
+                tracing.event('structured_output_rejected', model=model, error=str(api_error)[:200])
+                print(f"WARNING: {model} rejected the structured output schema; using the JSON prompt instead")
+                return generate_question_chunk(base_question, notes, solution, images, image_files, num_options,
+                                               num_questions, difficulty, grade, curriculum, model=model,
+                                               question_type_from_url=question_type_from_url,
+                                               variation_hint=variation_hint, existing_stems=existing_stems,
+                                               lean_output=lean_output, compact_output=compact_output)
             error_msg = f"API call failed for {model}: {str(api_error)}"
-            print(f"DEBUG: {error_msg}")
+            tracing.event('chat_error', error=str(api_error)[:500])
             # If model doesn't exist, suggest alternatives
             if "model" in str(api_error).lower() and "not found" in str(api_error).lower():
                 error_msg += f"\n\nNote: '{model}' model may not be available. Try using 'gpt-4o' or 'gpt-4-turbo' instead."
@@ -688,20 +754,20 @@ DOUBLE-CHECK:
         
         # Check if response has content
         if not response.choices or len(response.choices) == 0:
-            error_details = f"Response object: {response}"
-            print(f"DEBUG: Empty choices. {error_details}")
+            tracing.event('empty_choices')
             raise Exception(f"GPT returned empty response. No choices available. Response: {str(response)[:200]}")
         
         # Check response structure - some models might have different response formats
         choice = response.choices[0]
         
-        # Log response structure for debugging
-        print(f"DEBUG: Response structure - has content: {hasattr(choice.message, 'content')}")
-        print(f"DEBUG: Choice finish_reason: {getattr(choice, 'finish_reason', 'N/A')}")
+        usage = getattr(response, 'usage', None)
+        metrics.record_usage(model, usage)
+        record_trace_usage(usage)
+        tracing.event('chat_response', finish_reason=getattr(choice, 'finish_reason', None),
+                      has_content=hasattr(choice.message, 'content'))
         
         if not hasattr(choice.message, 'content'):
-            error_details = f"Message object: {choice.message}, Type: {type(choice.message)}"
-            print(f"DEBUG: Message has no content attribute. {error_details}")
+            tracing.event('message_without_content', message_type=type(choice.message).__name__)
             raise Exception(f"GPT response structure unexpected. Message object doesn't have 'content' attribute. Finish reason: {getattr(choice, 'finish_reason', 'N/A')}")
         
         content = choice.message.content
@@ -717,310 +783,271 @@ DOUBLE-CHECK:
                 error_msg += " The content was filtered. Try adjusting the prompt."
             elif finish_reason == "stop":
                 error_msg += " The model stopped generating. This may indicate a model issue or invalid prompt."
-            print(f"DEBUG: {error_msg}")
-            print(f"DEBUG: Full response object: {response}")
+            tracing.event('empty_content', finish_reason=finish_reason)
             raise Exception(error_msg)
         
-        content = content.strip()
-        original_content = content  # Save for debugging
-        
-        # Check if content is empty
-        if not content:
-            raise Exception("GPT returned empty content after stripping whitespace.")
-        
-        # Extract JSON from response (handle markdown code blocks or extra text)
-        import re
-        
-        # Remove markdown code blocks if present
-        content = re.sub(r'```json\s*', '', content)
-        content = re.sub(r'```\s*', '', content)
-        content = content.strip()
-        
-        # Check if content still exists after cleaning
-        if not content:
-            raise Exception("Content became empty after removing markdown code blocks. Original response may be empty or invalid.")
-        
-        # Try multiple strategies to extract JSON
-        questions = None
-        last_error = None
-        
-        # Strategy 1: Try parsing directly
-        try:
-            parsed = json.loads(content)
-            # Check if it's wrapped in an object with 'questions' key
-            if isinstance(parsed, dict) and 'questions' in parsed:
-                questions = parsed['questions']
-            elif isinstance(parsed, list):
-                questions = parsed
-            elif isinstance(parsed, dict) and 'question' in parsed:
-                # Single question object - wrap it in an array
-                questions = [parsed]
-            else:
-                raise ValueError("Parsed JSON is neither a list nor an object with 'questions' key")
-        except (json.JSONDecodeError, ValueError) as e:
-            last_error = e
-        
-        # Strategy 2: Extract JSON array using regex
-        if questions is None:
-            json_match = re.search(r'\[[\s\S]*\]', content, re.MULTILINE | re.DOTALL)
-            if json_match:
-                try:
-                    parsed = json.loads(json_match.group(0).strip())
-                    if isinstance(parsed, list):
-                        questions = parsed
-                    else:
-                        raise ValueError("Extracted JSON is not a list")
-                except (json.JSONDecodeError, ValueError) as e:
-                    last_error = e
-        
-        # Strategy 2b: Try extracting single object and wrap in array
-        if questions is None:
-            # Look for a JSON object with 'question' key
-            json_obj_match = re.search(r'\{[\s\S]*"question"[\s\S]*?\}', content, re.MULTILINE | re.DOTALL)
-            if json_obj_match:
-                try:
-                    parsed = json.loads(json_obj_match.group(0).strip())
-                    if isinstance(parsed, dict) and 'question' in parsed:
-                        # Single question object - wrap it in an array
-                        questions = [parsed]
-                except (json.JSONDecodeError, ValueError) as e:
-                    if last_error is None:
-                        last_error = e
-        
-        # Strategy 3: Try finding content between first [ and last ] or { and }
-        if questions is None:
-            first_bracket = content.find('[')
-            last_bracket = content.rfind(']')
-            if first_bracket != -1 and last_bracket != -1 and last_bracket > first_bracket:
-                json_content = content[first_bracket:last_bracket + 1]
-                try:
-                    parsed = json.loads(json_content.strip())
-                    if isinstance(parsed, list):
-                        questions = parsed
-                    elif isinstance(parsed, dict) and 'questions' in parsed:
-                        questions = parsed['questions']
-                    else:
-                        raise ValueError("Extracted JSON is not a list or object with 'questions'")
-                except (json.JSONDecodeError, ValueError) as e:
-                    last_error = e
-            else:
-                # Try to find JSON object
-                first_brace = content.find('{')
-                last_brace = content.rfind('}')
-                if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                    json_content = content[first_brace:last_brace + 1]
-                    try:
-                        parsed = json.loads(json_content.strip())
-                        if isinstance(parsed, dict) and 'question' in parsed:
-                            # Single question object - wrap it in an array
-                            questions = [parsed]
-                        elif isinstance(parsed, dict) and 'questions' in parsed:
-                            questions = parsed['questions']
-                    except (json.JSONDecodeError, ValueError) as e:
-                        if last_error is None:
-                            last_error = e
-        
-        # Strategy 4: Try to fix common JSON issues
-        if questions is None:
-            # Remove trailing commas before closing brackets/braces
-            fixed_content = re.sub(r',(\s*[}\]])', r'\1', content)
-            # Try to extract array again
-            json_match = re.search(r'\[[\s\S]*\]', fixed_content, re.MULTILINE | re.DOTALL)
-            if json_match:
-                try:
-                    parsed = json.loads(json_match.group(0).strip())
-                    if isinstance(parsed, list):
-                        questions = parsed
-                    elif isinstance(parsed, dict) and 'questions' in parsed:
-                        questions = parsed['questions']
-                    else:
-                        raise ValueError("Fixed JSON is not a list or object with 'questions'")
-                except (json.JSONDecodeError, ValueError) as e:
-                    last_error = e
-            else:
-                # Try to extract and fix single object
-                json_obj_match = re.search(r'\{[\s\S]*"question"[\s\S]*?\}', fixed_content, re.MULTILINE | re.DOTALL)
-                if json_obj_match:
-                    try:
-                        parsed = json.loads(json_obj_match.group(0).strip())
-                        if isinstance(parsed, dict) and 'question' in parsed:
-                            # Single question object - wrap it in an array
-                            questions = [parsed]
-                    except (json.JSONDecodeError, ValueError) as e:
-                        if last_error is None:
-                            last_error = e
-        
-        # If still no valid JSON, raise descriptive error
-        if questions is None:
-            # Log the full response for debugging (first 1000 chars)
-            preview = original_content[:1000] if len(original_content) > 1000 else original_content
-            error_msg = f"Failed to parse JSON array from response.\n"
-            error_msg += f"Last error: {str(last_error)}\n"
-            error_msg += f"Response length: {len(original_content)} characters\n"
-            error_msg += f"Response preview:\n{preview}"
-            if len(original_content) > 1000:
-                error_msg += "..."
-            raise Exception(error_msg)
+        original_content = content.strip()  # Save for debugging
+        truncated = getattr(choice, 'finish_reason', None) == "length"
+        with timed_stage('json_extraction'):
+            questions = parse_questions_from_content(content, compact=compact, complete=not truncated,
+                                                     structured=structured)
+        if truncated:
+            metrics.TRUNCATIONS.labels(model=model).inc()
+            print(f"WARNING: Response hit the token limit; keeping the {len(questions)} complete questions")
         
         # Validate and fix questions
         validated_questions = []
-        for idx, question in enumerate(questions):
-            try:
-                # Ensure question has required fields
-                if 'question' not in question or not question['question']:
-                    continue  # Skip invalid questions
-                
-                # Fix image field
-                if 'image' not in question:
-                    question['image'] = ''
-                
-                # Validate and fix options
-                if 'options' not in question or not isinstance(question['options'], list):
-                    continue  # Skip if no options
-                
-                options = question['options']
-                
-                # CRITICAL: Ensure we have exactly num_options (same as base question requirement)
-                if len(options) != num_options:
-                    print(f"WARNING: Question {idx + 1} has {len(options)} options but should have {num_options}")
-                    if len(options) < num_options:
-                        # Add missing options
-                        for i in range(len(options), num_options):
-                            options.append({
-                                "text": f"Option {chr(65 + i)}",
-                                "logic": "Plausible distractor"
-                            })
-                    elif len(options) > num_options:
-                        # Remove extra options (keep first num_options)
-                        original_count = len(options)
-                        options = options[:num_options]
-                        print(f"WARNING: Removed {original_count - num_options} extra options from question {idx + 1}")
-                
-                # Validate each option
-                valid_options = []
-                has_correct_answer = False
-                
-                for opt_idx, option in enumerate(options):
-                    if not isinstance(option, dict):
-                        continue
-                    
-                    # Ensure option has text and logic
-                    if 'text' not in option or not option['text']:
-                        continue
-                    
-                    if 'logic' not in option:
-                        option['logic'] = "Plausible distractor"
-                    
-                    # Check if this is the correct answer
-                    logic_upper = str(option['logic']).upper()
-                    if logic_upper == 'CA' or 'correct' in logic_upper or 'right' in logic_upper:
-                        if not has_correct_answer:
-                            option['logic'] = 'CA'
-                            has_correct_answer = True
-                        else:
-                            # Multiple CA found, mark this as distractor
-                            option['logic'] = 'Plausible distractor'
-                    
-                    valid_options.append(option)
-                
-                # If no correct answer found, mark first option as CA
-                if not has_correct_answer and len(valid_options) > 0:
-                    valid_options[0]['logic'] = 'CA'
-                
-                # Ensure we have enough valid options
-                while len(valid_options) < num_options:
-                    valid_options.append({
-                        "text": f"Option {chr(65 + len(valid_options))}",
-                        "logic": "Plausible distractor"
-                    })
-                
-                # Trim to exact number needed
-                valid_options = valid_options[:num_options]
-                
-                # Update question with validated options
-                question['options'] = valid_options
-                
-                # Final validation: ensure question text is not empty
-                question_text = str(question['question']).strip()
-                if len(question_text) < 5:  # Too short to be valid
-                    continue
-                
-                question['question'] = question_text
-                
-                # Ensure solution field exists (even if empty)
-                if 'solution' not in question:
-                    question['solution'] = ''
-                else:
-                    # Ensure solution is a string
-                    question['solution'] = str(question['solution']).strip()
-                
-                # Ensure image field exists and is a valid URL or empty
-                if 'image' not in question:
-                    question['image'] = ''
-                else:
-                    # Ensure image is a string and trim whitespace
-                    image_str = str(question['image']).strip()
-                    question['image'] = image_str if image_str else ''
-                
-                # Generate image if base question had images
-                if should_generate_images:
-                    try:
-                        # Use image description if provided, otherwise generate from question
-                        image_desc = question.get('image', '')
-                        generated_image_url = generate_image_for_question(
-                            question_text=question['question'],
-                            image_description=image_desc if image_desc and len(image_desc) > 10 else None,
-                            base_images=images if images else None
-                        )
-                        if generated_image_url:
-                            question['image'] = generated_image_url
-                        else:
-                            question['image'] = ''  # Clear if generation failed
-                    except Exception as e:
-                        print(f"Warning: Could not generate image for question {idx}: {str(e)}")
-                        question['image'] = ''  # Clear on error
-                
-                validated_questions.append(question)
-                
-            except Exception as e:
-                # Log error but continue with other questions
-                print(f"Error validating question {idx}: {str(e)}")
-                continue
+        with timed_stage('validation'):
+            for idx, question in enumerate(questions):
+                validated = validate_question(question, idx, num_options)
+                if validated is not None:
+                    validated_questions.append(validated)
+        
+        # Compute the answers of computational questions instead of trusting the model's CA label
+        if answer_key.ANSWER_KEY_VERIFY:
+            with timed_stage('answer_check'):
+                answer_report = answer_key.verify_batch(validated_questions)
+            tracing.event('answer_check', **answer_report)
         
         # Ensure we have at least some questions
         if len(validated_questions) == 0:
             raise Exception("No valid questions were generated. Please try again or check the base question format.")
         
-        # Log how many questions were parsed vs requested
-        print(f"DEBUG: Parsed {len(questions)} questions from JSON, validated {len(validated_questions)} questions, requested {num_questions}")
+        usage_stats.record_usage(model, budget_type, num_options, len(validated_questions), usage, truncated)
+        
+        tracing.event('parsed_questions', parsed=len(questions), validated=len(validated_questions),
+                      requested=num_questions)
         
         # If we got fewer questions than requested, warn and try to retry or use what we have
         if len(validated_questions) < num_questions:
             print(f"WARNING: Generated only {len(validated_questions)} questions instead of {num_questions}")
-            print(f"DEBUG: Original response had {len(questions) if isinstance(questions, list) else 1} questions before validation")
-            print(f"DEBUG: First 500 chars of response: {original_content[:500]}")
-            
-            # If we got way fewer (like only 1 when requesting 5), try to retry or provide better error
-            if len(validated_questions) == 1 and num_questions > 1:
-                error_details = f"\nParsed {len(questions) if isinstance(questions, list) else 1} questions from JSON"
-                error_details += f"\nValidated {len(validated_questions)} questions"
-                error_details += f"\nRequested {num_questions} questions"
-                error_details += f"\nResponse preview (first 1000 chars):\n{original_content[:1000]}"
-                raise Exception(f"Only 1 question was generated instead of {num_questions}.{error_details}")
+            tracing.event('short_response', preview=original_content[:500])
         
-        # ALWAYS return exactly num_questions, even if we need to pad
+        # ALWAYS return at most num_questions
         # If we have more than requested, trim to requested
-        # If we have fewer, we already raised an error above
+        # If we have fewer, generate_questions_with_gpt tops up the missing ones
         if len(validated_questions) > num_questions:
-            print(f"DEBUG: Trimmed from {len(validated_questions)} to {num_questions} questions")
+            tracing.event('trimmed_questions', returned=len(validated_questions), requested=num_questions)
         
         return validated_questions[:num_questions]  # Return exactly the requested number
         
     except json.JSONDecodeError as e:
         raise Exception(f"Failed to parse GPT response as JSON: {str(e)}")
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error calling {model}: {str(e)}")
 
+def stream_question_chunk(base_question, notes, solution, images, image_files, num_options, num_questions,
+                          difficulty, grade, curriculum, model='gpt-5', question_type_from_url=None,
+                          variation_hint=None, existing_stems=None, lean_output=False, compact_output=False,
+                          structured_output=False):
+    """Generate copy questions with a streaming completion, yielding each validated question as it completes"""
+    structured = use_structured_output(model, structured_output)
+    compact = compact_output and not structured
+    with timed_stage('prompt_build'):
+        system_prompt, user_prompt = build_generation_prompts(
+            base_question, notes, solution, images, image_files, num_options, num_questions,
+            difficulty, grade, curriculum, question_type_from_url=question_type_from_url,
+            variation_hint=variation_hint, existing_stems=existing_stems, lean_output=lean_output,
+            compact_output=compact, structured_output=structured
+        )
+    
+    question_type = resolve_question_type(base_question, notes, question_type_from_url)
+    lean = use_lean_output(question_type, lean_output)
+    budget_type = budget_question_type(question_type, lean, compact)
+    
+    openai_client = get_openai_client()
+    api_params = build_api_params(
+        model, system_prompt, user_prompt, num_options, num_questions, question_type=budget_type,
+        response_format=response_schema.response_format(num_questions, num_options, lean) if structured else None
+    )
+    tracing.add(prompt_chars=len(system_prompt) + len(user_prompt))
+    api_params["stream"] = True
+    # Ask for a final usage chunk so streamed completions feed the token budget too
+    api_params["extra_body"] = {"stream_options": {"include_usage": True}}
+    
+    started = time.perf_counter()
+    try:
+        stream = rate_limiter.create_chat_completion(openai_client, **api_params)
+    except RateLimitExceeded:
+        raise
+    except Exception as api_error:
+        if structured and response_schema.is_schema_rejection(api_error):
+            response_schema.mark_unsupported(model)
+            tracing.event('structured_output_rejected', model=model, error=str(api_error)[:200])
+            print(f"WARNING: {model} rejected the structured output schema; using the JSON prompt instead")
+            yield from stream_question_chunk(base_question, notes, solution, images, image_files, num_options,
+                                             num_questions, difficulty, grade, curriculum, model=model,
+                                             question_type_from_url=question_type_from_url,
+                                             variation_hint=variation_hint, existing_stems=existing_stems,
+                                             lean_output=lean_output, compact_output=compact_output)
+            return
+        error_msg = f"API call failed for {model}: {str(api_error)}"
+        if "model" in str(api_error).lower() and "not found" in str(api_error).lower():
+            error_msg += f"\n\nNote: '{model}' model may not be available. Try using 'gpt-4o' or 'gpt-4-turbo' instead."
+        raise Exception(error_msg)
+    
+    # Streamed structured output is plain JSON, so the incremental JSON parser handles it as it arrives
+    parser = compact_format.CompactQuestionParser() if compact else IncrementalQuestionParser()
+    finish_reason = None
+    usage = None
+    yielded = 0
+    answer_results = []
+    
+    def completed_questions():
+        """Questions as the stream completes them, then any that only the end of the response completes"""
+        nonlocal finish_reason, usage
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            yield from parser.feed(getattr(choice.delta, 'content', None))
+        yield from parser.finish(complete=finish_reason != "length")
+    
+    for question in completed_questions():
+        validated = validate_question(question, parser.emitted - 1, num_options)
+        if validated is not None and yielded < num_questions:
+            if answer_key.ANSWER_KEY_VERIFY:
+                answer_results.append(answer_key.verify_question(validated))
+            yielded += 1
+            yield validated
+    
+    # For streams the chat_completion stage covers the whole response, including incremental parsing
+    metrics.STAGE_SECONDS.labels(stage='chat_completion').observe(time.perf_counter() - started)
+    tracing.record_span('chat_completion', started, questions=yielded, streamed=True)
+    metrics.record_usage(model, usage)
+    record_trace_usage(usage)
+    if answer_results:
+        tracing.event('answer_check', **answer_key.summarize(answer_results))
+    if finish_reason == "length":
+        metrics.TRUNCATIONS.labels(model=model).inc()
+        print(f"WARNING: Streamed response was truncated after {yielded} questions")
+    usage_stats.record_usage(model, budget_type, num_options, yielded, usage, finish_reason == "length")
+    if yielded == 0:
+        raise Exception(f"No valid questions were generated. Finish reason: {finish_reason or 'N/A'}")
+
+def stream_questions_with_gpt(base_question, notes, solution, images, image_files, num_options, num_questions,
+                              difficulty, grade, curriculum, model='gpt-5', question_type_from_url=None,
+                              chunk_size=None, max_workers=None, max_topup_rounds=None, local_arithmetic=None,
+                              lean_output=None, compact_output=None, structured_output=None):
+    """Generate copy questions, yielding each one as soon as it (and its image, if any) is ready
+    
+    Chunks are streamed concurrently and their questions are interleaved in completion order.
+    Near duplicates are dropped as they arrive, and the top-up round replaces them.
+    """
+    local_questions = generate_local_arithmetic(base_question, notes, images, image_files, num_options,
+                                                num_questions, question_type_from_url, local_arithmetic)
+    if local_questions is not None:
+        yield from local_questions
+        return
+
+    chunk_size = GENERATION_CHUNK_SIZE if chunk_size is None else chunk_size
+    max_workers = GENERATION_MAX_WORKERS if max_workers is None else max_workers
+    max_topup_rounds = TOPUP_MAX_ROUNDS if max_topup_rounds is None else max_topup_rounds
+    deadline = time.monotonic() + GENERATION_DEADLINE_SECONDS
+    chunk_sizes = split_question_count(num_questions, chunk_size)
+    chunk_kwargs = dict(base_question=base_question, notes=notes, solution=solution, images=images,
+                        image_files=image_files, num_options=num_options, difficulty=difficulty,
+                        grade=grade, curriculum=curriculum, model=model,
+                        question_type_from_url=question_type_from_url,
+                        lean_output=distractors.LEAN_OUTPUT_ENABLED if lean_output is None else lean_output,
+                        compact_output=(compact_format.COMPACT_OUTPUT_ENABLED if compact_output is None
+                                        else compact_output),
+                        structured_output=(response_schema.STRUCTURED_OUTPUT_ENABLED if structured_output is None
+                                           else structured_output))
+    should_generate_images = bool(images or image_files)
+    
+    # Chunk threads and image callbacks all report into one queue as (kind, payload)
+    events = queue.Queue()
+    
+    def run_chunk(size, variation_hint, existing_stems=None):
+        try:
+            for question in stream_question_chunk(num_questions=size, variation_hint=variation_hint,
+                                                  existing_stems=existing_stems, **chunk_kwargs):
+                events.put(('question', question))
+        except Exception as e:
+            events.put(('error', e))
+        finally:
+            events.put(('chunk_done', None))
+    
+    def run_image(question):
+        image_desc = question.get('image', '')
+        try:
+            generated_image_url = generate_image_for_question(
+                question_text=question['question'],
+                image_description=image_desc if image_desc and len(image_desc) > 10 else None,
+                base_images=images if images else None,
+                timeout=IMAGE_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            print(f"Warning: Could not generate image for question: {str(e)}")
+            generated_image_url = None
+        question['image'] = generated_image_url or ''
+        events.put(('image_done', question))
+    
+    chunk_executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunk_sizes))))
+    image_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_MAX_WORKERS)) if should_generate_images else None
+    try:
+        for idx, size in enumerate(chunk_sizes):
+            variation_hint = (idx + 1, len(chunk_sizes)) if len(chunk_sizes) > 1 else None
+            chunk_executor.submit(tracing.bind(run_chunk), size, variation_hint)
+        
+        running_chunks = len(chunk_sizes)
+        pending_images = 0
+        accepted = 0
+        accepted_stems = []
+        duplicates = near_duplicates.DuplicateIndex(base_question)
+        topup_rounds = 0
+        errors = []
+        while running_chunks or pending_images:
+            kind, payload = events.get()
+            if kind == 'chunk_done':
+                running_chunks -= 1
+                # Once every chunk has finished, ask only for whatever is still missing
+                if (running_chunks == 0 and 0 < accepted < num_questions
+                        and topup_rounds < max_topup_rounds and time.monotonic() < deadline):
+                    topup_rounds += 1
+                    missing = num_questions - accepted
+                    tracing.event('top_up_round', round=topup_rounds, max_rounds=max_topup_rounds, missing=missing)
+                    running_chunks += 1
+                    chunk_executor.submit(tracing.bind(run_chunk), missing, None, list(accepted_stems))
+            elif kind == 'error':
+                print(f"WARNING: Streaming chunk failed: {str(payload)}")
+                errors.append(payload)
+            elif kind == 'question':
+                if accepted >= num_questions:
+                    continue
+                with timed_stage('deduplication'):
+                    is_new = duplicates.add(payload['question'])
+                if not is_new:
+                    continue
+                accepted_stems.append(payload['question'])
+                accepted += 1
+                if image_executor:
+                    pending_images += 1
+                    image_executor.submit(tracing.bind(run_image), payload)
+                else:
+                    yield payload
+            elif kind == 'image_done':
+                pending_images -= 1
+                yield payload
+        
+        if duplicates.dropped['batch'] or duplicates.dropped['history']:
+            tracing.event('near_duplicates_dropped', **duplicates.dropped)
+        duplicates.remember()
+        if accepted == 0:
+            raise errors[0] if errors else Exception("No valid questions were generated. Please try again.")
+    finally:
+        # Stop queued work if the client went away; in-flight upstream calls finish on their own
+        chunk_executor.shutdown(wait=False, cancel_futures=True)
+        if image_executor:
+            image_executor.shutdown(wait=False, cancel_futures=True)
+
 @app.route('/')
 def index():
     return send_from_directory('.', 'home.html')
@@ -1029,52 +1056,429 @@ def index():
 def generate():
     return send_from_directory('.', 'index.html')
 
+def parse_flag(value, default=False):
+    """A boolean request field, which CSV cells and query strings send as text ("false", "0", "no" are off)"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(value)
+
+def parse_count(value, default, minimum, maximum):
+    """A whole-number request field clamped to minimum..maximum; raises ValueError for text that is not a number"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f'Expected a whole number, got {value!r}')
+    try:
+        number = int(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Expected a whole number, got {value!r}')
+    return max(minimum, min(number, maximum))
+
+def build_generation_kwargs(data):
+    """Turn an /api/generate request body into keyword arguments for generate_questions_with_gpt"""
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    
+    # Validate required fields
+    required_fields = ['baseQuestion', 'numCopyQuestions', 'model']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            raise ValueError(f'Missing required field: {field}')
+    
+    # Use defaults for optional fields
+    # Parse number of options from base question if not provided
+    base_question = data.get('baseQuestion', '')
+    if 'numOptions' in data and data['numOptions']:
+        num_options = int(data['numOptions'])
+    else:
+        # Try to parse from base question
+        num_options = parse_number_of_options(base_question)
+        tracing.event('parsed_num_options', num_options=num_options)
+    
+    difficulty = data.get('difficulty', 'Medium')  # Default to Medium
+    grade = data.get('grade', '')  # Default to empty
+    curriculum = data.get('curriculum', '')  # Default to empty
+    
+    # Optional per-request fan-out overrides
+    chunk_size = int(data['chunkSize']) if data.get('chunkSize') is not None else None
+    max_workers = int(data['concurrency']) if data.get('concurrency') else None
+    max_topup_rounds = int(data['topUpRounds']) if data.get('topUpRounds') is not None else None
+    # Opt in or out of the local engine for pure arithmetic questions
+    local_arithmetic = parse_flag(data.get('localArithmetic'), arithmetic_engine.LOCAL_ARITHMETIC_ENABLED)
+    # Answers only from the model, options computed locally
+    lean_output = parse_flag(data.get('leanOutput'), distractors.LEAN_OUTPUT_ENABLED)
+    # Tagged lines instead of JSON from the model
+    compact_output = parse_flag(data.get('compactOutput'), compact_format.COMPACT_OUTPUT_ENABLED)
+    # A strict JSON schema for models that support structured outputs
+    structured_output = parse_flag(data.get('structuredOutput'), response_schema.STRUCTURED_OUTPUT_ENABLED)
+    
+    return dict(
+        base_question=data['baseQuestion'],
+        notes=data.get('notes', ''),
+        solution=data.get('solution', ''),
+        images=data.get('images', ''),
+        image_files=data.get('imageFiles', []),
+        num_options=num_options,
+        num_questions=int(data['numCopyQuestions']),
+        difficulty=difficulty,
+        grade=grade,
+        curriculum=curriculum,
+        model=data['model'],
+        question_type_from_url=data.get('questionType', None),
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        max_topup_rounds=max_topup_rounds,
+        local_arithmetic=local_arithmetic,
+        lean_output=lean_output,
+        compact_output=compact_output,
+        structured_output=structured_output
+    )
+
+def get_cache_flags(data):
+    """Return (read, write) cache flags for a request.
+    
+    noCache skips the cache entirely; refreshCache regenerates and overwrites the cached entry.
+    """
+    if parse_flag(data.get('noCache')):
+        return False, False
+    if parse_flag(data.get('refreshCache')):
+        return False, True
+    return True, True
+
+def generate_questions_with_cache(generation_kwargs, read_cache=True, write_cache=True):
+    """Return (questions, cached), serving repeats from the response cache"""
+    cache_key = response_cache.make_key(generation_kwargs)
+    if read_cache:
+        cached_questions = response_cache.get(cache_key)
+        if cached_questions is not None:
+            tracing.event('response_cache_hit', key=cache_key[:12])
+            return cached_questions, True
+    
+    # Generate questions
+    questions = generate_questions_with_gpt(**generation_kwargs)
+    
+    # Only cache complete results so a short answer isn't replayed
+    if write_cache and len(questions) >= generation_kwargs['num_questions']:
+        response_cache.put(cache_key, questions)
+    
+    return questions, False
+
 @app.route('/api/generate', methods=['POST'])
 def generate_questions():
     try:
         data = request.json
+        generation_kwargs = build_generation_kwargs(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        read_cache, write_cache = get_cache_flags(data)
+        questions, cached = generate_questions_with_cache(generation_kwargs, read_cache, write_cache)
         
-        # Validate required fields
-        required_fields = ['baseQuestion', 'numCopyQuestions', 'model']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Use defaults for optional fields
-        # Parse number of options from base question if not provided
-        base_question = data.get('baseQuestion', '')
-        if 'numOptions' in data and data['numOptions']:
-            num_options = int(data['numOptions'])
-        else:
-            # Try to parse from base question
-            num_options = parse_number_of_options(base_question)
-            print(f"DEBUG: Parsed {num_options} options from base question")
-        
-        difficulty = data.get('difficulty', 'Medium')  # Default to Medium
-        grade = data.get('grade', '')  # Default to empty
-        curriculum = data.get('curriculum', '')  # Default to empty
-        
-        # Generate questions
-        questions = generate_questions_with_gpt(
-            base_question=data['baseQuestion'],
-            notes=data.get('notes', ''),
-            solution=data.get('solution', ''),
-            images=data.get('images', ''),
-            image_files=data.get('imageFiles', []),
-            num_options=num_options,
-            num_questions=int(data['numCopyQuestions']),
-            difficulty=difficulty,
-            grade=grade,
-            curriculum=curriculum,
-            model=data['model'],
-            question_type_from_url=data.get('questionType', None)
-        )
-        
-        return jsonify({'questions': questions})
+        return jsonify({'questions': questions, 'cached': cached})
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Endpoints traced by the request hooks below; the stream endpoint traces its own generator
+TRACED_ENDPOINTS = {'generate_questions'}
+
+def request_trace_id():
+    """Use the caller's X-Request-ID as the trace id when it sends one"""
+    return request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex[:16]
+
+@app.before_request
+def start_request_trace():
+    if request.endpoint in TRACED_ENDPOINTS:
+        g.trace = tracing.start_trace(request.path, trace_id=request_trace_id())
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracing.end_trace(trace, status='ok' if response.status_code < 400 else f'http_{response.status_code}')
+        response.headers['Server-Timing'] = tracing.server_timing(trace)
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.teardown_request
+def discard_request_trace(error=None):
+    # after_request is skipped when a view raises; don't leave the trace current on this thread
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracing.end_trace(trace, status='error')
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated across gunicorn workers"""
+    rendered = metrics.render()
+    if rendered is None:
+        return Response('prometheus_client is not installed\n', status=503, mimetype='text/plain')
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+def rate_limited_response(error):
+    """429 response telling the client when to retry after the upstream rate limit was hit"""
+    response = jsonify({'error': str(error), 'retryAfter': error.retry_after})
+    response.status_code = 429
+    if error.retry_after:
+        response.headers['Retry-After'] = str(max(1, int(error.retry_after + 0.999)))
+    return response
+
+def iter_questions_with_cache(generation_kwargs, read_cache=True, write_cache=True):
+    """Return (cached, questions) where questions yields each question as soon as it is ready.
+    
+    Cache hits replay the stored questions; a fresh, complete result is written back to the cache.
+    """
+    cache_key = response_cache.make_key(generation_kwargs)
+    cached_questions = response_cache.get(cache_key) if read_cache else None
+    if cached_questions is not None:
+        return True, iter(cached_questions)
+    
+    def generate():
+        generated = []
+        for question in stream_questions_with_gpt(**generation_kwargs):
+            generated.append(question)
+            yield question
+        if write_cache and len(generated) >= generation_kwargs['num_questions']:
+            response_cache.put(cache_key, generated)
+    
+    return False, generate()
+
+def format_sse(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_questions_stream():
+    """Stream generated questions as Server-Sent Events, one event per completed question"""
+    try:
+        data = request.json
+        generation_kwargs = build_generation_kwargs(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    read_cache, write_cache = get_cache_flags(data)
+    
+    trace_id = request_trace_id()
+    path = request.path
+    
+    def events():
+        # Headers are already sent when the stream finishes, so this trace is logged but has no Server-Timing
+        trace = tracing.start_trace(path, trace_id=trace_id)
+        status = 'ok'
+        count = 0
+        try:
+            num_questions = generation_kwargs['num_questions']
+            cached, questions = iter_questions_with_cache(generation_kwargs, read_cache, write_cache)
+            yield format_sse('start', {'requested': num_questions, 'cached': cached})
+            try:
+                for question in questions:
+                    yield format_sse('question', {'index': count, 'question': question})
+                    count += 1
+                yield format_sse('done', {'count': count, 'requested': num_questions})
+            except Exception as e:
+                status = 'error'
+                payload = {'error': str(e), 'count': count}
+                if isinstance(e, RateLimitExceeded):
+                    payload['retryAfter'] = e.retry_after
+                yield format_sse('error', payload)
+        finally:
+            trace.attrs['questions'] = count
+            tracing.end_trace(trace, status=status)
+    
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Stop reverse proxies from buffering the stream
+        'X-Trace-Id': trace_id
+    }
+    return Response(events(), mimetype='text/event-stream', headers=headers)
+
+# Question types as passed in the questionType field, keyed by the internal type name
+QUESTION_TYPE_PARAMS = {'word_problem': 'word-problems', 'mathematical': 'mathematical', 'image_based': 'image-based'}
+
+def parse_batch_items(body, content_type, fmt=None):
+    """Parse a batch request body as JSON, JSONL or CSV into (items, options)
+    
+    JSON bodies may be a list of items or {"items": [...], "defaults": {...}, "concurrency": n}.
+    """
+    fmt = (fmt or '').lower()
+    if not fmt:
+        if 'csv' in content_type:
+            fmt = 'csv'
+        elif 'ndjson' in content_type or 'jsonl' in content_type:
+            fmt = 'jsonl'
+        else:
+            fmt = 'json'
+    
+    options = {}
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(body))
+        # Drop empty cells so defaults apply to them
+        items = [{key.strip(): value for key, value in row.items() if key and value not in (None, '')}
+                 for row in reader]
+    elif fmt == 'jsonl':
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    elif fmt == 'json':
+        parsed = json.loads(body)
+        if isinstance(parsed, dict):
+            items = parsed.get('items', [])
+            options = {key: value for key, value in parsed.items() if key != 'items'}
+        else:
+            items = parsed
+    else:
+        raise ValueError(f'Unsupported batch format: {fmt}')
+    
+    if not isinstance(items, list) or not items:
+        raise ValueError('Batch must contain at least one item')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'Batch has {len(items)} items; the limit is {BATCH_MAX_ITEMS}')
+    return items, options
+
+def prepare_batch_item(item, defaults):
+    """Merge batch defaults into one item and turn it into generation kwargs"""
+    if not isinstance(item, dict):
+        raise ValueError('Batch item must be an object')
+    data = {**defaults, **item}
+    generation_kwargs = build_generation_kwargs(data)
+    if not generation_kwargs['question_type_from_url']:
+        # Resolve the type per row so it can be reported alongside the results
+        question_type = determine_question_type(generation_kwargs['base_question'], generation_kwargs['notes'])
+        generation_kwargs['question_type_from_url'] = QUESTION_TYPE_PARAMS[question_type]
+    return data, generation_kwargs
+
+def run_batch_item(index, item, defaults):
+    """Generate questions for one batch item and return its JSONL result record"""
+    result = {'index': index}
+    if isinstance(item, dict) and item.get('id') is not None:
+        result['id'] = item['id']
+    try:
+        data, generation_kwargs = prepare_batch_item(item, defaults)
+        read_cache, write_cache = get_cache_flags(data)
+        questions, cached = generate_questions_with_cache(generation_kwargs, read_cache, write_cache)
+        result.update({
+            'status': 'ok',
+            'numOptions': generation_kwargs['num_options'],
+            'questionType': generation_kwargs['question_type_from_url'],
+            'cached': cached,
+            'questions': questions
+        })
+    except Exception as e:
+        result.update({'status': 'error', 'error': str(e)})
+    return result
+
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_questions_batch():
+    """Generate questions for many base questions, streaming one JSONL result line per item as it finishes"""
+    try:
+        items, options = parse_batch_items(request.get_data(as_text=True), request.content_type or '',
+                                           request.args.get('format'))
+    except (ValueError, csv.Error) as e:
+        return jsonify({'error': f'Invalid batch: {str(e)}'}), 400
+    
+    # Batch-wide defaults (model, numCopyQuestions, ...) may come from the JSON body or the query string
+    defaults = {key: value for key, value in request.args.items() if key not in ('format', 'concurrency')}
+    defaults.update(options.get('defaults') or {})
+    concurrency = options.get('concurrency')
+    if concurrency is None:
+        concurrency = request.args.get('concurrency')
+    try:
+        concurrency = parse_count(concurrency, BATCH_CONCURRENCY, 1, BATCH_MAX_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid concurrency: {str(e)}'}), 400
+    
+    def results():
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = [executor.submit(run_batch_item, index, item, defaults) for index, item in enumerate(items)]
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + '\n'
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(results(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+def run_generation_job(job, store):
+    """Job handler: generate questions for a queued request, publishing each one as it completes"""
+    data = job['payload']
+    trace = tracing.start_trace('job', trace_id=job['id'][:16])
+    status = 'error'
+    try:
+        generation_kwargs = build_generation_kwargs(data)
+        read_cache, write_cache = get_cache_flags(data)
+        _, questions = iter_questions_with_cache(generation_kwargs, read_cache, write_cache)
+        for question in questions:
+            store.add_question(job['id'], question)
+        status = 'ok'
+    finally:
+        tracing.end_trace(trace, status=status)
+    return None  # Keep the questions published above
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """Return this worker's job runner, starting its background threads on first use"""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner(JobStore(), run_generation_job)
+        _job_runner.start()
+    return _job_runner
+
+def serialize_job(job):
+    return {
+        'jobId': job['id'],
+        'status': job['status'],
+        'requested': int(job['payload'].get('numCopyQuestions') or 0),
+        'questions': job['questions'],
+        'error': job['error'],
+        'createdAt': job['created_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at']
+    }
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a generation and return immediately with a job id to poll"""
+    data = request.json
+    try:
+        # Validate up front so bad requests fail now rather than in the background
+        build_generation_kwargs(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    runner = get_job_runner()
+    job_id = runner.store.enqueue(data)
+    runner.notify()
+    return jsonify({'jobId': job_id, 'status': 'queued', 'statusUrl': f'/api/jobs/{job_id}'}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return a job's status and the questions generated so far"""
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job))
+
+@app.route('/api/curriculum/standards', methods=['GET'])
+def curriculum_standards():
+    """Standards of a curriculum whose code starts with the given prefix"""
+    curriculum = request.args.get('curriculum', '')
+    if not curriculum:
+        return jsonify({'error': 'Missing required parameter: curriculum'}), 400
+    try:
+        limit = min(500, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    standards = curriculum_store.find_standards(curriculum, request.args.get('prefix', ''),
+                                                grade=request.args.get('grade') or None, limit=limit)
+    return jsonify({'standards': standards})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(debug=False, host='0.0.0.0', port=port)
@@ -0,0 +1,324 @@
+"""
+Local generator for purely numeric "mathematical" copy questions.
+
+A base question such as "What is 36 + 47?" keeps its phrasing and only gets
+new numbers. The engine finds the one arithmetic expression in the stem and
+checks that the rest of the stem has no other numbers. It then draws new
+operands under the constraints the base question shows: the same digit counts
+and decimal places, carrying or borrowing (or not) as in the base, a
+non-negative result, and a whole-number result when the base has one. Answers
+are computed exactly with an AST-based Fraction evaluator; nothing is passed to
+eval(). Distractors come from the error models in distractors.py. The output has the
+same shape as generate_questions_with_gpt.
+
+generate_copies returns None for anything it cannot handle, and the caller
+falls back to the model.
+"""
+import ast
+import operator
+import os
+import random
+import re
+from decimal import Decimal
+from fractions import Fraction
+
+import distractors
+from option_detector import split_options
+
+# Answer pure arithmetic base questions locally (requests can override with localArithmetic)
+LOCAL_ARITHMETIC_ENABLED = os.getenv('LOCAL_ARITHMETIC_ENABLED', 'false').lower() not in ('0', 'false', 'no')
+# Longest stem (outside the expression) still treated as a pure arithmetic item
+MAX_STEM_WORDS_CHARS = 80
+MAX_OPERAND_DIGITS = 9
+DRAW_ATTEMPTS = 500
+
+_NUMBER = r'\d+(?:\.\d+)?'
+_OPERATOR = r'[-+*/×xX÷−–·]'
+_EXPRESSION = re.compile(
+    rf'[(\s]*{_NUMBER}[)\s]*(?:{_OPERATOR}[(\s]*{_NUMBER}[)\s]*)+'
+)
+_NUMBER_TOKEN = re.compile(_NUMBER)
+# "3/4" written without spaces is a fraction; "72 / 8" is a division
+_FRACTION = re.compile(r'(?<![\d.])(\d+)/(\d+)(?![\d.])')
+# "1 1/2" is one mixed number, 1 + 1/2
+_MIXED_NUMBER = re.compile(r'(?<![\d./])(\d+)[ \t]+(\d+)/(\d+)(?![\d.])')
+_TO_PYTHON = str.maketrans({'×': '*', 'x': '*', 'X': '*', '·': '*', '÷': '/', '−': '-', '–': '-'})
+_BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+_UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+_OPERATION_WORDS = {ast.Add: 'Add', ast.Sub: 'Subtract', ast.Mult: 'Multiply', ast.Div: 'Divide'}
+
+
+def _to_python(expression):
+    """Python syntax for an expression, with each fraction and mixed number parenthesized as one number
+
+    Without the parentheses "2/3 ÷ 4/5" would read left to right as 2 / 3 / 4 / 5.
+    """
+    expression = _MIXED_NUMBER.sub(r'(\1 + \2/\3)', expression)
+    expression = _FRACTION.sub(r'(\1/\2)', expression)
+    return expression.translate(_TO_PYTHON).strip()
+
+
+def evaluate(expression):
+    """Exact value of an arithmetic expression (+ - × ÷, fractions, mixed numbers and parentheses) as a Fraction"""
+    tree = ast.parse(_to_python(expression), mode='eval')
+    return _evaluate_node(tree.body)
+
+
+def _evaluate_node(node):
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return _BINARY_OPERATORS[type(node.op)](_evaluate_node(node.left), _evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate_node(node.operand))
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return Fraction(repr(node.value))
+    raise ValueError(f"Unsupported expression element: {type(node).__name__}")
+
+
+def parse_arithmetic(base_question):
+    """
+    The pieces of a pure arithmetic stem, or None.
+
+    Returns a dict with stem, expression (its text), span (its position in stem), operands (number texts)
+    and value (the exact result).
+    """
+    stem, _ = split_options(base_question or '')
+    stem = stem.strip()
+    matches = list(_EXPRESSION.finditer(stem))
+    if len(matches) != 1:
+        return None
+    match = matches[0]
+    start = match.start() + len(match.group()) - len(match.group().lstrip())
+    end = match.start() + len(match.group().rstrip())
+    # Leading '(' or trailing ')' outside a balanced expression belong to the prose, not the expression
+    expression = stem[start:end]
+    rest = stem[:start] + stem[end:]
+    if any(char.isdigit() for char in rest) or len(rest) > MAX_STEM_WORDS_CHARS:
+        return None
+    operands = _NUMBER_TOKEN.findall(expression)
+    if _FRACTION.search(expression) and any('.' in operand for operand in operands):
+        return None
+    if any(len(operand.split('.')[0]) > MAX_OPERAND_DIGITS for operand in operands):
+        return None
+    try:
+        value = evaluate(expression)
+    except (SyntaxError, ValueError, ZeroDivisionError):
+        return None
+    return {'stem': stem, 'expression': expression, 'span': (start, end), 'operands': operands, 'value': value,
+            'fractions': [(int(numerator), int(denominator))
+                          for numerator, denominator in _FRACTION.findall(expression)]}
+
+
+def _operation(expression):
+    """The ast operator class if the expression is a single binary operation, else None"""
+    body = ast.parse(_to_python(expression), mode='eval').body
+    if isinstance(body, ast.BinOp) and all(isinstance(side, ast.Constant) for side in (body.left, body.right)):
+        return type(body.op)
+    return None
+
+
+def _digits(value):
+    return [int(digit) for digit in reversed(str(value))]
+
+
+def _has_carry(a, b, operation):
+    """Whether column addition carries (or column subtraction borrows) for whole numbers a and b"""
+    first, second = _digits(a), _digits(b)
+    width = max(len(first), len(second))
+    first += [0] * (width - len(first))
+    second += [0] * (width - len(second))
+    if operation is ast.Add:
+        return any(x + y >= 10 for x, y in zip(first, second))
+    return any(x < y for x, y in zip(first, second))
+
+
+def _places(operand):
+    return len(operand.split('.')[1]) if '.' in operand else 0
+
+
+def _format_number(value, places=None):
+    if value.denominator == 1:
+        return str(value.numerator)
+    if places is not None:
+        decimal = Decimal(value.numerator) / Decimal(value.denominator)
+        return format(decimal.quantize(Decimal(1).scaleb(-places)), 'f').rstrip('0').rstrip('.')
+    return f"{value.numerator}/{value.denominator}"
+
+
+def _answer_formatter(parsed):
+    """Format answers like the base: decimals if it uses decimals, otherwise fractions"""
+    places = max(_places(operand) for operand in parsed['operands'])
+    if places:
+        # Products and quotients of decimals need more places than the operands
+        return lambda value: _format_number(value, places=min(6, places * len(parsed['operands'])))
+    return _format_number
+
+
+def _draw_operand(operand, rng):
+    whole, _, fraction = operand.partition('.')
+    digits = len(whole.lstrip('0')) or 1
+    # A single-digit 1 stays possible only where the base question uses it (no "6 × 1" copies of "3 × 2")
+    low = 10 ** (digits - 1) if digits > 1 else min(int(whole), 2)
+    value = rng.randint(low, 10 ** digits - 1)
+    if not fraction:
+        return str(value)
+    # Keep the last decimal place non-zero so "2.50" style operands don't collapse to fewer places
+    decimals = rng.randint(0, 10 ** len(fraction) - 1)
+    if decimals % 10 == 0:
+        decimals += 1
+    return f"{value}.{decimals:0{len(fraction)}d}"
+
+
+def _valid_fractions(fractions, base_fractions):
+    """Denominators above 1, and proper fractions where the base question's are proper"""
+    for (numerator, denominator), (base_numerator, base_denominator) in zip(fractions, base_fractions):
+        if denominator < 2 <= base_denominator or numerator == 0 < base_numerator:
+            return False
+        if base_numerator < base_denominator and numerator >= denominator:
+            return False
+    return True
+
+
+def _result_digits(value):
+    return len(str(abs(value.numerator))) if value.denominator == 1 else None
+
+
+def _draw(parsed, operation, rng, seen):
+    """New operand texts satisfying the base question's constraints, or None"""
+    base_value = parsed['value']
+    operands = parsed['operands']
+    whole_operands = all('.' not in operand for operand in operands)
+    # A whole-number answer is a constraint only for whole-number operands; for 2.5 × 1.2 = 3 it is chance
+    whole_answer = whole_operands and not parsed['fractions'] and base_value.denominator == 1
+    needs_carry = None
+    if operation in (ast.Add, ast.Sub) and whole_operands:
+        needs_carry = _has_carry(int(operands[0]), int(operands[1]), operation)
+
+    for _ in range(DRAW_ATTEMPTS):
+        if operation is ast.Div and whole_operands and base_value.denominator == 1 and not parsed['fractions']:
+            # Build whole-number quotients directly: divisor x quotient with the dividend's digit count
+            divisor = int(_draw_operand(operands[1], rng))
+            dividend_digits = len(operands[0])
+            low, high = 10 ** (dividend_digits - 1), 10 ** dividend_digits - 1
+            if divisor == 0 or high // divisor < max(1, -(-low // divisor)):
+                continue
+            new_operands = [str(divisor * rng.randint(max(1, -(-low // divisor)), high // divisor)), str(divisor)]
+        else:
+            new_operands = [_draw_operand(operand, rng) for operand in operands]
+        key = tuple(new_operands)
+        if key in seen or new_operands == operands:
+            continue
+        expression = _substitute(parsed['expression'], new_operands)
+        try:
+            value = evaluate(expression)
+        except ZeroDivisionError:
+            continue
+        if whole_answer and value.denominator != 1:
+            continue
+        if base_value >= 0 > value:
+            continue
+        if parsed['fractions'] and not _valid_fractions(
+                [(int(n), int(d)) for n, d in _FRACTION.findall(expression)], parsed['fractions']):
+            continue
+        # Keep whole-number answers in the base answer's range (36 + 47 = 83 should not become 93 + 58 = 151)
+        if whole_answer and _result_digits(value) != _result_digits(base_value):
+            continue
+        if needs_carry is not None and _has_carry(int(new_operands[0]), int(new_operands[1]), operation) != needs_carry:
+            continue
+        seen.add(key)
+        return new_operands, expression, value
+    return None
+
+
+def _substitute(expression, new_operands):
+    replacements = iter(new_operands)
+    return _NUMBER_TOKEN.sub(lambda _: next(replacements), expression)
+
+
+def _distractors(expression, value, rng):
+    """(value, logic) pairs for common mistakes, most specific first"""
+    candidates = []
+    if '(' in expression:
+        try:
+            candidates.append((evaluate(expression.replace('(', '').replace(')', '')), 'Ignored the parentheses'))
+        except ZeroDivisionError:
+            pass
+    operation = distractors.find_operation(value, expression)
+    if operation is not None:
+        candidates.extend(distractors.operation_errors(*operation))
+    # Near misses in the answer's own unit: 1 for whole numbers, 1/8 for eighths, 0.1 for tenths
+    unit = Fraction(1, value.denominator)
+    near = [1, -1, 2, -2]
+    rng.shuffle(near)
+    for offset in near + [10, -10, 5, -5]:
+        candidates.append((value + offset * unit, 'Off by one' if abs(offset) == 1 else 'Calculation error'))
+    if '.' in expression:
+        candidates.append((value / 10, 'Misplaced the decimal point'))
+    candidates.append((value * 10, 'Place value error'))
+    return candidates
+
+
+def _options(expression, value, num_options, format_answer, rng):
+    correct = format_answer(value)
+    options = [{'text': correct, 'logic': 'CA'}]
+    used = {correct}
+    # Whole-number questions get whole-number distractors ("40 ÷ 5" should not offer 1/8)
+    whole_only = value.denominator == 1 and '.' not in expression and not _FRACTION.search(expression)
+    for candidate, logic in _distractors(expression, value, rng):
+        if len(options) >= num_options:
+            break
+        if value >= 0 > candidate or (whole_only and candidate.denominator != 1):
+            continue
+        # Near misses can step down to 0 (2/3 - 2 × 1/3), which no one would pick for a non-zero answer
+        if candidate == 0 != value:
+            continue
+        text = format_answer(candidate)
+        if text not in used:
+            used.add(text)
+            options.append({'text': text, 'logic': logic})
+    if len(options) < num_options:
+        return None
+    rng.shuffle(options)
+    return options
+
+
+def _solution(expression, operands, value, operation, format_answer):
+    result = f"{expression.strip()} = {format_answer(value)}"
+    if _FRACTION.search(expression):
+        if '+' in expression or '-' in expression or '−' in expression:
+            return f"Step 1: Rewrite the fractions with a common denominator and combine the numerators. Step 2: {result}."
+        return f"Step 1: Multiply or divide the numerators and denominators, then simplify. Step 2: {result}."
+    if operation is None:
+        return f"Step 1: Work inside parentheses first, then multiply and divide, then add and subtract. Step 2: {result}."
+    if operation is ast.Sub:
+        return f"Step 1: Subtract {operands[1]} from {operands[0]}. Step 2: {result}."
+    if operation is ast.Div:
+        return f"Step 1: Divide {operands[0]} by {operands[1]}. Step 2: {result}."
+    return f"Step 1: {_OPERATION_WORDS[operation]} {operands[0]} and {operands[1]}. Step 2: {result}."
+
+
+def generate_copies(base_question, num_questions, num_options, seed=None):
+    """Copy questions for a pure arithmetic base question, or None if the base question is not one"""
+    parsed = parse_arithmetic(base_question)
+    if parsed is None or num_options < 2:
+        return None
+    rng = random.Random(seed)
+    operation = _operation(parsed['expression'])
+    format_answer = _answer_formatter(parsed)
+    start, end = parsed['span']
+    seen = set()
+    questions = []
+    for _ in range(num_questions):
+        drawn = _draw(parsed, operation, rng, seen)
+        if drawn is None:
+            return None
+        operands, expression, value = drawn
+        options = _options(expression, value, num_options, format_answer, rng)
+        if options is None:
+            return None
+        questions.append({
+            'question': parsed['stem'][:start] + expression + parsed['stem'][end:],
+            'options': options,
+            'image': '',
+            'solution': _solution(expression, operands, value, operation, format_answer),
+        })
+    return questions
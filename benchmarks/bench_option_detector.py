@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of option detection on the corpus in fixtures/option_corpus.json.
+
+Each case is checked against its expected option count and marker style, then
+timed at its own size and padded to multi-kilobyte stems (SMEs paste whole
+passages). The regex cascade that detect_options replaced is timed alongside
+it for comparison. Exits with 1 if any case is detected wrongly.
+
+  python benchmarks/bench_option_detector.py
+  python benchmarks/bench_option_detector.py --sizes 0,4096,32768 --output options.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from option_detector import detect_options  # noqa: E402
+
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, 'fixtures', 'option_corpus.json')
+# Padding for large stems: prose with the sentence-initial letters, decimals and times that trip up regex counting
+FILLER = ("Read the passage. A farmer plants 12 rows of 8 tomato plants at 9:30 each morning and uses 3.5 liters "
+          "of water per row. I. e. the rows need 42 liters in all. Step 1. Count the rows (there are 12). "
+          "Plan A. is to water twice a day; x. y and z stand for the three fields. ")
+
+
+def legacy_parse_number_of_options(base_question):
+    """The regex cascade used before option_detector (five lettered and two numbered findall passes)"""
+    found_options = set()
+    for pattern in (r'\b([A-Z])\)\s', r'\b([A-Z])\.\s', r'\(([A-Z])\)', r'Option\s+([A-Z])[:\s]', r'\b([A-Z])\)[^\s]'):
+        for letter in re.findall(pattern, base_question, re.IGNORECASE):
+            found_options.add(letter.upper())
+    if found_options:
+        num_options = ord(max(found_options)) - ord('A') + 1
+        if 2 <= num_options <= 10:
+            return num_options
+    numbers = []
+    for pattern in (r'\b(\d+)\)\s', r'\b(\d+)\.\s'):
+        numbers.extend(int(n) for n in re.findall(pattern, base_question))
+    if numbers and 2 <= max(numbers) <= 10:
+        return max(numbers)
+    return 4
+
+
+def detected_count(text):
+    detected = detect_options(text)
+    return detected['count'] if detected else 4
+
+
+def pad(text, size):
+    """Prefix the text with filler prose so it is at least `size` characters long"""
+    if size <= len(text):
+        return text
+    repeats = (size - len(text)) // len(FILLER) + 1
+    return (FILLER * repeats)[:size - len(text)] + '\n' + text
+
+
+def time_per_call(fn, texts, min_seconds):
+    """Mean microseconds per call over texts, from the best of 3 timing runs"""
+    timer = timeit.Timer(lambda: [fn(text) for text in texts])
+    number = 1
+    while timer.timeit(number) < min_seconds:
+        number *= 2
+    return min(timer.repeat(repeat=3, number=number)) / number / len(texts) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='0,4096,16384',
+                        help='Comma-separated stem sizes in characters (0 = the case as written)')
+    parser.add_argument('--min-seconds', type=float, default=0.2, help='Minimum seconds per timing run')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args(argv)
+    sizes = [int(n) for n in args.sizes.split(',') if n.strip()]
+
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+
+    failures = []
+    legacy_wrong = 0
+    for case in cases:
+        expected_count = case['expected_count'] or 4
+        detected = detect_options(case['text'])
+        got = (detected['count'], detected['style']) if detected else (None, None)
+        if got != (case['expected_count'], case['expected_style']):
+            failures.append({'name': case['name'], 'expected': [case['expected_count'], case['expected_style']],
+                             'got': list(got)})
+        # Padding must not change the answer either
+        for size in sizes:
+            if size and detected_count(pad(case['text'], size)) != expected_count:
+                failures.append({'name': case['name'], 'size': size, 'expected': expected_count,
+                                 'got': detected_count(pad(case['text'], size))})
+        if legacy_parse_number_of_options(case['text']) != expected_count:
+            legacy_wrong += 1
+
+    timings = []
+    for size in sizes:
+        texts = [pad(case['text'], size) for case in cases]
+        detector_us = time_per_call(detect_options, texts, args.min_seconds)
+        legacy_us = time_per_call(legacy_parse_number_of_options, texts, args.min_seconds)
+        timings.append({'size': size, 'mean_chars': sum(len(text) for text in texts) // len(texts),
+                        'detect_options_us': round(detector_us, 2), 'legacy_us': round(legacy_us, 2)})
+
+    print(f"{len(cases)} cases: detect_options wrong on {len(failures)}, legacy cascade wrong on {legacy_wrong}")
+    for failure in failures:
+        print(f"  FAIL {json.dumps(failure, ensure_ascii=False)}")
+    print(f"{'size':>8}{'chars':>8}{'detect µs':>12}{'legacy µs':>12}{'speedup':>9}")
+    for timing in timings:
+        speedup = timing['legacy_us'] / timing['detect_options_us'] if timing['detect_options_us'] else 0
+        print(f"{timing['size']:>8}{timing['mean_chars']:>8}{timing['detect_options_us']:>12.1f}"
+              f"{timing['legacy_us']:>12.1f}{speedup:>8.1f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cases': len(cases), 'failures': failures, 'legacy_wrong': legacy_wrong,
+                       'timings': timings}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Size and decode speed of the JSON and compact response formats.
+
+Every fixture question set in fixtures/chat_responses.json is written as the
+model would write it in each format (JSON array, compact lines, and both of
+them in lean output for the types that support it), then decoded with the
+parser the app uses for that format. Sizes are in characters and in tokens:
+exact with tiktoken installed, otherwise estimated at 4 characters per token.
+Exits with 1 if a format does not decode back to the same questions.
+
+  python benchmarks/bench_wire_format.py
+  python benchmarks/bench_wire_format.py --repeat 20 --output wire.json
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import compact_format  # noqa: E402
+from mock_openai import lean_question, load_fixtures  # noqa: E402
+from question_parser import extract_questions  # noqa: E402
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+LEAN_TYPES = ('mathematical', 'word_problem')
+
+
+def token_counter(model):
+    if tiktoken is None:
+        return lambda text: len(text) // 4, 'estimated'
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding('o200k_base')
+    return lambda text: len(encoding.encode(text)), encoding.name
+
+
+def decode_json(text):
+    return extract_questions(text)[0]
+
+
+def decode_compact(text):
+    return compact_format.extract_questions(text)[0]
+
+
+def normalized(questions):
+    """Questions without empty image fields, which the compact format leaves out"""
+    return [{key: value for key, value in question.items() if value != '' or key != 'image'}
+            for question in questions]
+
+
+def time_per_call(fn, text, min_seconds):
+    """Mean microseconds per call, from the best of 3 timing runs"""
+    timer = timeit.Timer(lambda: fn(text))
+    number = 1
+    while timer.timeit(number) < min_seconds:
+        number *= 2
+    return min(timer.repeat(repeat=3, number=number)) / number * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Questions per response: the fixture set repeated this many times')
+    parser.add_argument('--model', default='gpt-4o', help='Model whose tokenizer counts tokens (with tiktoken)')
+    parser.add_argument('--min-seconds', type=float, default=0.2, help='Minimum seconds per timing run')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args(argv)
+    count_tokens, tokenizer = token_counter(args.model)
+
+    fixtures = load_fixtures()
+    rows, failures = [], []
+    for question_type, pool in fixtures['questions'].items():
+        variants = [('json', pool)]
+        if question_type in LEAN_TYPES:
+            variants.append(('lean', [lean_question(question) for question in pool]))
+        for variant, questions in variants:
+            questions = questions * args.repeat
+            for wire, text, decode in (
+                    ('json', json.dumps(questions, ensure_ascii=False), decode_json),
+                    ('compact', compact_format.encode(questions), decode_compact)):
+                if normalized(decode(text)) != normalized(questions):
+                    failures.append(f"{question_type} {variant} {wire}")
+                rows.append({'question_type': question_type, 'output': variant, 'wire': wire,
+                             'questions': len(questions), 'chars': len(text), 'tokens': count_tokens(text),
+                             'decode_us': round(time_per_call(decode, text, args.min_seconds), 1)})
+
+    print(f"Tokens: {tokenizer}")
+    print(f"{'type':<14}{'output':<8}{'wire':<9}{'chars':>8}{'tokens':>8}{'tok/q':>7}{'decode µs':>11}{'vs json':>9}")
+    for row in rows:
+        json_row = next(r for r in rows if r['question_type'] == row['question_type']
+                        and r['output'] == row['output'] and r['wire'] == 'json')
+        saving = f"{row['tokens'] / json_row['tokens'] - 1:+.0%}" if row is not json_row else ''
+        print(f"{row['question_type']:<14}{row['output']:<8}{row['wire']:<9}{row['chars']:>8}{row['tokens']:>8}"
+              f"{row['tokens'] / row['questions']:>7.0f}{row['decode_us']:>11.1f}{saving:>9}")
+    for failure in failures:
+        print(f"  FAIL {failure} does not decode to the fixture questions")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'tokenizer': tokenizer, 'rows': rows, 'failures': failures}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
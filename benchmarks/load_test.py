@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Capacity test for the gunicorn deployment, against the local mock OpenAI server.
+
+For each worker class and worker count, the app is started with the Procfile
+web command (so gunicorn.conf.py applies, as in production) and ramped through
+increasing numbers of concurrent /api/generate clients. Each client sends its
+next request as soon as the previous one returns. Every concurrency level
+reports throughput, latency percentiles, queueing delay (client latency minus
+the server's own Server-Timing total), timeouts and errors, and each
+configuration reports where it saturates.
+
+  python benchmarks/load_test.py --workers 1,2,4 --worker-classes sync,gthread --concurrency 1,4,8,16,32
+  python benchmarks/load_test.py --latency fixed:1 --stage-seconds 20 --concurrency 1,2,4   # quick check
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from mock_openai import MockOpenAIServer, add_mock_arguments, load_fixtures, mock_options
+from run_benchmarks import REPO_ROOT, base_question_payload, git_revision
+
+PROCFILE = os.path.join(REPO_ROOT, 'Procfile')
+# Worker classes that need an extra package, and the module to import to check for it
+WORKER_CLASS_MODULES = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+_SERVER_TOTAL = re.compile(r'(?:^|,\s*)total;dur=([\d.]+)')
+
+
+def procfile_command(port):
+    """The Procfile web command with $PORT filled in, as an argument list"""
+    with open(PROCFILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            name, _, command = line.partition(':')
+            if name.strip() == 'web':
+                command = command.strip().replace('${PORT}', str(port)).replace('$PORT', str(port))
+                return shlex.split(command)
+    raise Exception(f"No web process in {PROCFILE}")
+
+
+def available_worker_classes(worker_classes):
+    available = []
+    for worker_class in worker_classes:
+        module = WORKER_CLASS_MODULES.get(worker_class)
+        if module:
+            try:
+                __import__(module)
+            except ImportError:
+                print(f"WARNING: Skipping worker class '{worker_class}': pip install {module}")
+                continue
+        available.append(worker_class)
+    return available
+
+
+def check_env_file():
+    """Refuse to run if .env would point the app at a real upstream (the app reloads .env with override)"""
+    env_file = os.path.join(REPO_ROOT, '.env')
+    if not os.path.exists(env_file):
+        return
+    from dotenv import dotenv_values
+    if dotenv_values(env_file).get('OPENAI_BASE_URL'):
+        raise SystemExit(f"{env_file} sets OPENAI_BASE_URL, which would replace the mock upstream; unset it first")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """One gunicorn run of the app with a given worker class and worker count"""
+
+    def __init__(self, worker_class, workers, threads, base_url, log_path, extra_env=None):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = log_path
+        # gunicorn turns sync workers into gthread whenever threads > 1, so only gthread gets the threads
+        self.threads = threads if worker_class == 'gthread' else 1
+        self.env = dict(os.environ)
+        self.env.update({
+            'PORT': str(self.port),
+            # gunicorn reads WEB_CONCURRENCY for the worker count, as on Heroku
+            'WEB_CONCURRENCY': str(workers),
+            'GUNICORN_WORKER_CLASS': worker_class,
+            'GUNICORN_THREADS': str(self.threads),
+            'OPENAI_BASE_URL': base_url,
+            'OPENAI_API_KEY': 'mock-load-test-key',
+            'STATE_DIR': tempfile.mkdtemp(prefix='vm-load-'),
+            'RESPONSE_CACHE_ENABLED': 'false',
+            'USAGE_STATS_ENABLED': 'false',
+            'PYTHONUNBUFFERED': '1',
+        })
+        self.env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        self.env.update(extra_env or {})
+        self.process = None
+        self._log = None
+
+    def start(self, ready_timeout=60):
+        self._log = open(self.log_path, 'w', encoding='utf-8')
+        self.process = subprocess.Popen(procfile_command(self.port), cwd=REPO_ROOT, env=self.env,
+                                        stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + ready_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise Exception(f"gunicorn exited with {self.process.returncode}; see {self.log_path}")
+            try:
+                with urllib.request.urlopen(self.url + '/', timeout=2):
+                    return self
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.25)
+        self.stop()
+        raise Exception(f"gunicorn did not answer within {ready_timeout}s; see {self.log_path}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def effective_worker_class(self):
+        """The worker class gunicorn reports it started ("Using worker: gthread"), or None"""
+        with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if 'Using worker:' in line:
+                    return line.rsplit('Using worker:', 1)[1].strip()
+        return None
+
+    def worker_timeouts(self):
+        """Requests gunicorn killed for exceeding its worker timeout"""
+        with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+            return sum(1 for line in f if 'WORKER TIMEOUT' in line)
+
+
+def send_request(url, payload, timeout):
+    """POST one /api/generate request; return its outcome, latency and server-side duration"""
+    body = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url + '/api/generate', data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    status, server_ms, outcome = None, None, 'ok'
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+            response.read()
+            timing = _SERVER_TOTAL.search(response.headers.get('Server-Timing') or '')
+            server_ms = float(timing.group(1)) if timing else None
+    except urllib.error.HTTPError as e:
+        status = e.code
+        outcome = 'rate_limited' if e.code == 429 else f'http_{e.code}'
+    except (socket.timeout, TimeoutError):
+        outcome = 'timeout'
+    except urllib.error.URLError as e:
+        outcome = 'timeout' if isinstance(e.reason, (socket.timeout, TimeoutError)) else 'connection_error'
+    except (http.client.HTTPException, ConnectionError, OSError):
+        # A worker killed mid-request (e.g. by the gunicorn timeout) drops the connection
+        outcome = 'connection_error'
+    latency_ms = (time.perf_counter() - start) * 1000
+    return {'outcome': outcome, 'status': status, 'latency_ms': latency_ms, 'server_ms': server_ms}
+
+
+def run_level(url, payloads, concurrency, stage_seconds, request_timeout):
+    """Run `concurrency` closed-loop clients for stage_seconds; requests in flight at the end are finished"""
+    results = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + stage_seconds
+
+    def client(index):
+        # Stagger client starts over the first tenth of the stage instead of all at once
+        time.sleep(stage_seconds * 0.1 * index / concurrency)
+        sent = 0
+        while time.perf_counter() < deadline:
+            payload = payloads[(index + sent * concurrency) % len(payloads)]
+            result = send_request(url, payload, request_timeout)
+            sent += 1
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def summarize_level(concurrency, results, wall, percentile):
+    ok = [r for r in results if r['outcome'] == 'ok']
+    latencies = [r['latency_ms'] for r in ok]
+    queueing = [max(0.0, r['latency_ms'] - r['server_ms']) for r in ok if r['server_ms'] is not None]
+    outcomes = {}
+    for result in results:
+        if result['outcome'] != 'ok':
+            outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+
+    def percentiles(values):
+        if not values:
+            return None
+        return {p: round(percentile(values, int(p[1:])) / 1000, 2) for p in ('p50', 'p95', 'p99')}
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'completed': len(ok),
+        'throughput_per_minute': round(len(ok) * 60 / wall, 2) if wall else 0,
+        'latency_s': percentiles(latencies),
+        'queueing_delay_s': percentiles(queueing),
+        'timeouts': outcomes.get('timeout', 0),
+        'errors': outcomes,
+        'error_rate': round((len(results) - len(ok)) / len(results), 4) if results else 0,
+        'wall_seconds': round(wall, 1),
+    }
+
+
+def find_saturation(levels, max_error_rate, latency_factor, min_gain):
+    """
+    The first level past which adding clients stops helping: errors above max_error_rate, p95 latency
+    more than latency_factor times the lightest level's, or throughput gaining less than min_gain of
+    the ideal (linear) increase. Returns (saturated level or None, reason)
+    """
+    base = next((level for level in levels if level['latency_s']), None)
+    previous = None
+    for level in levels:
+        if level['error_rate'] > max_error_rate:
+            return level, f"error rate {level['error_rate']:.0%}"
+        if base and level['latency_s'] and level['latency_s']['p95'] > latency_factor * base['latency_s']['p95']:
+            return level, f"p95 latency {level['latency_s']['p95']}s vs {base['latency_s']['p95']}s"
+        if previous and previous['throughput_per_minute']:
+            ideal = previous['throughput_per_minute'] * (level['concurrency'] / previous['concurrency'] - 1)
+            gain = level['throughput_per_minute'] - previous['throughput_per_minute']
+            if ideal > 0 and gain < min_gain * ideal:
+                return level, f"throughput +{gain:.1f}/min of an ideal +{ideal:.1f}/min"
+        previous = level
+    return None, 'not reached'
+
+
+def print_configuration(config):
+    print(f"\n{config['worker_class']} x {config['workers']} workers"
+          + (f" ({config['threads']} threads each)" if config['threads'] > 1 else '')
+          + f"; gunicorn ran: {config['effective_worker_class'] or 'unknown'}")
+    print(f"{'clients':>8}{'done':>6}{'req/min':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'queue p95':>11}"
+          f"{'timeouts':>10}{'err%':>7}")
+    for level in config['levels']:
+        latency = level['latency_s'] or {'p50': 0, 'p95': 0, 'p99': 0}
+        queueing = level['queueing_delay_s'] or {'p95': 0}
+        print(f"{level['concurrency']:>8}{level['completed']:>6}{level['throughput_per_minute']:>9.1f}"
+              f"{latency['p50']:>8.1f}{latency['p95']:>8.1f}{latency['p99']:>8.1f}{queueing['p95']:>11.1f}"
+              f"{level['timeouts']:>10}{level['error_rate'] * 100:>7.1f}")
+    saturation = config['saturation']
+    reached = f"{saturation['concurrency']} clients ({saturation['reason']})" if saturation['concurrency'] else 'not reached'
+    print(f"Saturation: {reached}; "
+          f"max sustainable: {saturation['max_sustainable_concurrency']} clients, "
+          f"peak {saturation['peak_throughput_per_minute']} requests/min; "
+          f"gunicorn worker timeouts: {config['worker_timeouts']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated gunicorn worker counts')
+    parser.add_argument('--worker-classes', default='sync,gthread,gevent', help='Comma-separated worker classes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gthread worker')
+    parser.add_argument('--gunicorn-timeout', type=int, default=None,
+                        help='Override GUNICORN_TIMEOUT (default: gunicorn.conf.py)')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='Comma-separated client counts to ramp through')
+    parser.add_argument('--stage-seconds', type=float, default=300,
+                        help='How long each concurrency level keeps sending requests')
+    parser.add_argument('--request-timeout', type=float, default=300, help='Client-side request timeout in seconds')
+    parser.add_argument('--types', default='mathematical,word_problem,image_based',
+                        help='Question types, rotated across requests')
+    parser.add_argument('--options', type=int, default=4, help='Options per question')
+    parser.add_argument('--questions', type=int, default=5, help='numCopyQuestions per request')
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--max-error-rate', type=float, default=0.02, help='Error rate that counts as saturated')
+    parser.add_argument('--latency-factor', type=float, default=2.0,
+                        help='p95 latency growth over the lightest level that counts as saturated')
+    parser.add_argument('--min-gain', type=float, default=0.25,
+                        help='Share of the ideal throughput gain below which a level counts as saturated')
+    parser.add_argument('--log-dir', default=None, help='Where to keep gunicorn logs (default: a temp dir)')
+    parser.add_argument('--output', help='Write the capacity report as JSON to this file')
+    add_mock_arguments(parser)
+    # Production completions take 20-90 s
+    parser.set_defaults(latency='uniform:20,90', image_latency='uniform:10,40')
+    args = parser.parse_args(argv)
+
+    check_env_file()
+    worker_counts = [int(n) for n in args.workers.split(',') if n.strip()]
+    worker_classes = available_worker_classes([c.strip() for c in args.worker_classes.split(',') if c.strip()])
+    levels = sorted(int(n) for n in args.concurrency.split(',') if n.strip())
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix='vm-load-logs-')
+    os.makedirs(log_dir, exist_ok=True)
+
+    sys.path.insert(0, REPO_ROOT)
+    from usage_stats import percentile
+
+    fixtures = load_fixtures()
+    payloads = [base_question_payload(fixtures, question_type.strip(), args.options, args.questions, args.model)
+                for question_type in args.types.split(',') if question_type.strip()]
+    extra_env = {'GUNICORN_TIMEOUT': str(args.gunicorn_timeout)} if args.gunicorn_timeout else None
+
+    mock = MockOpenAIServer(**mock_options(args)).start()
+    configurations = []
+    try:
+        for worker_class in worker_classes:
+            for workers in worker_counts:
+                log_path = os.path.join(log_dir, f'gunicorn-{worker_class}-{workers}.log')
+                server = AppServer(worker_class, workers, args.threads, mock.base_url, log_path, extra_env).start()
+                print(f"Testing {worker_class} x {workers} workers (log: {log_path})", file=sys.stderr)
+                config = {'worker_class': worker_class, 'workers': workers, 'threads': server.threads, 'levels': []}
+                try:
+                    for concurrency in levels:
+                        results, wall = run_level(server.url, payloads, concurrency, args.stage_seconds,
+                                                  args.request_timeout)
+                        level = summarize_level(concurrency, results, wall, percentile)
+                        config['levels'].append(level)
+                        print(f"  {concurrency} clients: {level['throughput_per_minute']} requests/min, "
+                              f"error rate {level['error_rate']:.1%}", file=sys.stderr)
+                finally:
+                    server.stop()
+                config['worker_timeouts'] = server.worker_timeouts()
+                config['effective_worker_class'] = server.effective_worker_class()
+
+                saturated, reason = find_saturation(config['levels'], args.max_error_rate, args.latency_factor,
+                                                    args.min_gain)
+                sustainable = [level for level in config['levels']
+                               if saturated is None or level['concurrency'] < saturated['concurrency']]
+                config['saturation'] = {
+                    'concurrency': saturated['concurrency'] if saturated else None,
+                    'reason': reason,
+                    'max_sustainable_concurrency': sustainable[-1]['concurrency'] if sustainable else None,
+                    'peak_throughput_per_minute': max((level['throughput_per_minute']
+                                                       for level in config['levels']), default=0),
+                }
+                configurations.append(config)
+                print_configuration(config)
+    finally:
+        mock.stop()
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'procfile_command': ' '.join(procfile_command('$PORT')),
+            'args': vars(args),
+            'mock_requests': dict(mock.mock.requests),
+            'log_dir': log_dir,
+        },
+        'configurations': configurations,
+    }
+    if configurations:
+        best = max(configurations, key=lambda c: c['saturation']['peak_throughput_per_minute'])
+        print(f"\nBest: {best['worker_class']} (effective {best['effective_worker_class'] or 'unknown'}) "
+              f"x {best['workers']} workers, "
+              f"{best['saturation']['max_sustainable_concurrency']} concurrent clients before saturation, "
+              f"{best['saturation']['peak_throughput_per_minute']} requests/min peak")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
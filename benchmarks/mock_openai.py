@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions and images endpoints.
+
+Replies are built from the synthetic fixtures in fixtures/chat_responses.json:
+hand-written question objects for the requested type and count, serialized in
+one of the response styles the parser has to cope with (clean, code fences,
+prose around the array, trailing commas, truncated at the token limit). The
+styles and their mix are modelled on those failure modes, not captured from
+real completions. Replies are JSON or, when the prompt asks for it, the
+compact line format. Requests with a json_schema response_format get a clean
+{"questions": [...]} object, as structured outputs guarantee. Latency follows
+a configurable distribution, optionally plus a time per completion token.
+Point the app at it with OPENAI_BASE_URL:
+
+  python benchmarks/mock_openai.py --port 8900 --latency lognormal:2.5,0.4
+  OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=mock python app.py
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_format import encode as encode_compact  # noqa: E402
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'chat_responses.json')
+
+_COUNT_PATTERNS = (re.compile(r'QUESTIONS TO GENERATE: (\d+)'), re.compile(r'Generate EXACTLY (\d+) questions'))
+_OPTIONS_PATTERNS = (re.compile(r'OPTIONS PER QUESTION: (\d+)'), re.compile(r'with (\d+) options each'))
+_INTEGER = re.compile(r'\d+')
+
+
+class LatencyDistribution:
+    """Samples delays in seconds from a spec such as fixed:1.5, uniform:0.5,2, normal:2,0.5 or lognormal:2,0.4
+
+    For lognormal the parameters are the median and sigma. Samples are never negative.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',')] if params else []
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LO,HI, normal:MEAN,SD or "
+                             f"lognormal:MEDIAN,SIGMA")
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(0, sigma) * median
+
+
+def load_fixtures(path=FIXTURES_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def detect_request(messages):
+    """Return (question_type, num_questions, num_options) from the app's prompts"""
+    system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+    user = '\n'.join(m.get('content') or '' for m in messages if m.get('role') == 'user')
+    if 'IMAGE-BASED QUESTIONS GENERATION' in system:
+        question_type = 'image_based'
+    elif 'WORD PROBLEMS GENERATION' in system:
+        question_type = 'word_problem'
+    else:
+        question_type = 'mathematical'
+
+    def first_int(patterns, default):
+        for pattern in patterns:
+            match = pattern.search(user)
+            if match:
+                return int(match.group(1))
+        return default
+    return question_type, first_int(_COUNT_PATTERNS, 3), first_int(_OPTIONS_PATTERNS, 4)
+
+
+def is_lean(messages):
+    """True when the system prompt asks for answers instead of options (LEAN_OUTPUT_ENABLED)"""
+    system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+    return 'Do NOT write answer options' in system
+
+
+def is_compact(messages):
+    """True when the system prompt asks for the compact line format (COMPACT_OUTPUT_ENABLED)"""
+    system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+    return 'COMPACT OUTPUT' in system
+
+
+def lean_question(question):
+    """A fixture question as a lean reply: the CA option's text as "answer", no options"""
+    options = question.get('options') or []
+    correct = next((option for option in options if option.get('logic') == 'CA'), options[0] if options else {})
+    return {'question': question['question'], 'answer': correct.get('text', ''),
+            'image': question.get('image', ''), 'solution': question.get('solution', '')}
+
+
+def apply_style(style, questions, rng):
+    """Serialize questions in the given response style"""
+    text = json.dumps(questions, ensure_ascii=False)
+    if style == 'code_fence':
+        return f"```json\n{json.dumps(questions, ensure_ascii=False, indent=2)}\n```"
+    if style == 'prose_wrapped':
+        return f"Here are the copy questions you asked for:\n\n{text}\n\nLet me know if you need any changes."
+    if style == 'trailing_comma':
+        return text[:-1] + ',]' if len(questions) > 0 else text
+    if style == 'truncated' and len(questions) > 1:
+        # Cut partway through the last question object, as when max_tokens runs out
+        last_start = text.rfind('{"question"')
+        cut = last_start + int((len(text) - last_start) * rng.uniform(0.2, 0.8))
+        return text[:cut]
+    return text
+
+
+def apply_compact_style(style, questions, rng):
+    """Write questions in the compact line format, in the given response style"""
+    text = encode_compact(questions)
+    if style == 'code_fence':
+        return f"```\n{text}\n```"
+    if style == 'prose_wrapped':
+        return f"Here are the copy questions you asked for:\n\n{text}\n\nLet me know if you need any changes."
+    if style == 'truncated' and len(questions) > 1:
+        # Cut partway through the last question, as when max_tokens runs out
+        last_start = text.rfind('\nQ: ') + 1
+        return text[:last_start + int((len(text) - last_start) * rng.uniform(0.2, 0.8))]
+    return text
+
+
+class MockOpenAI:
+    """Builds chat and image responses; shared by all handler threads"""
+
+    def __init__(self, latency='lognormal:2.0,0.4', image_latency='lognormal:8,0.3', stream_fraction=0.3,
+                 error_rate=0.0, seed=None, fixtures=None, ms_per_token=0.0, reject_schema_models=()):
+        self.latency = LatencyDistribution(latency)
+        # Added per completion token, so shorter responses come back sooner like real ones
+        self.ms_per_token = ms_per_token
+        # Models answered with a 400 for a json_schema response_format, like ones without structured outputs
+        self.reject_schema_models = set(reject_schema_models)
+        self.image_latency = LatencyDistribution(image_latency)
+        # Share of a streamed reply's latency spent before the first token arrives
+        self.stream_fraction = stream_fraction
+        self.error_rate = error_rate
+        self.fixtures = fixtures or load_fixtures()
+        self.styles = list(self.fixtures['styles'].items())
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.variant = itertools.count(1)
+        self.seen_prefixes = set()
+        self.requests = {'chat': 0, 'images': 0, 'errors': 0}
+        self.tokens = {'prompt': 0, 'completion': 0}
+
+    def _random(self, fn):
+        with self.lock:
+            return fn(self.rng)
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        failed = self._random(lambda rng: rng.random() < self.error_rate)
+        if failed:
+            with self.lock:
+                self.requests['errors'] += 1
+        return failed
+
+    def build_questions(self, question_type, num_questions, num_options):
+        pool = self.fixtures['questions'][question_type]
+        start = self._random(lambda rng: rng.randrange(len(pool)))
+        questions = []
+        for i in range(num_questions):
+            question = json.loads(json.dumps(pool[(start + i) % len(pool)]))
+            # Shift the numbers in the stem so repeated fixtures stay distinct questions
+            offset = next(self.variant)
+            question['question'] = _INTEGER.sub(lambda m: str(int(m.group()) + offset), question['question'])
+            question['options'] = question['options'][:num_options]
+            questions.append(question)
+        return questions
+
+    def chat_content(self, messages, structured=False):
+        question_type, num_questions, num_options = detect_request(messages)
+        questions = self.build_questions(question_type, num_questions, num_options)
+        if is_lean(messages):
+            questions = [lean_question(question) for question in questions]
+        if structured:
+            with self.lock:
+                self.requests['chat'] += 1
+            return json.dumps({'questions': questions}, ensure_ascii=False), 'stop'
+        style = self._random(lambda rng: rng.choices([s for s, _ in self.styles],
+                                                     weights=[w for _, w in self.styles])[0])
+        serialize = apply_compact_style if is_compact(messages) else apply_style
+        content = self._random(lambda rng: serialize(style, questions, rng))
+        finish_reason = 'length' if style == 'truncated' and num_questions > 1 else 'stop'
+        with self.lock:
+            self.requests['chat'] += 1
+        return content, finish_reason
+
+    def usage(self, messages, content):
+        system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+        prompt_tokens = sum(len(m.get('content') or '') for m in messages) // 4
+        # Like the real prompt cache: prefixes of 1024+ tokens are cached in 128-token steps once seen
+        prefix_tokens = len(system) // 4
+        key = hashlib.sha1(system.encode('utf-8')).hexdigest()
+        with self.lock:
+            seen = key in self.seen_prefixes
+            self.seen_prefixes.add(key)
+        cached = (prefix_tokens // 128) * 128 if seen and prefix_tokens >= 1024 else 0
+        with self.lock:
+            self.tokens['prompt'] += prompt_tokens
+            self.tokens['completion'] += len(content) // 4
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                'total_tokens': prompt_tokens + len(content) // 4,
+                'prompt_tokens_details': {'cached_tokens': cached}}
+
+    def sample_latency(self, distribution):
+        return self._random(distribution.sample)
+
+    def image_url(self):
+        with self.lock:
+            self.requests['images'] += 1
+            number = self.requests['images']
+        return f"https://mock-openai.local/images/{number}.png"
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output readable
+
+        def _json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _rate_limited(self):
+            self._json(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'requests',
+                                       'code': 'rate_limit_exceeded'}}, {'retry-after': '1'})
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/models'):
+                self._json(200, {'object': 'list', 'data': [{'id': 'gpt-5', 'object': 'model', 'created': 0,
+                                                             'owned_by': 'mock'}]})
+            else:
+                self._json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            body = self._read_body()
+            if self.path.endswith('/chat/completions'):
+                self.chat(body)
+            elif self.path.endswith('/images/generations'):
+                self.images(body)
+            else:
+                self._json(404, {'error': {'message': 'Not found'}})
+
+        def chat(self, body):
+            if mock.should_fail():
+                self._rate_limited()
+                return
+            messages = body.get('messages') or []
+            structured = (body.get('response_format') or {}).get('type') == 'json_schema'
+            if structured and body.get('model') in mock.reject_schema_models:
+                self._json(400, {'error': {
+                    'message': "Invalid parameter: 'response_format' of type 'json_schema' is not supported with "
+                               "this model.",
+                    'type': 'invalid_request_error', 'param': 'response_format', 'code': None}})
+                return
+            content, finish_reason = mock.chat_content(messages, structured)
+            usage = mock.usage(messages, content)
+            latency = mock.sample_latency(mock.latency) + usage['completion_tokens'] * mock.ms_per_token / 1000
+            model = body.get('model', 'gpt-5')
+            created = int(time.time())
+            if not body.get('stream'):
+                time.sleep(latency)
+                self._json(200, {
+                    'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': finish_reason}],
+                    'usage': usage
+                })
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            time.sleep(latency * mock.stream_fraction)
+            pieces = [content[i:i + 40] for i in range(0, len(content), 40)] or ['']
+            delay = latency * (1 - mock.stream_fraction) / len(pieces)
+            for i, piece in enumerate(pieces):
+                chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': created,
+                         'model': model, 'choices': [{
+                             'index': 0, 'delta': {'content': piece, **({'role': 'assistant'} if i == 0 else {})},
+                             'finish_reason': finish_reason if i == len(pieces) - 1 else None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(delay)
+            if (body.get('stream_options') or {}).get('include_usage'):
+                chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': created,
+                         'model': model, 'choices': [], 'usage': usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def images(self, body):
+            if mock.should_fail():
+                self._rate_limited()
+                return
+            time.sleep(mock.sample_latency(mock.image_latency))
+            self._json(200, {'created': int(time.time()),
+                             'data': [{'url': mock.image_url(), 'revised_prompt': body.get('prompt', '')[:100]}]})
+
+    return Handler
+
+
+class MockOpenAIServer:
+    """Runs MockOpenAI on a background HTTP server thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, **mock_options):
+        self.mock = MockOpenAI(**mock_options)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.mock))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-openai', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_mock_arguments(parser):
+    parser.add_argument('--latency', default='lognormal:2.0,0.4',
+                        help='Chat completion latency distribution (default: %(default)s)')
+    parser.add_argument('--image-latency', default='lognormal:8,0.3',
+                        help='Image generation latency distribution (default: %(default)s)')
+    parser.add_argument('--ms-per-token', type=float, default=0.0,
+                        help='Extra chat latency per completion token in milliseconds (e.g. 15)')
+    parser.add_argument('--reject-schema-models', default='',
+                        help='Comma-separated models that answer a json_schema response_format with a 400')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible styles and latencies')
+
+
+def mock_options(args):
+    return dict(latency=args.latency, image_latency=args.image_latency, error_rate=args.error_rate, seed=args.seed,
+                ms_per_token=args.ms_per_token,
+                reject_schema_models=[name for name in args.reject_schema_models.split(',') if name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockOpenAIServer(args.host, args.port, **mock_options(args))
+    print(f"Mock OpenAI listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
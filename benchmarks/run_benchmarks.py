@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for question generation, against the local mock OpenAI server.
+
+Each scenario (question type x option count) is run through
+generate_questions_with_gpt directly and/or through POST /api/generate. The
+report has p50/p95/p99 latency, throughput, completion tokens per question
+and traced memory per scenario. No real API calls are made and the response
+cache is off.
+
+  python benchmarks/run_benchmarks.py --output bench.json
+  python benchmarks/run_benchmarks.py --latency fixed:0.2 --iterations 20 --concurrency 4 --baseline bench.json
+
+Compare the compact line format with JSON (--ms-per-token makes latency follow the response length):
+
+  python benchmarks/run_benchmarks.py --ms-per-token 15 --output json.json
+  python benchmarks/run_benchmarks.py --ms-per-token 15 --compact --baseline json.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from mock_openai import MockOpenAIServer, add_mock_arguments, load_fixtures, mock_options  # noqa: E402
+
+QUESTION_TYPE_PARAMS = {'mathematical': 'mathematical', 'word_problem': 'word-problems', 'image_based': 'image-based'}
+
+
+def configure_environment(base_url, state_dir):
+    """Point the app at the mock server and keep its local state out of the repo (before importing it)"""
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ['OPENAI_API_KEY'] = 'mock-benchmark-key'
+    os.environ['STATE_DIR'] = state_dir
+    os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+    # Learned token budgets would make runs depend on earlier runs
+    os.environ['USAGE_STATS_ENABLED'] = 'false'
+    os.environ['TRACE_SAMPLE_RATE'] = '0'
+    os.environ['TRACE_SLOW_MS'] = str(10 ** 12)
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+
+def import_app(state_dir):
+    import app
+    # Never let a developer's .env replace the mock key or base URL
+    app.ENV_FILE = os.path.join(state_dir, 'no.env')
+    return app
+
+
+def base_question_payload(fixtures, question_type, num_options, num_questions, model, lean=False, compact=False,
+                          structured=False):
+    """An /api/generate body whose base question lists num_options lettered options"""
+    sample = fixtures['questions'][question_type][0]
+    option_texts = [option['text'] for option in sample['options']]
+    while len(option_texts) < num_options:
+        option_texts.append(f"{len(option_texts) + 1}0")
+    lines = [sample['question']] + [f"{chr(65 + i)}) {text}" for i, text in enumerate(option_texts[:num_options])]
+    payload = {
+        'baseQuestion': '\n'.join(lines),
+        'numCopyQuestions': num_questions,
+        'model': model,
+        'questionType': QUESTION_TYPE_PARAMS[question_type],
+        'solution': sample['solution'],
+        'noCache': True,
+    }
+    if lean:
+        payload['leanOutput'] = True
+    if compact:
+        payload['compactOutput'] = True
+    if structured:
+        payload['structuredOutput'] = True
+    if question_type == 'image_based':
+        payload['images'] = 'https://example.com/base-question.png'
+    return payload
+
+
+def summarize_latencies(latencies, percentile):
+    if not latencies:
+        return None
+    return {
+        'p50': round(percentile(latencies, 50), 1),
+        'p95': round(percentile(latencies, 95), 1),
+        'p99': round(percentile(latencies, 99), 1),
+        'mean': round(sum(latencies) / len(latencies), 1),
+        'min': round(min(latencies), 1),
+        'max': round(max(latencies), 1),
+    }
+
+
+def run_scenario(call, iterations, concurrency, warmup, trace_memory, completion_tokens=None):
+    """Run call() iterations times with the given concurrency; return timing, memory and token figures
+
+    completion_tokens() reads the mock's running total, so warmup calls are left out of the count.
+    """
+    for _ in range(warmup):
+        call()
+    tokens_before = completion_tokens() if completion_tokens else 0
+
+    latencies, errors, questions = [], [], 0
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+    def timed():
+        start = time.perf_counter()
+        try:
+            returned = call()
+            return (time.perf_counter() - start) * 1000, returned, None
+        except Exception as e:
+            return (time.perf_counter() - start) * 1000, 0, e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed_ms, returned, error in executor.map(lambda _: timed(), range(iterations)):
+            if error is None:
+                latencies.append(elapsed_ms)
+                questions += returned
+            else:
+                errors.append(str(error)[:200])
+    wall = time.perf_counter() - started
+
+    tokens = completion_tokens() - tokens_before if completion_tokens else 0
+
+    memory = {'rss_max_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if trace_memory:
+        memory['traced_peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    return latencies, errors, questions, wall, memory, tokens
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def scenario_key(scenario):
+    return (scenario['mode'], scenario['question_type'], scenario['num_options'], scenario['num_questions'])
+
+
+def print_report(scenarios, baseline=None):
+    previous = {scenario_key(s): s for s in (baseline or {}).get('scenarios', [])}
+    header = (f"{'mode':<7}{'type':<14}{'opts':>5}{'qs':>4}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/s':>8}"
+              f"{'tok/q':>7}{'err':>5}")
+    if previous:
+        header += f"{'Δp50':>9}{'Δp95':>9}{'Δq/s':>9}{'Δtok/q':>9}"
+    print(header)
+    for scenario in scenarios:
+        latency = scenario['latency_ms'] or {'p50': 0, 'p95': 0, 'p99': 0}
+        tokens = scenario.get('completion_tokens_per_question', 0)
+        line = (f"{scenario['mode']:<7}{scenario['question_type']:<14}{scenario['num_options']:>5}"
+                f"{scenario['num_questions']:>4}{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}"
+                f"{scenario['questions_per_second']:>8.2f}{tokens:>7.0f}{scenario['errors']:>5}")
+        old = previous.get(scenario_key(scenario))
+        if old and old['latency_ms'] and scenario['latency_ms']:
+            def change(new, before):
+                return f"{(new - before) / before:+.0%}" if before else 'n/a'
+            line += (f"{change(latency['p50'], old['latency_ms']['p50']):>9}"
+                     f"{change(latency['p95'], old['latency_ms']['p95']):>9}"
+                     f"{change(scenario['questions_per_second'], old['questions_per_second']):>9}"
+                     f"{change(tokens, old.get('completion_tokens_per_question', 0)):>9}")
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['direct', 'http', 'both'], default='both',
+                        help='Call generate_questions_with_gpt, POST /api/generate, or both')
+    parser.add_argument('--types', default='mathematical,word_problem,image_based',
+                        help='Comma-separated question types')
+    parser.add_argument('--options', default='3,4,5', help='Comma-separated option counts')
+    parser.add_argument('--questions', type=int, default=5, help='numCopyQuestions per request')
+    parser.add_argument('--model', default='gpt-4o',
+                        help='Model name sent to the mock (gpt-5 needs an openai client with max_completion_tokens)')
+    parser.add_argument('--iterations', type=int, default=10, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=2, help='Requests in flight per scenario')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed requests before each scenario')
+    parser.add_argument('--lean', action='store_true',
+                        help='Ask for answers only and compute the distractors locally (leanOutput)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Ask for the compact line format instead of JSON (compactOutput)')
+    parser.add_argument('--structured', action='store_true',
+                        help='Send a strict JSON schema (structuredOutput) for models that support it')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc (it slows Python code down)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    add_mock_arguments(parser)
+    parser.set_defaults(latency='lognormal:1.0,0.3', image_latency='lognormal:2.0,0.3')
+    args = parser.parse_args(argv)
+
+    question_types = [t.strip() for t in args.types.split(',') if t.strip()]
+    option_counts = [int(n) for n in args.options.split(',') if n.strip()]
+    modes = ['direct', 'http'] if args.mode == 'both' else [args.mode]
+
+    server = MockOpenAIServer(**mock_options(args)).start()
+    state_dir = tempfile.mkdtemp(prefix='vm-bench-')
+    configure_environment(server.base_url, state_dir)
+    app = import_app(state_dir)
+    from usage_stats import percentile
+
+    fixtures = load_fixtures()
+    client = app.app.test_client()
+    trace_memory = not args.no_memory
+    if trace_memory:
+        tracemalloc.start()
+
+    scenarios = []
+    try:
+        for mode in modes:
+            for question_type in question_types:
+                for num_options in option_counts:
+                    payload = base_question_payload(fixtures, question_type, num_options, args.questions,
+                                                    args.model, args.lean, args.compact, args.structured)
+
+                    if mode == 'direct':
+                        def call(payload=payload):
+                            return len(app.generate_questions_with_gpt(**app.build_generation_kwargs(payload)))
+                    else:
+                        def call(payload=payload):
+                            response = client.post('/api/generate', json=payload)
+                            if response.status_code != 200:
+                                raise Exception(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+                            return len(response.get_json()['questions'])
+
+                    latencies, errors, questions, wall, memory, tokens = run_scenario(
+                        call, args.iterations, args.concurrency, args.warmup, trace_memory,
+                        lambda: server.mock.tokens['completion'])
+                    scenario = {
+                        'mode': mode, 'question_type': question_type, 'num_options': num_options,
+                        'num_questions': args.questions, 'iterations': args.iterations,
+                        'concurrency': args.concurrency, 'errors': len(errors), 'error_samples': errors[:3],
+                        'latency_ms': summarize_latencies(latencies, percentile),
+                        'requests_per_second': round(len(latencies) / wall, 3) if wall else 0,
+                        'questions_per_second': round(questions / wall, 3) if wall else 0,
+                        'questions_returned': questions,
+                        'completion_tokens_per_question': round(tokens / questions, 1) if questions else 0,
+                        'memory': memory,
+                    }
+                    if trace_memory and questions:
+                        scenario['memory']['traced_peak_kb_per_question'] = round(
+                            memory['traced_peak_kb'] / max(1, questions / max(1, len(latencies))), 1)
+                    scenarios.append(scenario)
+                    print(f"{mode} {question_type} options={num_options}: "
+                          f"p50={scenario['latency_ms']['p50'] if scenario['latency_ms'] else 'n/a'} ms, "
+                          f"{scenario['questions_per_second']} questions/s, {len(errors)} errors", file=sys.stderr)
+    finally:
+        server.stop()
+
+    results = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+            'mock_requests': dict(server.mock.requests),
+        },
+        'scenarios': scenarios,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(scenarios, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 1 if any(s['errors'] for s in scenarios) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
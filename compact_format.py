@@ -0,0 +1,170 @@
+"""
+Compact line format for model responses.
+
+The JSON schema repeats "question", "options", "text", "logic", "image" and
+"solution" for every question and option, and the model spends output tokens
+(and time) on every key, quote and brace. In compact mode the prompt asks for
+one tagged line per field instead:
+
+  Q: Tom bought 5 oranges for $3 each. How much did he spend in total?
+  O: $15 | CA
+  O: $8 | Added instead of multiplied
+  I: A basket with 5 oranges and a $3 price tag
+  S: Step 1: Multiply 5 × $3. Step 2: Tom spent $15 in total.
+
+Q starts a question, each O line is an option with its logic after the last
+"|", I is the image description (left out when there is none) and S is the
+solution. In lean output an A line with the answer replaces the O lines.
+CompactQuestionParser expands the lines into the same question dicts the JSON
+parser returns, so validation does not change. A response that starts with
+[ or { anyway is handed to the JSON parser.
+"""
+import os
+import re
+
+import metrics
+from question_parser import IncrementalQuestionParser
+
+COMPACT_OUTPUT_ENABLED = os.getenv('COMPACT_OUTPUT_ENABLED', 'false').lower() not in ('0', 'false', 'no')
+
+FIELDS = {'Q': 'question', 'A': 'answer', 'I': 'image', 'S': 'solution'}
+_TAGGED_LINE = re.compile(r'[ \t]*([QOAIS])[ \t]*:[ \t]?(.*)')
+_NEWLINES = re.compile(r'\s*\n\s*')
+
+
+def _one_line(value):
+    return _NEWLINES.sub(' ', str(value or '')).strip()
+
+
+def encode(questions):
+    """Question dicts in the compact format (the mock server and the wire format benchmark write it)"""
+    lines = []
+    for question in questions:
+        lines.append(f"Q: {_one_line(question.get('question'))}")
+        if 'answer' in question:
+            lines.append(f"A: {_one_line(question['answer'])}")
+        for option in question.get('options') or []:
+            lines.append(f"O: {_one_line(option.get('text'))} | {_one_line(option.get('logic'))}")
+        if question.get('image'):
+            lines.append(f"I: {_one_line(question['image'])}")
+        lines.append(f"S: {_one_line(question.get('solution'))}")
+    return '\n'.join(lines)
+
+
+def parse_option(value):
+    """{"text", "logic"} for an O line's value; the logic follows the last "|" """
+    text, separator, logic = value.rpartition('|')
+    if not separator or not text.strip() or not logic.strip():
+        # No logic ("O: 24"), or an option such as "|-3|" whose bars are part of the text
+        return {'text': value.strip()}
+    return {'text': text.strip(), 'logic': logic.strip()}
+
+
+def extract_questions(text, complete=True):
+    """Return (questions, truncated) for a complete compact response
+
+    When complete is False (the completion hit its token limit) the last question may be cut off
+    partway through a field, so it is dropped and truncated is True.
+    """
+    parser = CompactQuestionParser()
+    questions = parser.feed(text)
+    truncated = not complete and parser.has_partial_object
+    questions += parser.finish(complete)
+    return questions, truncated
+
+
+class CompactQuestionParser:
+    """Feed compact output in chunks and collect question dicts as they complete
+
+    Same interface as IncrementalQuestionParser. A question completes when the next Q line
+    starts, or at finish() for the last one.
+    """
+
+    def __init__(self):
+        self.partial_line = ''
+        self.question = None
+        # Field that an untagged line continues (a solution the model wrapped onto several lines)
+        self.continued_field = None
+        self.seen_tag = False
+        self.json_parser = None
+        self.emitted = 0
+
+    def feed(self, text):
+        """Consume more output and return the list of question dicts completed by it"""
+        if not text:
+            return []
+        if self.json_parser is not None:
+            completed = self.json_parser.feed(text)
+        else:
+            completed = []
+            lines = (self.partial_line + text).split('\n')
+            self.partial_line = lines.pop()
+            for index, line in enumerate(lines):
+                if not self.seen_tag and line.lstrip().startswith(('[', '{')):
+                    completed += self._switch_to_json('\n'.join(lines[index:] + [self.partial_line]))
+                    break
+                self._line(line, completed)
+            else:
+                # An unfinished first line can already show that the response is JSON
+                if not self.seen_tag and self.partial_line.lstrip().startswith(('[', '{')):
+                    completed += self._switch_to_json(self.partial_line)
+        self.emitted += len(completed)
+        return completed
+
+    def finish(self, complete=True):
+        """Questions completed by the end of the response; nothing if it was cut off (complete=False)"""
+        if self.json_parser is not None:
+            return []
+        completed = []
+        if complete:
+            self._line(self.partial_line, completed)
+            self._close(completed)
+        self.partial_line = ''
+        self.question = None
+        self.emitted += len(completed)
+        return completed
+
+    @property
+    def has_partial_object(self):
+        """True if the output so far has a question that has not been completed"""
+        if self.json_parser is not None:
+            return self.json_parser.has_partial_object
+        return self.question is not None or bool(self.partial_line.strip())
+
+    def _switch_to_json(self, text):
+        # The model answered in JSON after all
+        metrics.PARSE_FALLBACKS.labels(strategy='json_in_compact').inc()
+        self.json_parser = IncrementalQuestionParser()
+        self.partial_line = ''
+        return self.json_parser.feed(text)
+
+    def _close(self, completed):
+        if self.question is not None and self.question.get('question'):
+            completed.append(self.question)
+        self.question = None
+
+    def _line(self, line, completed):
+        match = _TAGGED_LINE.match(line)
+        if match is None:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('```'):
+                # Blank lines and code fences end a wrapped field; so prose after the last question is ignored
+                self.continued_field = None
+            elif self.continued_field and self.question is not None:
+                self.question[self.continued_field] += '\n' + stripped
+            return
+        self.seen_tag = True
+        tag, value = match.group(1), match.group(2).strip()
+        self.continued_field = None
+        if tag == 'Q':
+            self._close(completed)
+            self.question = {'question': value}
+            self.continued_field = 'question'
+        elif self.question is None:
+            return  # A stray field before the first question
+        elif tag == 'O':
+            self.question.setdefault('options', []).append(parse_option(value))
+        else:
+            self.question[FIELDS[tag]] = value
+            if tag == 'S':
+                self.continued_field = 'solution'
@@ -0,0 +1,205 @@
+"""
+Curriculum subskills and standards, indexed for per-request lookups.
+
+data/curriculum.json maps curriculum -> grade -> list of subskills. A subskill
+is a plain string, or an object with a standard code
+({"code": "3.OA.A.1", "description": "Interpret products of whole numbers"})
+so full standards datasets can be loaded. The file is indexed once per
+version. Curriculum and grade names resolve through an alias index
+("CA CCSS", "ca_ccss", "ca-ccss"; "K", "Kindergarten", "3", "Grade 3"). The
+prompt's subskill text is built ahead for every (curriculum, grade). Standard
+codes are kept sorted per curriculum so prefix lookups are a binary search.
+
+Extra curriculum names can be listed under "_aliases", e.g.
+{"_aliases": {"CA_CCSS": ["California"]}}. The file is re-read when its
+modification time changes, so edits apply without a restart.
+"""
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+CURRICULUM_FILE = os.getenv('CURRICULUM_FILE',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'curriculum.json'))
+# Seconds between checks of the curriculum file's modification time
+CURRICULUM_RELOAD_SECONDS = float(os.getenv('CURRICULUM_RELOAD_SECONDS', '5'))
+# The prompt lists the first few subskills of the grade, capped in length
+PROMPT_SUBSKILLS = 4
+PROMPT_SUBSKILLS_CHARS = 200
+DEFAULT_SUBSKILLS_TEXT = 'General math concepts'
+ALIASES_KEY = '_aliases'
+
+_NON_ALNUM = re.compile(r'[^A-Z0-9]+')
+_KINDERGARTEN = {'K', 'KG', 'KINDER', 'KINDERGARTEN', 'GRADE_K', '0', 'GRADE_0'}
+_GRADE_NUMBER = re.compile(r'(?:GRADE_?)?0*(\d{1,2})(?:ST|ND|RD|TH)?(?:_?GRADE)?')
+
+
+def normalize_name(name):
+    """'CA CCSS', 'ca_ccss' and 'ca-ccss' all become 'CA_CCSS'"""
+    return _NON_ALNUM.sub('_', str(name).upper()).strip('_')
+
+
+def grade_key(grade):
+    """'K' and 'Kindergarten' become 'Kindergarten'; '3', 'Grade 3', 'grade_3' and '3rd' become 'Grade_3'"""
+    name = normalize_name(grade)
+    if name in _KINDERGARTEN:
+        return 'Kindergarten'
+    match = _GRADE_NUMBER.fullmatch(name)
+    if match:
+        return f"Grade_{int(match.group(1))}"
+    return name
+
+
+class CurriculumIndex:
+    """Lookups built from one version of the curriculum file"""
+
+    def __init__(self, data, mtime=None):
+        self.mtime = mtime
+        self.aliases = {}
+        self.subskills = {}
+        self.subskills_text = {}
+        # Per curriculum: upper-cased codes in sorted order, and the standards in the same order
+        self.codes = {}
+        self.standards = {}
+
+        for curriculum, grades in data.items():
+            if curriculum == ALIASES_KEY or not isinstance(grades, dict):
+                continue
+            self._add_alias(curriculum, curriculum)
+            standards = []
+            for grade, entries in grades.items():
+                key = (curriculum, grade_key(grade))
+                names = []
+                for entry in entries or []:
+                    if isinstance(entry, dict):
+                        code = entry.get('code')
+                        name = entry.get('description') or entry.get('name') or code
+                        if code:
+                            standards.append((str(code).upper(), str(code), name, key[1]))
+                    else:
+                        name = entry
+                    if name:
+                        names.append(str(name))
+                self.subskills[key] = tuple(self.subskills.get(key, ()) + tuple(names))
+            standards.sort()
+            self.codes[curriculum] = [standard[0] for standard in standards]
+            self.standards[curriculum] = standards
+
+        for curriculum, names in (data.get(ALIASES_KEY) or {}).items():
+            if curriculum in self.codes:
+                for name in names:
+                    self._add_alias(name, curriculum)
+
+        for key, names in self.subskills.items():
+            if names:
+                self.subskills_text[key] = ', '.join(names[:PROMPT_SUBSKILLS])[:PROMPT_SUBSKILLS_CHARS]
+
+    def _add_alias(self, name, curriculum):
+        normalized = normalize_name(name)
+        self.aliases.setdefault(normalized, curriculum)
+        # 'COMMONCORE' and 'CommonCore' find COMMON_CORE too
+        self.aliases.setdefault(normalized.replace('_', ''), curriculum)
+
+    def resolve(self, curriculum):
+        """The curriculum's key in the file, or None if it is unknown"""
+        normalized = normalize_name(curriculum)
+        return self.aliases.get(normalized) or self.aliases.get(normalized.replace('_', ''))
+
+    def find_standards(self, curriculum, code_prefix, grade=None, limit=50):
+        key = self.resolve(curriculum)
+        if key is None:
+            return []
+        codes, standards = self.codes[key], self.standards[key]
+        prefix = str(code_prefix).upper()
+        wanted_grade = grade_key(grade) if grade else None
+        found = []
+        for i in range(bisect.bisect_left(codes, prefix), len(codes)):
+            if not codes[i].startswith(prefix) or len(found) >= limit:
+                break
+            _, code, description, standard_grade = standards[i]
+            if wanted_grade is None or standard_grade == wanted_grade:
+                found.append({'code': code, 'description': description, 'grade': standard_grade})
+        return found
+
+
+class CurriculumStore:
+    """The current CurriculumIndex for a file, rebuilt when the file changes"""
+
+    def __init__(self, path=CURRICULUM_FILE, reload_seconds=CURRICULUM_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._index = None
+        self._loaded_mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def index(self):
+        now = time.monotonic()
+        if self._index is not None and now < self._next_check:
+            return self._index
+        with self._lock:
+            # Another thread may have checked the file while we waited
+            if self._index is not None and now < self._next_check:
+                return self._index
+            self._next_check = now + self.reload_seconds
+            mtime = self._file_mtime()
+            if self._index is None or mtime != self._loaded_mtime:
+                self._load(mtime)
+            return self._index
+
+    def _load(self, mtime):
+        first_load = self._index is None
+        self._loaded_mtime = mtime
+        if mtime is None:
+            if first_load:
+                print("Warning: curriculum.json not found. Using empty curriculum data.")
+            self._index = CurriculumIndex({})
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._index = CurriculumIndex(json.load(f), mtime)
+            if not first_load:
+                print(f"DEBUG: Reloaded curriculum data from {self.path}")
+        except (OSError, ValueError) as e:
+            # Keep serving the previous version until the file is fixed
+            print(f"WARNING: Could not load {self.path}: {str(e)}")
+            if first_load:
+                self._index = CurriculumIndex({})
+
+    def subskills(self, curriculum, grade):
+        index = self.index()
+        key = index.resolve(curriculum)
+        return list(index.subskills.get((key, grade_key(grade)), ())) if key else []
+
+    def subskills_text(self, curriculum, grade):
+        """The subskills line for the prompt (first few subskills, capped), or the generic default"""
+        index = self.index()
+        key = index.resolve(curriculum)
+        return index.subskills_text.get((key, grade_key(grade)), DEFAULT_SUBSKILLS_TEXT) if key else DEFAULT_SUBSKILLS_TEXT
+
+    def find_standards(self, curriculum, code_prefix, grade=None, limit=50):
+        """Standards of a curriculum whose code starts with code_prefix (case-insensitive), in code order"""
+        return self.index().find_standards(curriculum, code_prefix, grade=grade, limit=limit)
+
+
+_store = CurriculumStore()
+
+
+def subskills(curriculum, grade):
+    return _store.subskills(curriculum, grade)
+
+
+def subskills_text(curriculum, grade):
+    return _store.subskills_text(curriculum, grade)
+
+
+def find_standards(curriculum, code_prefix, grade=None, limit=50):
+    return _store.find_standards(curriculum, code_prefix, grade=grade, limit=limit)
@@ -0,0 +1,429 @@
+"""
+Rule-based distractors computed from a question's correct answer.
+
+Wrong options for computational questions follow a small set of error models:
+  operation swaps    added instead of multiplied, divided in the wrong order, ...
+  column errors      forgot to carry, subtracted the smaller digit from the larger
+  fraction errors    flipped the fraction, added numerators and denominators
+  unit slips         did not convert centimeters to meters, minutes to hours, ...
+  place value        answer x10 or /10
+  off by one         answer +-1 (in the answer's last place)
+Operation swaps are skipped when the calculation converts units (its operands
+are in another unit than the answer), and candidates more than
+MAX_DISTRACTOR_RATIO times larger or smaller than the answer are dropped.
+The operands and operation come from the calculation in the solution (or
+stem) whose result is the answer, e.g. "Step 2: 96 ÷ 4 = 24". Distractors are
+written in the answer's own format ("$3.75", "1 1/2 cups", "7/8", "1,200").
+
+With these the model only has to write the stem, the answer and the solution
+(lean output), and validate_question can fill missing options with real
+distractors instead of "Option C" placeholders.
+"""
+import os
+import random
+import re
+from fractions import Fraction
+
+# Ask the model for stem, answer and solution only, and compute the options here (requests can override
+# with leanOutput). Applies to mathematical and word problem questions.
+LEAN_OUTPUT_ENABLED = os.getenv('LEAN_OUTPUT_ENABLED', 'false').lower() not in ('0', 'false', 'no')
+
+_ANSWER = re.compile(r"""
+    [ \t]*(?P<sign>[-−])?[ \t]*(?P<prefix>\$?)[ \t]*
+    (?:
+        (?P<whole>\d+)[ \t]+(?P<mixed_numerator>\d+)/(?P<mixed_denominator>\d+)     # 1 1/2
+      | (?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d*\.?\d+)(?:[ \t]*/[ \t]*(?P<denominator>\d+))?   # 1,200  2.5  7/8
+    )
+    (?P<suffix>[ \t]*(?:[A-Za-z%°²³][A-Za-z%°²³.]*(?:[ \t]+[A-Za-z][A-Za-z.]*){0,2})?)[ \t]*   # cm, apples, sq ft
+""", re.VERBOSE)
+
+_OPERAND = r'\$?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:/\d+)?'
+# A single binary calculation such as "96 ÷ 4", "3 × $1.25" or "3/4 + 1/8"
+_BINARY = re.compile(rf'(?<![\w.$/])({_OPERAND})[ \t]*([-+*/×xX÷−–·])[ \t]*({_OPERAND})(?![\w./])')
+_SYMBOLS = {'+': '+', '-': '-', '−': '-', '–': '-', '*': '*', '×': '*', 'x': '*', 'X': '*', '·': '*',
+            '/': '/', '÷': '/'}
+
+# (smaller unit, larger unit, how many smaller units make one larger unit); names are matched as words
+UNIT_CONVERSIONS = [
+    ('mm', 'cm', 10), ('cm', 'm', 100), ('mm', 'm', 1000), ('m', 'km', 1000),
+    ('g', 'kg', 1000), ('mL', 'L', 1000), ('seconds', 'minutes', 60), ('minutes', 'hours', 60),
+    ('inches', 'feet', 12), ('feet', 'yards', 3), ('ounces', 'pounds', 16), ('cents', 'dollars', 100),
+]
+_UNIT_NAMES = {
+    'mm': ('mm', 'millimeter', 'millimeters', 'millimetre', 'millimetres'),
+    'cm': ('cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'),
+    'm': ('m', 'meter', 'meters', 'metre', 'metres'),
+    'km': ('km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'),
+    'g': ('g', 'gram', 'grams'),
+    'kg': ('kg', 'kilogram', 'kilograms'),
+    'mL': ('mL', 'ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+    'L': ('L', 'l', 'liter', 'liters', 'litre', 'litres'),
+    'seconds': ('s', 'sec', 'second', 'seconds'),
+    'minutes': ('min', 'mins', 'minute', 'minutes'),
+    'hours': ('h', 'hr', 'hrs', 'hour', 'hours'),
+    'inches': ('in', 'inch', 'inches'),
+    'feet': ('ft', 'foot', 'feet'),
+    'yards': ('yd', 'yard', 'yards'),
+    'ounces': ('oz', 'ounce', 'ounces'),
+    'pounds': ('lb', 'lbs', 'pound', 'pounds'),
+    'cents': ('c', 'cent', 'cents', '¢'),
+    'dollars': ('dollar', 'dollars'),
+}
+_UNIT_BY_NAME = {name: unit for unit, names in _UNIT_NAMES.items() for name in names}
+_WORD = re.compile(r"[A-Za-z¢]+")
+# Units count as mentioned only right after a number ("12 inches"), so "in" or "m" in prose do not
+_QUANTITY_UNIT = re.compile(r"\d[ \t]*([A-Za-z¢]+)")
+# Unit names of up to 3 letters are abbreviations ("cm", "ft", "min") and are the same for 1 and 2
+_ABBREVIATIONS = frozenset(name for names in _UNIT_NAMES.values() for name in names if len(name) <= 3)
+_IRREGULAR_PLURALS = {'foot': 'feet', 'child': 'children', 'person': 'people', 'mouse': 'mice', 'tooth': 'teeth'}
+_IRREGULAR_SINGULARS = {plural: singular for singular, plural in _IRREGULAR_PLURALS.items()}
+# A distractor further than this factor from the answer is no one's mistake ("2500000 km" for 2.5 km);
+# forgotten unit conversions are exempt, since being off by 1000 is exactly that mistake
+MAX_DISTRACTOR_RATIO = 100
+
+
+def _unit(word):
+    return _UNIT_BY_NAME.get(word) or _UNIT_BY_NAME.get(word.lower())
+
+
+def _singular(word):
+    if word in _IRREGULAR_SINGULARS:
+        return _IRREGULAR_SINGULARS[word]
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _plural(word):
+    if word in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[word]
+    if word.endswith('y') and word[-2:-1] not in ('a', 'e', 'i', 'o', 'u'):
+        return word[:-1] + 'ies'
+    if word.endswith(('ch', 'sh', 's', 'x')):
+        return word + 'es'
+    return word + 's'
+
+
+class AnswerFormat:
+    """A numeric answer text's value and how it is written, so distractors can be written the same way"""
+
+    def __init__(self, match):
+        self.text = match.group()
+        self.prefix = match.group('prefix')
+        self.suffix = match.group('suffix').rstrip()
+        self.thousands = ',' in (match.group('number') or '')
+        if match.group('whole') is not None:
+            self.style = 'mixed'
+            self.value = int(match.group('whole')) + Fraction(int(match.group('mixed_numerator')),
+                                                             int(match.group('mixed_denominator')))
+        elif match.group('denominator') is not None:
+            self.style = 'fraction'
+            self.value = Fraction(match.group('number').replace(',', '')) / int(match.group('denominator'))
+        else:
+            number = match.group('number').replace(',', '')
+            self.places = len(number.split('.')[1]) if '.' in number else 0
+            self.style = 'decimal' if self.places else 'whole'
+            self.value = Fraction(number)
+        if match.group('sign'):
+            self.value = -self.value
+        words = _WORD.findall(self.suffix)
+        self.unit = _unit(words[0]) if words else None
+        if self.unit is None and self.prefix == '$':
+            self.unit = 'dollars'
+        self.noun = self._noun()
+
+    def _noun(self):
+        """(start, end, singular form) of the suffix word that agrees with the number, or None
+
+        The word before "of" in "cups of flour", otherwise the last word ("red apples", "cm").
+        """
+        matches = list(_WORD.finditer(self.suffix))
+        if not matches:
+            return None
+        lowered = [match.group().lower() for match in matches]
+        match = matches[lowered.index('of', 1) - 1] if 'of' in lowered[1:] else matches[-1]
+        word = match.group()
+        if word in _ABBREVIATIONS or not word.isalpha() or not word.islower() or len(word) < 3:
+            return None
+        return match.start(), match.end(), _singular(word)
+
+    def _suffix(self, value):
+        """The answer's suffix with its noun in the number the value takes: 1 cup, 1/2 cup, 2 cups, 1 1/2 cups"""
+        if self.noun is None:
+            return self.suffix
+        start, end, singular = self.noun
+        word = singular if value <= 1 else _plural(singular)
+        return self.suffix[:start] + word + self.suffix[end:]
+
+    def format(self, value):
+        """The value written like the answer, or None if it cannot be (e.g. a fraction for a whole-number answer)"""
+        sign = '-' if value < 0 else ''
+        value = abs(value)
+        if self.style == 'whole':
+            # "2.5 m" for a forgotten km-to-m conversion, but no 1/3 among whole-number options
+            if (value * 100).denominator != 1:
+                return None
+            whole, cents = divmod((value * 100).numerator, 100)
+            number = f"{whole:,}" if self.thousands else str(whole)
+            if cents:
+                number += f".{cents:02d}".rstrip('0')
+        elif self.style == 'decimal':
+            scaled = value * 10 ** self.places
+            if scaled.denominator != 1:
+                return None
+            whole, fraction = divmod(scaled.numerator, 10 ** self.places)
+            number = f"{whole:,}" if self.thousands else str(whole)
+            number += f".{fraction:0{self.places}d}"
+            if self.prefix != '$':
+                # Money keeps its cents; "2.5 hours" vs "90 hours" rather than "90.0 hours"
+                number = number.rstrip('0').rstrip('.')
+        elif value.denominator == 1:
+            number = str(value.numerator)
+        elif self.style == 'mixed' and value > 1:
+            whole, remainder = divmod(value.numerator, value.denominator)
+            number = f"{whole} {remainder}/{value.denominator}"
+        else:
+            number = f"{value.numerator}/{value.denominator}"
+        return f"{sign}{self.prefix}{number}{self._suffix(value)}"
+
+    def unit_step(self):
+        """One unit in the answer's last place: 1, 0.01 for $3.75, 1/8 for 7/8"""
+        if self.style == 'decimal':
+            return Fraction(1, 10 ** self.places)
+        if self.style in ('fraction', 'mixed'):
+            return Fraction(1, self.value.denominator)
+        return Fraction(1)
+
+
+def parse_answer(text):
+    """AnswerFormat for a numeric answer text such as '24', '$3.75', '1 1/2 cups' or '7/8', else None"""
+    match = _ANSWER.fullmatch(str(text))
+    if match is None or match.group('mixed_denominator') == '0' or match.group('denominator') == '0':
+        return None
+    return AnswerFormat(match)
+
+
+def _operand_value(text):
+    text = text.replace('$', '').replace(',', '')
+    numerator, _, denominator = text.partition('/')
+    return Fraction(numerator) / int(denominator) if denominator else Fraction(numerator)
+
+
+def _apply(a, b, operation):
+    if operation == '+':
+        return a + b
+    if operation == '-':
+        return a - b
+    if operation == '*':
+        return a * b
+    return a / b if b else None
+
+
+def find_operation(value, *texts):
+    """(first operand, operation, second operand) of the last binary calculation equal to value in the first
+    text that has one"""
+    for text in texts:
+        found = None
+        for match in _BINARY.finditer(str(text or '')):
+            first, symbol, second = match.groups()
+            if symbol == '/' and match.group() == f"{first}/{second}":
+                # "7/8" is a fraction; "72 / 8" is a division
+                continue
+            operation = _SYMBOLS[symbol]
+            try:
+                result = _apply(_operand_value(first), _operand_value(second), operation)
+            except (ValueError, ZeroDivisionError):
+                continue
+            if result == value:
+                found = (first.replace('$', '').replace(',', ''), operation, second.replace('$', '').replace(',', ''))
+        if found:
+            return found
+    return None
+
+
+def _digits(number):
+    return [int(digit) for digit in reversed(str(number))]
+
+
+def _columnwise(a, b, operation):
+    """Column addition without carrying, or column subtraction of the smaller digit from the larger"""
+    first, second = _digits(a), _digits(b)
+    width = max(len(first), len(second))
+    first += [0] * (width - len(first))
+    second += [0] * (width - len(second))
+    if operation == '+':
+        columns = [(x + y) % 10 for x, y in zip(first, second)]
+    else:
+        columns = [abs(x - y) for x, y in zip(first, second)]
+    return int(''.join(str(digit) for digit in reversed(columns)))
+
+
+def operation_errors(first, operation, second):
+    """(value, logic) for mistakes in one binary calculation; operands are texts such as '96', '2.5' or '3/4'"""
+    a, b = _operand_value(first), _operand_value(second)
+    whole = a.denominator == 1 and b.denominator == 1
+    errors = []
+    if '/' in first and '/' in second and operation in '+-':
+        (n1, d1), (n2, d2) = (map(int, first.split('/')), map(int, second.split('/')))
+        if _apply(d1, d2, operation):
+            errors.append((Fraction(_apply(n1, n2, operation), _apply(d1, d2, operation)),
+                           'Added numerators and denominators' if operation == '+'
+                           else 'Subtracted numerators and denominators'))
+        if d1 != d2:
+            errors.append((Fraction(_apply(n1, n2, operation), max(d1, d2)), 'Did not find a common denominator'))
+    if operation == '+':
+        if whole and a >= 0 and b >= 0 and _columnwise(int(a), int(b), '+') != a + b:
+            errors.append((Fraction(_columnwise(int(a), int(b), '+')), 'Forgot to carry over'))
+        errors.append((a - b, 'Subtracted instead of added'))
+        errors.append((a * b, 'Multiplied instead of added'))
+    elif operation == '-':
+        if whole and a >= b >= 0 and _columnwise(int(a), int(b), '-') != a - b:
+            errors.append((Fraction(_columnwise(int(a), int(b), '-')), 'Subtracted smaller digit from larger'))
+        errors.append((a + b, 'Added instead of subtracted'))
+        errors.append((b - a, 'Subtracted in the wrong order'))
+    elif operation == '*':
+        errors.append((a + b, 'Added instead of multiplied'))
+        if whole and b > 1:
+            errors.append((a * (b - 1), f"Multiplied by {b - 1} instead of {b}"))
+        if '/' in first or '/' in second:
+            errors.append((a / b if b else None, 'Divided instead of multiplied'))
+    elif operation == '/' and b:
+        errors.append((a * b, 'Multiplied instead of divided'))
+        errors.append((a - b, 'Subtracted instead of divided'))
+        if a:
+            errors.append((b / a, 'Divided in the wrong order'))
+    return [(value, logic) for value, logic in errors if value is not None]
+
+
+def _mentioned_units(texts):
+    mentioned = {_unit(word) for text in texts for word in _QUANTITY_UNIT.findall(str(text or ''))}
+    if '$' in ''.join(str(text or '') for text in texts):
+        mentioned.add('dollars')
+    return mentioned
+
+
+def converts_units(answer, operation, *texts):
+    """True if the calculation behind the answer converts from another unit, e.g. "2500 ÷ 1000 = 2.5" for km
+
+    Either an operand is written with a unit other than the answer's ("2500 m"), or the calculation
+    multiplies or divides by the factor between the answer's unit and a unit the question mentions.
+    """
+    if answer.unit is None:
+        return False
+    first, symbol, second = operation
+    for operand in (first, second):
+        pattern = re.compile(rf"(?<![\d.,]){re.escape(operand)}[ \t]*([A-Za-z¢]+)")
+        for text in texts:
+            for word in pattern.findall(str(text or '').replace(',', '')):
+                unit = _unit(word)
+                if unit is not None and unit != answer.unit:
+                    return True
+    if symbol not in '*/':
+        return False
+    mentioned = _mentioned_units(texts)
+    factors = {Fraction(factor) for small, large, factor in UNIT_CONVERSIONS
+               if (answer.unit == small and large in mentioned) or (answer.unit == large and small in mentioned)}
+    return bool(factors & {_operand_value(first), _operand_value(second)})
+
+
+def unit_errors(answer, *texts):
+    """(value, logic) for forgetting a unit conversion the question mentions"""
+    if answer.unit is None:
+        return []
+    mentioned = _mentioned_units(texts)
+    errors = []
+    for small, large, factor in UNIT_CONVERSIONS:
+        if answer.unit == large and small in mentioned:
+            errors.append((answer.value * factor, f"Did not convert {small} to {large}"))
+        elif answer.unit == small and large in mentioned:
+            errors.append((answer.value / factor, f"Did not convert {large} to {small}"))
+    return errors
+
+
+def error_models(answer, operation=None, texts=(), rng=None):
+    """(value, logic) candidates for an AnswerFormat, most specific first"""
+    rng = rng or random.Random()
+    value = answer.value
+    candidates = []
+    # Swapping the operation of a unit conversion mixes units: 2500 × 1000 is not a number of km
+    if operation is not None and not converts_units(answer, operation, *texts):
+        candidates.extend(operation_errors(*operation))
+    candidates.extend(unit_errors(answer, *texts))
+    if answer.style in ('fraction', 'mixed') and value.numerator > 1 and value.denominator > 1:
+        candidates.append((1 / value, 'Flipped numerator and denominator'))
+    if answer.style == 'decimal':
+        candidates.append((value * 10, 'Misplaced the decimal point'))
+        candidates.append((value / 10, 'Misplaced the decimal point'))
+    elif answer.style == 'whole':
+        # Not for fractions: no one writes 15 cups for 1 1/2 cups
+        candidates.append((value * 10, 'Place value error'))
+    step = answer.unit_step()
+    near = [1, -1, 2, -2]
+    rng.shuffle(near)
+    for offset in near + [10, -10, 5, -5, 3, -3]:
+        candidates.append((value + offset * step, 'Off by one' if abs(offset) == 1 else 'Calculation error'))
+    return candidates
+
+
+def plausible(answer_value, value, logic):
+    """Whether a candidate is a mistake someone could make: not 0 for a non-zero answer, nor far off in size"""
+    if value == 0 != answer_value:
+        return False
+    if answer_value == 0 or value == 0 or logic.startswith('Did not convert'):
+        return True
+    ratio = abs(value / answer_value)
+    return 1 / MAX_DISTRACTOR_RATIO <= ratio <= MAX_DISTRACTOR_RATIO
+
+
+def distractor_options(answer, count, stem='', solution='', exclude=(), rng=None):
+    """Up to count distractor options ({"text", "logic"}) for an AnswerFormat, none equal to an excluded option"""
+    operation = find_operation(answer.value, solution, stem)
+    used = {str(text).strip() for text in exclude}
+    used.add(answer.text.strip())
+    # Values count too: "24" and "24.0" are the same option
+    used_values = {parsed.value for parsed in map(parse_answer, exclude) if parsed is not None}
+    used_values.add(answer.value)
+    options = []
+    for value, logic in error_models(answer, operation, (stem, solution), rng):
+        if len(options) >= count:
+            break
+        # A negative wrong answer for a positive question gives itself away
+        if value in used_values or (value < 0 <= answer.value) or not plausible(answer.value, value, logic):
+            continue
+        text = answer.format(value)
+        if text is None or text in used:
+            continue
+        used.add(text)
+        used_values.add(value)
+        options.append({'text': text, 'logic': logic})
+    return options
+
+
+def build_options(answer_text, num_options, stem='', solution='', seed=None):
+    """num_options options with the CA at a random position, or None if the answer is not a number"""
+    answer = parse_answer(answer_text)
+    if answer is None:
+        return None
+    # Seeded by the question so the same question always gets the same options
+    rng = random.Random(seed if seed is not None else f"{stem}\n{answer_text}")
+    options = [{'text': str(answer_text).strip(), 'logic': 'CA'}]
+    options += distractor_options(answer, num_options - 1, stem, solution, rng=rng)
+    if len(options) < num_options:
+        return None
+    rng.shuffle(options)
+    return options
+
+
+def fill_options(options, num_options, stem='', solution=''):
+    """Computed distractors to add to options (whose CA is marked) until there are num_options, possibly fewer"""
+    correct = next((option for option in options if option.get('logic') == 'CA'), None)
+    answer = parse_answer(correct['text']) if correct else None
+    if answer is None:
+        return []
+    return distractor_options(answer, num_options - len(options), stem, solution,
+                              exclude=[option.get('text', '') for option in options],
+                              rng=random.Random(f"{stem}\n{correct['text']}"))
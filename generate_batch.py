@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Offline batch generation for large question banks.
+
+Reads a JSONL file of base questions (one /api/generate request body per line)
+and runs the same prompt building and validation as the web app by calling its
+functions directly, without starting the server.
+
+  # Generate directly, resuming from results.jsonl if it already exists
+  python generate_batch.py run questions.jsonl results.jsonl --concurrency 4 --rpm 60
+
+  # Or use the provider's asynchronous Batch API for large backfills
+  python generate_batch.py build-requests questions.jsonl batch_requests.jsonl
+  python generate_batch.py ingest batch_output.jsonl --input questions.jsonl --output results.jsonl
+
+The results file doubles as the checkpoint: every finished item is appended
+and flushed to disk as one line, and a rerun skips items that already
+succeeded. Failed items are retried on the next run.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from types import SimpleNamespace
+
+import response_schema
+import usage_stats
+from app import (budget_question_type, build_api_params, build_generation_prompts, parse_questions_from_content,
+                 prepare_batch_item, resolve_question_type, run_batch_item, use_lean_output, use_structured_output,
+                 validate_question)
+
+# The provider's Batch API accepts at most this many requests per input file
+BATCH_API_MAX_REQUESTS = 50000
+
+
+class RateLimiter:
+    """Space out calls so no more than `per_minute` start in any minute"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def read_items(path):
+    """Yield (index, item) for each non-empty line of a JSONL file; the index is the line number"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            if line.strip():
+                yield index, json.loads(line)
+
+
+def load_done_indices(path):
+    """Return the indices that already succeeded in an existing results file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from an interrupted run
+            if record.get('status') == 'ok':
+                done.add(record['index'])
+            else:
+                done.discard(record.get('index'))
+    return done
+
+
+class ResultWriter:
+    """Append result records to a JSONL file, durably and from several threads"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a+', encoding='utf-8')
+        self.lock = threading.Lock()
+        # An interrupted run may have left a partial last line; start on a fresh one
+        if self.file.tell() > 0:
+            self.file.seek(self.file.tell() - 1)
+            if self.file.read(1) != '\n':
+                self.file.write('\n')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def batch_defaults(args):
+    defaults = {}
+    if args.model:
+        defaults['model'] = args.model
+    if args.num_questions:
+        defaults['numCopyQuestions'] = args.num_questions
+    return defaults
+
+
+def output_formats(kwargs):
+    """(structured, compact) for an item's request, decided the same way when it is built and when it is ingested"""
+    structured = use_structured_output(kwargs['model'], kwargs['structured_output'])
+    return structured, kwargs['compact_output'] and not structured
+
+
+def run(args):
+    """Generate every pending item with bounded concurrency and rate limiting"""
+    defaults = batch_defaults(args)
+    # One completion per item so --rpm maps directly onto upstream requests
+    defaults.setdefault('chunkSize', 0)
+    # Don't let cached web results stand in for fresh bank content unless asked to
+    if not args.use_cache:
+        defaults.setdefault('noCache', True)
+
+    done = load_done_indices(args.output)
+    if done:
+        print(f"Resuming: {len(done)} items already done in {args.output}")
+
+    limiter = RateLimiter(args.rpm)
+    writer = ResultWriter(args.output)
+    # Bound the number of submitted-but-unfinished items so huge inputs are not all queued at once
+    slots = threading.BoundedSemaphore(args.concurrency * 2)
+    counts = {'ok': 0, 'error': 0}
+    counts_lock = threading.Lock()
+    started = time.monotonic()
+
+    def process(index, item):
+        try:
+            limiter.wait()
+            record = run_batch_item(index, item, defaults)
+            writer.write(record)
+            with counts_lock:
+                counts[record['status']] += 1
+                finished = counts['ok'] + counts['error']
+            if finished % args.progress_every == 0:
+                rate = finished / max(time.monotonic() - started, 1e-9) * 60
+                print(f"{finished} items done ({counts['error']} errors), {rate:.1f} items/min")
+        finally:
+            slots.release()
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    try:
+        for index, item in read_items(args.input):
+            if index in done:
+                continue
+            slots.acquire()
+            executor.submit(process, index, item)
+        executor.shutdown(wait=True)
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished items are saved. Rerun the same command to resume.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    finally:
+        writer.close()
+
+    print(f"Done: {counts['ok']} succeeded, {counts['error']} failed this run")
+    return 1 if counts['error'] else 0
+
+
+def build_requests(args):
+    """Write Batch API request files (one chat completion per item) for every pending item"""
+    defaults = batch_defaults(args)
+    done = load_done_indices(args.skip_done) if args.skip_done else set()
+    base, ext = os.path.splitext(args.requests)
+
+    part, count, out = 1, 0, open(args.requests, 'w', encoding='utf-8')
+    errors = 0
+    try:
+        for index, item in read_items(args.input):
+            if index in done:
+                continue
+            try:
+                data, kwargs = prepare_batch_item(item, defaults)
+            except ValueError as e:
+                print(f"Skipping item {index}: {str(e)}", file=sys.stderr)
+                errors += 1
+                continue
+            structured, compact = output_formats(kwargs)
+            system_prompt, user_prompt = build_generation_prompts(
+                kwargs['base_question'], kwargs['notes'], kwargs['solution'], kwargs['images'],
+                kwargs['image_files'], kwargs['num_options'], kwargs['num_questions'],
+                kwargs['difficulty'], kwargs['grade'], kwargs['curriculum'],
+                question_type_from_url=kwargs['question_type_from_url'], lean_output=kwargs['lean_output'],
+                compact_output=compact, structured_output=structured
+            )
+            question_type = resolve_question_type(kwargs['base_question'], kwargs['notes'],
+                                                  kwargs['question_type_from_url'])
+            lean = use_lean_output(question_type, kwargs['lean_output'])
+            response_format = (response_schema.response_format(kwargs['num_questions'], kwargs['num_options'], lean)
+                               if structured else None)
+            body = build_api_params(kwargs['model'], system_prompt, user_prompt,
+                                    kwargs['num_options'], kwargs['num_questions'],
+                                    question_type=budget_question_type(question_type, lean, compact),
+                                    response_format=response_format)
+            if count == BATCH_API_MAX_REQUESTS:
+                out.close()
+                part += 1
+                count = 0
+                out = open(f"{base}.part{part}{ext}", 'w', encoding='utf-8')
+            out.write(json.dumps({'custom_id': str(index), 'method': 'POST',
+                                  'url': '/v1/chat/completions', 'body': body}) + '\n')
+            count += 1
+    finally:
+        out.close()
+
+    print(f"Wrote {(part - 1) * BATCH_API_MAX_REQUESTS + count} requests to {part} file(s) "
+          f"starting at {args.requests} ({errors} items skipped)")
+    return 1 if errors else 0
+
+
+def ingest(args):
+    """Parse and validate Batch API output files into the results file"""
+    defaults = batch_defaults(args)
+    items = dict(read_items(args.input))
+    done = load_done_indices(args.output)
+    writer = ResultWriter(args.output)
+    counts = {'ok': 0, 'error': 0}
+
+    try:
+        for results_path in args.results:
+            with open(results_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    index = int(entry['custom_id'])
+                    if index in done or index not in items:
+                        continue
+                    record = ingest_entry(index, items[index], entry, defaults)
+                    writer.write(record)
+                    counts[record['status']] += 1
+    finally:
+        writer.close()
+
+    print(f"Ingested {counts['ok']} results ({counts['error']} errors) into {args.output}")
+    return 1 if counts['error'] else 0
+
+
+def ingest_entry(index, item, entry, defaults):
+    """Turn one Batch API output line into a result record, like run_batch_item does"""
+    record = {'index': index}
+    if isinstance(item, dict) and item.get('id') is not None:
+        record['id'] = item['id']
+    try:
+        _, kwargs = prepare_batch_item(item, defaults)
+        response = entry.get('response') or {}
+        if entry.get('error') or response.get('status_code') != 200:
+            raise Exception(f"Batch request failed: {entry.get('error') or response.get('body')}")
+        content = response['body']['choices'][0]['message']['content'] or ''
+        truncated = response['body']['choices'][0].get('finish_reason') == 'length'
+        structured, compact = output_formats(kwargs)
+        questions = []
+        for idx, question in enumerate(parse_questions_from_content(content, compact=compact, complete=not truncated,
+                                                                    structured=structured)):
+            validated = validate_question(question, idx, kwargs['num_options'])
+            if validated is not None:
+                questions.append(validated)
+        if not questions:
+            raise Exception("No valid questions in batch response")
+        # Batch results teach the token budget just like live calls
+        body = response['body']
+        if body.get('usage'):
+            question_type = resolve_question_type(kwargs['base_question'], kwargs['notes'],
+                                                  kwargs['question_type_from_url'])
+            budget_type = budget_question_type(question_type, use_lean_output(question_type, kwargs['lean_output']),
+                                               compact)
+            usage_stats.record_usage(body.get('model') or kwargs['model'], budget_type, kwargs['num_options'],
+                                     len(questions), SimpleNamespace(**body['usage']), truncated)
+        record.update({
+            'status': 'ok',
+            'numOptions': kwargs['num_options'],
+            'questionType': kwargs['question_type_from_url'],
+            'cached': False,
+            'questions': questions[:kwargs['num_questions']]
+        })
+    except Exception as e:
+        record.update({'status': 'error', 'error': str(e)})
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_defaults(sub):
+        sub.add_argument('--model', help='Model for items that do not set one')
+        sub.add_argument('--num-questions', type=int, help='numCopyQuestions for items that do not set one')
+
+    run_parser = subparsers.add_parser('run', help='Generate questions directly against the API')
+    run_parser.add_argument('input', help='JSONL file of base questions')
+    run_parser.add_argument('output', help='JSONL results file (also used to resume)')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='Items generated at the same time')
+    run_parser.add_argument('--rpm', type=float, default=60, help='Maximum items started per minute (0 = unlimited)')
+    run_parser.add_argument('--use-cache', action='store_true', help='Serve repeats from the response cache')
+    run_parser.add_argument('--progress-every', type=int, default=10)
+    add_defaults(run_parser)
+    run_parser.set_defaults(func=run)
+
+    build_parser = subparsers.add_parser('build-requests', help='Write Batch API request files')
+    build_parser.add_argument('input', help='JSONL file of base questions')
+    build_parser.add_argument('requests', help='Batch API input file to write')
+    build_parser.add_argument('--skip-done', metavar='RESULTS', help='Leave out items that succeeded in this results file')
+    add_defaults(build_parser)
+    build_parser.set_defaults(func=build_requests)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Validate Batch API output into a results file')
+    ingest_parser.add_argument('results', nargs='+', help='Batch API output file(s)')
+    ingest_parser.add_argument('--input', required=True, help='The JSONL file the requests were built from')
+    ingest_parser.add_argument('--output', required=True, help='JSONL results file to append to')
+    add_defaults(ingest_parser)
+    ingest_parser.set_defaults(func=ingest)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
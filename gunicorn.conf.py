@@ -0,0 +1,38 @@
+# Gunicorn settings, loaded automatically by the Procfile command (gunicorn app:app)
+import glob
+import os
+
+from storage import STATE_DIR
+
+# Threaded workers keep heartbeating while a request runs, so long streaming responses
+# (/api/generate/stream, /api/generate/batch) are not killed by the worker timeout
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Generations are handled by background jobs, but /api/generate still blocks for the whole call
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+
+# Workers write Prometheus samples here so /metrics can sum them across processes.
+# Set before any worker imports prometheus_client.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(STATE_DIR, 'prometheus'))
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this run's totals
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+
+def post_worker_init(worker):
+    from app import get_job_runner, warm_openai_client
+    # Open the OpenAI connection pool before the first request reaches this worker
+    warm_openai_client()
+    # Start this worker's background job threads so queued jobs run even before anyone polls
+    get_job_runner()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
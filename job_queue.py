@@ -0,0 +1,251 @@
+"""
+Persistent background job queue for long-running generations.
+
+Jobs are stored in SQLite under STATE_DIR, so their status and results survive
+worker restarts and can be read from any gunicorn worker. Each worker process
+runs a few background threads that claim queued jobs; a job whose worker died
+(no heartbeat for JOB_STALE_SECONDS) is put back in the queue.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from storage import connect, state_path
+
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', '2'))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1.0'))
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '15'))
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    questions TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+)
+"""
+
+
+class JobStore:
+    """SQLite-backed job records shared by all worker processes on the host"""
+
+    def __init__(self, path=None):
+        self.path = path or state_path('jobs.sqlite3')
+        conn = self._connect()
+        try:
+            conn.execute(_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return connect(self.path)
+
+    def enqueue(self, payload):
+        """Add a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(payload), now, now)
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it doesn't exist"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['questions'] = json.loads(job['questions'])
+        return job
+
+    def claim_next(self, worker_id):
+        """Atomically mark the oldest runnable job as running and return it, or None"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs left running by a worker that stopped heartbeating are retried
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', questions = '[]', updated_at = ? "
+                    "WHERE status = 'running' AND heartbeat_at < ? AND attempts < ?",
+                    (now, now - JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Job was interrupted too many times', "
+                    "finished_at = ?, updated_at = ? WHERE status = 'running' AND heartbeat_at < ?",
+                    (now, now, now - JOB_STALE_SECONDS)
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                        "started_at = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                        (worker_id, now, now, now, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        return self.get(row['id']) if row is not None else None
+
+    def add_question(self, job_id, question):
+        """Append a finished question to a running job so pollers see partial results"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET questions = json_insert(questions, '$[#]', json(?)), "
+                "heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(question), now, now, job_id)
+            )
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                             [(now, job_id) for job_id in job_ids])
+        finally:
+            conn.close()
+
+    def finish(self, job_id, questions=None):
+        """Mark a job as succeeded, optionally replacing its questions with the final list"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            if questions is None:
+                conn.execute("UPDATE jobs SET status = 'succeeded', finished_at = ?, updated_at = ? WHERE id = ?",
+                             (now, now, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = 'succeeded', questions = ?, finished_at = ?, updated_at = ? "
+                             "WHERE id = ?", (json.dumps(questions), now, now, job_id))
+        finally:
+            conn.close()
+
+    def fail(self, job_id, error):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                         (str(error), now, now, job_id))
+        finally:
+            conn.close()
+
+    def purge(self, older_than_seconds=JOB_RETENTION_SECONDS):
+        """Delete finished jobs older than the retention period"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                         (time.time() - older_than_seconds,))
+        finally:
+            conn.close()
+
+
+class JobRunner:
+    """Background threads in this worker process that execute queued jobs
+
+    handler(job, store) runs one job. It may call store.add_question() as results
+    arrive and must return the final question list (or None to keep the ones added).
+    """
+
+    def __init__(self, store, handler, num_threads=JOB_WORKER_THREADS):
+        self.store = store
+        self.handler = handler
+        self.num_threads = num_threads
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.wakeup = threading.Event()
+        self.active_jobs = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Start the worker and heartbeat threads (idempotent, and safe after fork)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.num_threads):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+
+    def notify(self):
+        """Wake an idle worker thread after a job was enqueued from this process"""
+        self.wakeup.set()
+
+    def _work(self):
+        last_purge = 0
+        while True:
+            try:
+                job = self.store.claim_next(self.worker_id)
+            except Exception as e:
+                print(f"WARNING: Could not claim job: {str(e)}")
+                job = None
+            if job is None:
+                # Other processes enqueue too, so poll even without a local wakeup
+                self.wakeup.wait(JOB_POLL_SECONDS)
+                self.wakeup.clear()
+                if time.time() - last_purge > 3600:
+                    last_purge = time.time()
+                    try:
+                        self.store.purge()
+                    except Exception as e:
+                        print(f"WARNING: Could not purge old jobs: {str(e)}")
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+        with self._lock:
+            self.active_jobs.add(job_id)
+        try:
+            questions = self.handler(job, self.store)
+            self.store.finish(job_id, questions)
+        except Exception as e:
+            print(f"WARNING: Job {job_id} failed: {str(e)}")
+            self.store.fail(job_id, e)
+        finally:
+            with self._lock:
+                self.active_jobs.discard(job_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                job_ids = list(self.active_jobs)
+            try:
+                self.store.heartbeat(job_ids)
+            except Exception as e:
+                print(f"WARNING: Job heartbeat failed: {str(e)}")
@@ -0,0 +1,103 @@
+"""
+Prometheus metrics for the generation pipeline.
+
+prometheus_client is optional: without it every metric is a no-op and
+/metrics answers 503. Under gunicorn, set PROMETHEUS_MULTIPROC_DIR
+(gunicorn.conf.py defaults it to STATE_DIR/prometheus) so each worker writes
+its samples to shared files and /metrics reports the total across workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+# Stage latencies range from sub-millisecond parsing to minute-long completions
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client is not installed"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+STAGE_SECONDS = _metric(
+    'Histogram', 'question_generation_stage_seconds',
+    'Time spent in each stage of question generation '
+    '(prompt_build, chat_completion, json_extraction, validation, answer_check, deduplication, '
+    'local_arithmetic, image_generation)',
+    ['stage'], buckets=STAGE_BUCKETS
+)
+TOKENS = _metric('Counter', 'openai_tokens_total', 'Tokens used by chat completions',
+                 ['model', 'direction'])
+TRUNCATIONS = _metric('Counter', 'openai_truncated_responses_total',
+                      'Completions that stopped at the token limit (finish_reason == "length")', ['model'])
+OPTION_PADDING = _metric('Counter', 'question_option_padding_total',
+                         'Questions that came back with too few options '
+                         '(filled with computed distractors, or placeholders for non-numeric answers)')
+PARSE_FALLBACKS = _metric('Counter', 'question_parse_fallbacks_total',
+                          'Response fragments that needed a fallback to parse, by strategy', ['strategy'])
+CACHE_LOOKUPS = _metric('Counter', 'response_cache_lookups_total', 'Response cache lookups by result', ['result'])
+NEAR_DUPLICATES = _metric('Counter', 'question_near_duplicates_total',
+                          'Generated questions dropped as near-duplicates, by what they duplicated', ['source'])
+ANSWER_KEY_CHECKS = _metric('Counter', 'question_answer_key_checks_total',
+                            'Answer keys checked by computing the answer, by result '
+                            '(verified, corrected, mismatch, ambiguous, unchecked)', ['result'])
+
+
+@contextmanager
+def stage_timer(stage):
+    """Record how long the with-block takes as one observation for `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_usage(model, usage):
+    """Count prompt and completion tokens from a completion's usage object"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if prompt_tokens:
+        TOKENS.labels(model=model, direction='prompt').inc(prompt_tokens)
+    if completion_tokens:
+        TOKENS.labels(model=model, direction='completion').inc(completion_tokens)
+
+
+def render():
+    """Return (body, content_type) for the /metrics endpoint, or None without prometheus_client"""
+    if prometheus_client is None:
+        return None
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Clean up a dead worker's live-gauge files (gunicorn child_exit hook)"""
+    if prometheus_client is not None and os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,231 @@
+"""
+Near-duplicate detection for generated questions.
+
+The model often returns copy questions that differ only by a name. Each stem is
+normalized: capitalized words such as names, and pronouns, become
+placeholders, and numbers are kept in canonical form. The normalized stem is
+cut into word shingles and MinHashed. LSH banding finds candidate pairs in
+constant time per question. The candidates are then confirmed with the exact
+Jaccard similarity of their shingle sets, and only count as duplicates if they
+use the same numbers: copy questions are asked to change only the numbers, so
+"Round 3,456 ..." and "Round 7,812 ..." are different questions however
+similar their words are.
+
+A DuplicateIndex checks a batch against itself. With NEAR_DUPLICATE_HISTORY it
+also checks against questions previously generated for the same base question,
+which are kept in SQLite.
+"""
+import hashlib
+import os
+import random
+import re
+import time
+from array import array
+
+import metrics
+from storage import connect, state_path
+
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+# Shingle-set Jaccard similarity at which two stems count as the same question
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+# Also reject questions generated before for the same base question
+NEAR_DUPLICATE_HISTORY = os.getenv('NEAR_DUPLICATE_HISTORY', 'false').lower() not in ('0', 'false', 'no')
+# Previous questions kept per base question
+NEAR_DUPLICATE_HISTORY_SIZE = int(os.getenv('NEAR_DUPLICATE_HISTORY_SIZE', '500'))
+
+SHINGLE_SIZE = 3
+# 8 bands of 4 rows: pairs at the 0.8 threshold become candidates with ~98% probability
+NUM_BANDS = 8
+ROWS_PER_BAND = 4
+# One random mask per signature slot: min(hash ^ mask) stands in for a random permutation, and XOR over
+# map() keeps signing in C. Seeded so signatures stored in history stay comparable across processes.
+_rng = random.Random(20240611)
+_MASKS = [_rng.getrandbits(64) for _ in range(NUM_BANDS * ROWS_PER_BAND)]
+
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+")
+# Pronouns follow the name, so "Maya ... she" and "Leo ... he" normalize alike
+_PRONOUNS = frozenset({'he', 'she', 'they', 'him', 'her', 'them', 'his', 'hers', 'their', 'theirs',
+                       'himself', 'herself', 'themselves'})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    base_key TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS question_history_base ON question_history (base_key, id);
+"""
+_schema_ready = False
+
+
+def _canonical_number(token):
+    token = token.replace(',', '')
+    if '.' in token:
+        token = token.rstrip('0').rstrip('.')
+    return token.lstrip('0') or '0'
+
+
+def stem_tokens(stem):
+    """Word tokens of a stem: names (capitalized words) and pronouns as placeholders, numbers canonical"""
+    tokens = []
+    for token in _TOKEN.findall(stem):
+        if token[0].isdigit():
+            tokens.append(_canonical_number(token))
+        elif token[0].isupper():
+            tokens.append('<cap>')
+        elif token in _PRONOUNS:
+            tokens.append('<pronoun>')
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def stem_numbers(stem):
+    """Canonical numbers of a stem, sorted, so stems with the same numbers in any order compare equal"""
+    return tuple(sorted(token for token in stem_tokens(stem) if token[0].isdigit()))
+
+
+def shingles(stem):
+    """Hashed word shingles of the normalized stem (the whole stem if it is shorter than one shingle)"""
+    tokens = stem_tokens(stem)
+    if len(tokens) <= SHINGLE_SIZE:
+        grams = [' '.join(tokens)]
+    else:
+        grams = [' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    return {int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little')
+            for gram in grams}
+
+
+def minhash(shingle_set):
+    return [min(map(mask.__xor__, shingle_set)) for mask in _MASKS]
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _band_keys(signature):
+    return [(band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])) for band in range(NUM_BANDS)]
+
+
+def base_key(base_question):
+    normalized = ' '.join(str(base_question).lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class DuplicateIndex:
+    """Stems accepted so far; add() rejects exact and near duplicates of them"""
+
+    def __init__(self, base_question=None, threshold=NEAR_DUPLICATE_THRESHOLD, enabled=NEAR_DUPLICATE_ENABLED,
+                 history=NEAR_DUPLICATE_HISTORY):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.base_key = base_key(base_question) if history and base_question else None
+        self.exact = set()
+        self.entries = []
+        self.buckets = {}
+        self.dropped = {'batch': 0, 'history': 0}
+        self._new = []
+        if enabled and self.base_key:
+            self._load_history()
+
+    def _insert(self, stem, shingle_set, signature, source):
+        entry_id = len(self.entries)
+        self.entries.append((stem, shingle_set, stem_numbers(stem), source))
+        for key in _band_keys(signature):
+            self.buckets.setdefault(key, []).append(entry_id)
+
+    def _match(self, shingle_set, signature, numbers):
+        """Source ('batch' or 'history') of an indexed stem with the same numbers and similar words, or None"""
+        checked = set()
+        for key in _band_keys(signature):
+            for entry_id in self.buckets.get(key, ()):
+                if entry_id in checked:
+                    continue
+                checked.add(entry_id)
+                stem, other, other_numbers, source = self.entries[entry_id]
+                if other_numbers != numbers:
+                    continue
+                if other is None:
+                    # History entries get their shingles only when they are a candidate
+                    other = shingles(stem)
+                    self.entries[entry_id] = (stem, other, other_numbers, source)
+                if jaccard(shingle_set, other) >= self.threshold:
+                    return source
+        return None
+
+    def add(self, stem):
+        """Index the stem and return True, or return False if it duplicates one already indexed"""
+        exact_key = ' '.join(str(stem).lower().split())
+        if exact_key in self.exact:
+            self.dropped['batch'] += 1
+            metrics.NEAR_DUPLICATES.labels(source='batch').inc()
+            return False
+        if self.enabled:
+            shingle_set = shingles(str(stem))
+            signature = minhash(shingle_set)
+            source = self._match(shingle_set, signature, stem_numbers(str(stem)))
+            if source is not None:
+                self.dropped[source] += 1
+                metrics.NEAR_DUPLICATES.labels(source=source).inc()
+                return False
+            self._insert(stem, shingle_set, signature, 'batch')
+            self._new.append((stem, signature))
+        self.exact.add(exact_key)
+        return True
+
+    def filter(self, questions):
+        """The questions whose stems are not duplicates, in order"""
+        return [question for question in questions if self.add(question['question'])]
+
+    def _load_history(self):
+        try:
+            conn = _connect()
+            try:
+                rows = conn.execute(
+                    'SELECT stem, signature FROM question_history WHERE base_key = ? ORDER BY id DESC LIMIT ?',
+                    (self.base_key, NEAR_DUPLICATE_HISTORY_SIZE)
+                ).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"WARNING: Could not load question history: {str(e)}")
+            return
+        for row in rows:
+            self._insert(row['stem'], None, list(array('Q', row['signature'])), 'history')
+
+    def remember(self):
+        """Store the stems accepted by this index as history for the base question"""
+        if not (self.enabled and self.base_key and self._new):
+            return
+        now = time.time()
+        try:
+            conn = _connect()
+            try:
+                conn.executemany(
+                    'INSERT INTO question_history (base_key, stem, signature, created_at) VALUES (?, ?, ?, ?)',
+                    [(self.base_key, stem, array('Q', signature).tobytes(), now) for stem, signature in self._new]
+                )
+                conn.execute(
+                    'DELETE FROM question_history WHERE base_key = ? AND id NOT IN '
+                    '(SELECT id FROM question_history WHERE base_key = ? ORDER BY id DESC LIMIT ?)',
+                    (self.base_key, self.base_key, NEAR_DUPLICATE_HISTORY_SIZE)
+                )
+            finally:
+                conn.close()
+            self._new = []
+        except Exception as e:
+            print(f"WARNING: Could not store question history: {str(e)}")
+
+
+def _connect():
+    global _schema_ready
+    conn = connect(state_path('question_history.sqlite3'))
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
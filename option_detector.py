@@ -0,0 +1,119 @@
+"""
+Detects the answer options listed in a pasted base question.
+
+One precompiled pattern finds every option marker (A) a. (B) 1) Option C: ...)
+in a single scan. Markers only count as part of a run: consecutive values in
+the same style, each at the start of a line or on the same line as the
+previous marker (e.g. "A) 3   B) 4   C) 5"). A run must also start at a line
+start, or be an inline block that follows the end of a sentence and runs to
+the end of its line ("Which is larger? A) 3 B) 4"), whatever comes on the
+lines after it. So a sentence-initial "I. " or
+"Plan A. costs $5 and Plan B. costs $7" inside a stem does not inflate the
+count. Lettered runs win over numbered ones, since numbered lists in stems are
+usually steps.
+"""
+import functools
+import re
+
+MIN_OPTIONS = 2
+MAX_OPTIONS = 10
+
+# Starting with a whitespace character class lets the regex engine skip quickly to candidate
+# positions; detect_options scans '\n' + text so a marker at the very start still matches
+_MARKER = re.compile(r"""
+    [\n \t](?:[ \t]*[-*•])?[ \t]*                        # line start (optionally bulleted) or a space
+    (?P<marker>
+        \((?:[A-Za-z]|\d{1,2})\)                           # (A)  (a)  (1)
+      | (?i:option|choice)[ \t]+(?:[A-Za-z]|\d{1,2})(?![A-Za-z\d])[:.)\-]?   # Option A:
+      | (?:[A-Za-z]|\d{1,2})(?:\)|[.:](?=[ \t]))            # A)  A.  a:  1)  1.
+    )
+    (?=[ \t]*\S)                                         # followed by text on the same line
+""", re.VERBOSE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+# What may come right before an inline options block on its line: the end of the question sentence
+_SENTENCE_END = ('?', '.', ':', '!')
+
+
+def _is_options_block(scan, markers):
+    """True if a run starts at a line start, or is an inline block after the end of a sentence on its line
+
+    The run always extends to the end of its last marker's line, so an inline block ends its own line
+    even when more lines ("Show your work.") follow.
+    """
+    first = markers[0].start()
+    if scan[first] == '\n':
+        return True
+    line_start = scan.rfind('\n', 0, first) + 1
+    return scan[line_start:first].rstrip().endswith(_SENTENCE_END)
+
+
+@functools.lru_cache(maxsize=1024)
+def _marker_style(marker):
+    """Return (style, value) for marker text such as 'A)', '(b)', '3.' or 'Option C:'"""
+    if marker[0] == '(':
+        token, template = marker[1:-1], '({})'
+    elif marker[:6].lower() in ('option', 'choice'):
+        word, token = marker.split()[:2]
+        # "Option A", "option a" and "Option A:" are one style
+        token, template = token.rstrip(':.)-').upper(), word.capitalize() + ' {}'
+    else:
+        token, template = marker[:-1], '{}' + marker[-1]
+    if token.isdigit():
+        return template.format('1'), int(token)
+    return template.format('A' if token.isupper() else 'a'), ord(token.upper()) - ord('A') + 1
+
+
+def detect_options(text):
+    """
+    Find the answer options in a question's text.
+
+    Returns None when there is no run of MIN_OPTIONS..MAX_OPTIONS options, otherwise a dict with
+    count, options (the option texts), style (e.g. 'A)', '(a)', '1.', 'Option A') and start/end,
+    the character range of the options block (end is the end of the last option's line).
+    """
+    if not text:
+        return None
+    scan = '\n' + text
+    open_runs = {}
+    runs = []
+    for match in _MARKER.finditer(scan):
+        style, value = _marker_style(match.group('marker'))
+        run = open_runs.get(style)
+        if (run is not None and value == len(run) + 1
+                and (scan[match.start()] == '\n' or scan.find('\n', run[-1].end(), match.start()) == -1)):
+            run.append(match)
+        elif value == 1:
+            run = open_runs[style] = [match]
+            runs.append((style, run))
+
+    candidates = [(style, run) for style, run in runs
+                  if MIN_OPTIONS <= len(run) <= MAX_OPTIONS and _is_options_block(scan, run)]
+    if not candidates:
+        return None
+    # Lettered over numbered, then the longest run, then the one closest to the end of the text
+    style, markers = max(candidates, key=lambda candidate: ('1' not in candidate[0], len(candidate[1]),
+                                                            candidate[1][0].start()))
+
+    end = scan.find('\n', markers[-1].end())
+    end = len(scan) if end == -1 else end
+    boundaries = [marker.start() for marker in markers[1:]] + [end]
+    options = [_WHITESPACE.sub(' ', scan[marker.end():boundary]).strip()
+               for marker, boundary in zip(markers, boundaries)]
+    return {
+        'count': len(markers),
+        'options': options,
+        'style': style,
+        # Offsets into text: the first marker's line start or preceding space, and the end of the last line
+        'start': markers[0].start(),
+        'end': end - 1,
+    }
+
+
+def split_options(text):
+    """Return (stem, options) when the text ends with its options block, else (text, None)"""
+    detected = detect_options(text)
+    if detected is None or text[detected['end']:].strip():
+        return text, None
+    return text[:detected['start']].rstrip(), detected['options']
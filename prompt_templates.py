@@ -0,0 +1,480 @@
+"""
+Static prompt templates for copy question generation.
+
+Providers cache prompt prefixes they have seen recently, which cuts input cost
+and time to first token, but only for a byte-identical prefix. Everything here
+is therefore fixed text built once at import: the instructions for each
+question type never mention the question count, option count, base question
+or notes. Those values go in the short request section that
+build_generation_prompts() appends after the template.
+"""
+
+SYSTEM_PROMPT = """You are an expert educational content generator specializing in creating mathematical questions aligned with US curricula standards.
+You generate high-quality, pedagogically sound multiple-choice questions that test specific skills and concepts.
+
+CRITICAL: When generating copy questions, you MUST:
+1. Preserve the EXACT format and structure of the base question
+2. Keep the SAME wording, phrasing, and style as the base question
+3. Maintain the SAME question type and presentation style
+4. Only change the numbers (for mathematical) or context (for word problems)
+5. Match the base question's punctuation, capitalization, and formatting exactly
+
+The REQUEST section at the end of the user message gives the base question, how many copy questions to generate (QUESTIONS TO GENERATE) and how many options each must have (OPTIONS PER QUESTION). Follow the instructions below for every request."""
+
+# Concise instructions for mathematical questions - much shorter for faster generation
+_MATHEMATICAL_RULES = """Rules:
+- Keep EXACTLY the SAME phrasing and structure, change ONLY the numbers
+- Each question MUST have EXACTLY the number of options given in the request (same as base question)
+- ONE option per question must be marked "CA" (Correct Answer)
+- Incorrect options logic must be SHORT (3-6 words) based on student errors
+- Examples: "CA", "Added instead of multiplied", "Forgot to carry over\""""
+MATHEMATICAL_INSTRUCTIONS = _MATHEMATICAL_RULES + """
+Return JSON array: [{"question": "...", "options": [{"text": "...", "logic": "..."}, ...], "image": "", "solution": "..."}, ...]
+Your response must start with [ and end with ]."""
+
+# Lean output: the model writes only the correct answer and the options are computed by distractors.py
+_LEAN_MATHEMATICAL_RULES = """Rules:
+- Keep EXACTLY the SAME phrasing and structure, change ONLY the numbers
+- Do NOT write answer options. Give only the correct answer, written like the base question's options (same units, $ sign, fraction, mixed number or decimal style)"""
+LEAN_MATHEMATICAL_INSTRUCTIONS = _LEAN_MATHEMATICAL_RULES + """
+Return JSON array: [{"question": "...", "answer": "...", "image": "", "solution": "..."}, ...]
+Your response must start with [ and end with ]."""
+
+_LEAN_RULES = """LEAN OUTPUT (overrides every instruction above about options, option logic and distractors):
+- Do NOT write answer options or option logic. The options are generated from your answer.
+- Give only the correct answer in "answer", written like the base question's options (same units, $ sign, fraction, mixed number or decimal style). The answer must be a number, optionally with a unit.
+- Each object has exactly the fields "question", "answer", "image" and "solution".
+
+Your response must be ONLY a JSON array starting with [ and ending with ], e.g.
+[{"question": "Tom bought 5 oranges for $3 each. How much did he spend in total?", "answer": "$15", "image": "", "solution": "Step 1: Multiply 5 oranges × $3 each. Step 2: 5 × 3 = 15. Step 3: Tom spent $15 in total."}]
+No markdown, no text before [ or after ]."""
+
+# Compact output: tagged lines instead of JSON, decoded by compact_format.py
+_COMPACT_FORMAT = """COMPACT OUTPUT FORMAT (overrides every instruction above about JSON, brackets and the response format):
+Do NOT write JSON. Write each question as tagged lines, one field per line:
+Q: the question text
+O: option text | logic   (one line per option; logic is "CA" for the correct answer, otherwise the student error in 3-6 words)
+I: a short image description (leave this line out when no image is needed)
+S: the whole solution on one line
+Start each question with its own Q: line and return EXACTLY the number of questions in QUESTIONS TO GENERATE. No markdown, no numbering, no text before the first Q: or after the last S:.
+
+Example:
+Q: Tom bought 5 oranges for $3 each. How much did he spend in total?
+O: $15 | CA
+O: $8 | Added instead of multiplied
+O: $2 | Subtracted instead of multiplied
+O: $150 | Place value error
+S: Step 1: Multiply 5 oranges × $3 each. Step 2: 5 × 3 = 15. Step 3: Tom spent $15 in total."""
+
+_LEAN_COMPACT_FORMAT = """LEAN COMPACT OUTPUT (overrides every instruction above about options, option logic, distractors, JSON and the response format):
+Do NOT write answer options or JSON. The options are generated from your answer. Write each question as tagged lines, one field per line:
+Q: the question text
+A: the correct answer, written like the base question's options (same units, $ sign, fraction, mixed number or decimal style); a number, optionally with a unit
+I: a short image description (leave this line out when no image is needed)
+S: the whole solution on one line
+Start each question with its own Q: line and return EXACTLY the number of questions in QUESTIONS TO GENERATE. No markdown, no numbering, no text before the first Q: or after the last S:.
+
+Example:
+Q: Tom bought 5 oranges for $3 each. How much did he spend in total?
+A: $15
+S: Step 1: Multiply 5 oranges × $3 each. Step 2: 5 × 3 = 15. Step 3: Tom spent $15 in total."""
+
+# Structured output: the API enforces the JSON schema in response_schema.py, so only its meaning is described
+_STRUCTURED_FORMAT = """RESPONSE FORMAT: your response is checked against a JSON schema: {"questions": [...]} with exactly the number of questions in QUESTIONS TO GENERATE. Each question has "question", "options" (exactly OPTIONS PER QUESTION objects with "text" and "logic"; the correct option's logic is "CA"), "image" (a short image description, or "" when no image is needed) and "solution"."""
+
+_LEAN_STRUCTURED_FORMAT = """LEAN OUTPUT (overrides every instruction above about options, option logic and distractors):
+Do NOT write answer options. The options are generated from your answer.
+RESPONSE FORMAT: your response is checked against a JSON schema: {"questions": [...]} with exactly the number of questions in QUESTIONS TO GENERATE. Each question has "question", "answer" (the correct answer written like the base question's options: same units, $ sign, fraction, mixed number or decimal style; a number, optionally with a unit), "image" (a short image description, or "" when no image is needed) and "solution"."""
+
+_COUNT_REQUIREMENT = f"""{'=' * 80}
+⚠️⚠️⚠️ CRITICAL: YOU MUST GENERATE EXACTLY THE NUMBER OF QUESTIONS IN "QUESTIONS TO GENERATE" ⚠️⚠️⚠️
+{'=' * 80}
+If QUESTIONS TO GENERATE is 5, return 5 question objects.
+If QUESTIONS TO GENERATE is 3, return 3 question objects.
+DO NOT return only 1 question. DO NOT return fewer than requested.
+FAILURE TO RETURN THE REQUESTED NUMBER OF QUESTIONS WILL CAUSE AN ERROR.
+
+🔥 YOUR RESPONSE MUST START WITH [ AND END WITH ] 🔥
+🔥 DO NOT START WITH {{ OR RETURN A SINGLE OBJECT 🔥
+🔥 YOU MUST RETURN AN ARRAY: [{{...}}, {{...}}, ...] 🔥
+{'=' * 80}"""
+
+_GENERAL_INSTRUCTIONS = """CRITICAL: The BASE QUESTION in the REQUEST section is the question you must create variations of. DO NOT create questions about different topics or concepts. ALL copy questions must be DIRECT variations of the base question, only changing context (names, items, scenarios) and numbers while preserving the EXACT same mathematical concept, structure, and phrasing.
+
+CRITICAL REQUIREMENT: Generate SEPARATE and DISTINCT questions. Each question must be a DIFFERENT variation of the base question.
+DO NOT generate only one question when more are requested. Return EXACTLY the number in QUESTIONS TO GENERATE.
+
+CRITICAL: STUDY THE BASE QUESTION IN THE REQUEST SECTION
+You MUST closely follow the base question's:
+- Format and structure (same sentence structure, same question type, same presentation)
+- Wording and phrasing (keep the EXACT same style and language - word-for-word where possible)
+- Question type (if it's fill-in-the-blank, keep it fill-in-the-blank; if it's multiple choice, keep it multiple choice)
+- Number of options: ALL copy questions MUST have EXACTLY the number in OPTIONS PER QUESTION (same as base question)
+- Mathematical operation (same operation, just different numbers)
+- Punctuation and capitalization (match exactly)
+- Overall style and presentation (same format, same layout)
+
+CRITICAL: Each copy question MUST be a DIRECT VARIATION of the base question, preserving:
+- The exact wording and phrasing structure
+- The same question format and presentation
+- The same sentence structure and style
+- For word problems: Only change the context (names, locations, items, scenarios) and numbers while keeping the EXACT same sentence structure, word order, and phrasing pattern
+- For mathematical questions: Only the numbers should change
+
+SME NOTES in the request (if provided) are CRITICAL and MUST be followed in addition to all prompt instructions.
+SME NOTES PROVIDE SPECIFIC GUIDANCE THAT OVERRIDES OR SUPPLEMENTS GENERAL PROMPT INSTRUCTIONS.
+READ SME NOTES CAREFULLY AND FOLLOW THEM EXACTLY WHEN GENERATING COPY QUESTIONS."""
+
+_IMAGE_BASED_INSTRUCTIONS = """IMAGE-BASED QUESTIONS GENERATION INSTRUCTIONS
+This is an IMAGE-BASED question. Follow these specific instructions:
+
+You are an expert educational content creator specializing in visual question generation. Your task is to create a NEW question with an image, graph, or table that is similar in style, format, and visual presentation to the base question provided.
+
+## INPUT
+
+You will receive:
+
+1. A base question containing an image, graph, or table
+
+2. The subject/topic area
+
+3. Grade level (if applicable)
+
+4. Any specific standards alignment (optional)
+
+## YOUR TASK
+
+Create a completely NEW question that:
+
+### Visual Similarity Requirements
+
+- Uses the SAME type of visual (if base has a bar graph, create a bar graph; if it has a diagram, create a similar diagram)
+
+- Matches the visual style: colors, layout, labeling conventions, scale, and overall aesthetic
+
+- Uses similar complexity level in the visual presentation
+
+- Maintains comparable visual clarity and readability
+
+- Includes similar elements (e.g., if base has gridlines, axis labels, legends - include these)
+
+### Content Requirements
+
+- Tests the SAME or similar mathematical/scientific concept or skill
+
+- Maintains similar difficulty level
+
+- Changes the specific numbers, data, objects, or scenario to create a fresh question
+
+- Uses different context or real-world application when appropriate
+
+- Ensures the question is pedagogically sound and has a clear, unambiguous answer
+
+### Format Requirements
+
+- Match the question structure (multiple choice, open-ended, fill-in-the-blank, etc.)
+
+- Preserve any special formatting from the base question
+
+- Include answer choices if the original has them (with similar format) - CRITICAL: ALL copy questions MUST have EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)
+
+- Provide the correct answer and explanation
+
+## OUTPUT FORMAT
+
+Provide:
+
+1. **New Question Text**: The complete question stem
+
+2. **Image/Graph/Table Description**: Detailed description of the visual to be created, including:
+
+   - Type of visual
+
+   - Specific data/values to display
+
+   - Colors, labels, and styling details
+
+   - Dimensions and scale
+
+3. **Answer Choices** (if applicable) - MUST have EXACTLY the number of options in OPTIONS PER QUESTION
+
+4. **Correct Answer**
+
+5. **Solution Explanation**: Brief explanation of how to solve
+
+## EXAMPLE WORKFLOW
+
+If given a bar graph showing fruit sales with blue bars on a white grid:
+
+- Create a bar graph with a DIFFERENT topic (e.g., temperature over days)
+
+- Use similar blue bars on white grid
+
+- Match the axis labeling style
+
+- Create a new question about the same skill (e.g., reading values from a bar graph)
+
+- Maintain similar difficulty
+
+Analyze the base question in the REQUEST section and create your similar questions following all the requirements above.
+
+CRITICAL: ALL copy questions MUST have EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)."""
+
+_WORD_PROBLEM_INSTRUCTIONS = """WORD PROBLEMS GENERATION INSTRUCTIONS
+This is a WORD PROBLEM question. Follow these specific instructions:
+
+Prompt for Generating Similar Word Problems from Base Question
+
+Objective:
+Generate similar word problems based on a provided "Base Question" while maintaining the same mathematical concept, difficulty level, and problem-solving approach.
+
+Instructions:
+Given the Base Word Problem in the REQUEST section, create multiple similar word problems that:
+
+1. Analyze the Base Question (IN THE REQUEST SECTION)
+
+First, identify these key elements from THAT base question:
+
+- Mathematical Concept: What operation(s) or concept is being tested?
+- Problem Structure: Single-step or multi-step? What's the solution path?
+- Numerical Complexity: Size of numbers, decimals, fractions, etc.
+- Context/Scenario: What real-world situation is used?
+- Given Information: What data is provided?
+- Unknown/Question: What needs to be found?
+- Units: What measurements are involved?
+
+2. Variation Strategies
+
+Context Substitution:
+- Change the scenario while keeping the mathematical structure identical
+- Replace characters with different names (maintain diversity)
+- Use equivalent contexts: shopping → dining, travel → sports, cooking → crafting
+- Keep the situation relatable and realistic for the target audience
+
+Numerical Variation:
+- Modify numbers while maintaining the same mathematical relationships
+- Keep computational difficulty consistent
+- Scale proportionally (if base uses 12 and 8, copies might use 15 and 10)
+- Maintain number types (whole numbers, decimals, fractions) unless varying difficulty
+
+Object/Entity Replacement:
+- Substitute items with equivalents from the same category
+- Examples: apples → oranges, cars → bikes, dollars → euros
+- Ensure the replacement makes sense in the new context
+- Keep units and measurements appropriate
+
+Time/Location Changes:
+- Modify temporal or spatial elements
+- Different days, times, seasons, locations
+- Maintain logical consistency within the problem
+
+3. Preserve Problem Structure
+
+CRITICAL: Keep these elements consistent:
+
+✓ Same sentence structure and phrasing as the base question
+✓ Same word order and sentence flow
+✓ Same grammatical structure and style
+✓ Same number of steps to solve
+✓ Same mathematical operations required
+✓ Same level of complexity
+✓ Same cognitive demand (Bloom's taxonomy level)
+✓ Same problem type (find total, find difference, find rate, etc.)
+✓ Similar word count and reading level
+✓ CRITICAL: ALL copy questions MUST have EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)
+
+4. Quality Control Checks
+
+Before finalizing each similar problem:
+
+✓ Does it test the exact same mathematical concept?
+✓ Does it match the base question's sentence structure and phrasing?
+✓ Is the word order and grammatical structure the same as the base question?
+✓ Is the difficulty level equivalent?
+✓ Does it require the same solution approach?
+✓ Are all necessary details included?
+✓ Is there no extraneous information (unless in base question)?
+✓ Is the context realistic and engaging?
+✓ Are numbers and units appropriate?
+✓ Is the question clearly stated?
+✓ Does it have EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)?
+
+CRITICAL REMINDERS:
+- ALL copy questions MUST have EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)
+- These word problem instructions are in addition to all other instructions. Follow them carefully when generating copy questions."""
+
+_RULES_TEMPLATE = """Rules:
+- {question_type}: CHANGE ONLY the context/real-life scenario, keep the SAME math operation, structure, and question format. Preserve the same wording style and structure.
+- CRITICAL: Each copy question MUST match the base question's sentence structure, phrasing, word order, and grammatical style
+- CRITICAL: Each copy question MUST match the base question's format, structure, and style
+- CRITICAL: Number of options MUST match the base question: Each question MUST have EXACTLY the number in OPTIONS PER QUESTION. DO NOT generate more or fewer options.
+- ONE option per question must be marked "CA" (Correct Answer)
+- CRITICAL: Incorrect options MUST be based on ACTUAL ERRORS students would make when solving the BASE QUESTION or similar problems
+- For each incorrect option, the logic must describe:
+  1. What mistake a student would make when solving THIS type of question
+  2. Common errors specific to the base question's concept/operation
+  3. Realistic misconceptions students have about this problem type
+- Logic must be SHORT (3-6 words) and SPECIFIC to the question type
+- Examples: "CA", "Added instead of multiplied", "Forgot to carry over", "Wrong order of operations", "Place value mistake", "Used subtraction instead"
+
+CRITICAL: COPY QUESTION FORMAT REQUIREMENT
+Each copy question MUST:
+1. Match the base question's sentence structure and phrasing EXACTLY
+2. Use the same word order and grammatical structure as the base question
+3. Match the base question's structure and format EXACTLY
+4. Use the same wording style and phrasing as the base question
+5. Keep the same question type (fill-in-the-blank, multiple choice, etc.)
+6. Have EXACTLY the number of options in OPTIONS PER QUESTION (same as the base question) - this is CRITICAL
+7. Only change the numbers (for mathematical) or context (for word problems)
+8. Preserve the same punctuation, capitalization, and presentation style
+9. Follow the same format as the base question in the REQUEST section
+
+Example for Word Problems: If base question is "Sarah bought 3 apples for $2 each. How much did she spend in total?" with 4 options
+Then copy questions should be: "Tom bought 5 oranges for $3 each. How much did he spend in total?" with EXACTLY 4 options
+Notice: Same sentence structure, same phrasing pattern, same question format, SAME NUMBER OF OPTIONS - only context (names, items, numbers) changed while preserving the exact structure.
+
+IMPORTANT: Each distractor logic should reflect a REALISTIC mistake a student would make while solving problems similar to the base question. Base the logic on actual student errors, not generic mistakes."""
+
+_JSON_FORMAT_INSTRUCTIONS = """CRITICAL JSON FORMAT REQUIREMENTS
+- Your FIRST character MUST be [ (opening square bracket)
+- Your LAST character MUST be ] (closing square bracket)
+- Return ONLY a valid JSON array starting with [ and ending with ]
+- DO NOT start with { (curly brace) - that means a single object, which is WRONG
+- DO NOT return a single object - you MUST return an array
+- NO markdown code blocks (no ```json or ```)
+- NO explanations or text before or after the JSON
+- NO comments or notes
+- NO text before the opening bracket [
+- NO text after the closing bracket ]
+- Start response immediately with [
+- End response with ]
+- Ensure all strings are properly quoted with double quotes
+- Ensure all brackets and braces are properly matched
+- Do NOT include any text outside the JSON array
+
+VERIFY BEFORE RESPONDING: Your response starts with [ and ends with ], not { and }
+
+Your response must be ONLY a JSON array containing EXACTLY the requested number of question objects. Each object must have "question", "options", "image", and "solution" fields.
+
+🔥🔥🔥 CRITICAL: YOUR RESPONSE MUST START WITH [ AND END WITH ] 🔥🔥🔥
+
+DO NOT START WITH { (curly brace)
+DO NOT RETURN A SINGLE OBJECT LIKE {"question": ...}
+YOU MUST RETURN AN ARRAY: [{...}, {...}, ...]
+
+Your response should look like this (example for 5 questions):
+[{"question": "...", "options": [...], "image": "", "solution": "..."}, {"question": "...", "options": [...], "image": "", "solution": "..."}, {"question": "...", "options": [...], "image": "", "solution": "..."}, {"question": "...", "options": [...], "image": "", "solution": "..."}, {"question": "...", "options": [...], "image": "", "solution": "..."}]
+
+WRONG FORMAT (DO NOT DO THIS):
+{"question": "...", "options": [...], "image": "", "solution": "..."}
+
+CORRECT FORMAT (DO THIS):
+[{"question": "...", "options": [...], "image": "", "solution": "..."}, {"question": "...", "options": [...], "image": "", "solution": "..."}]
+
+⚠️ IMPORTANT: If more than one question is requested, you MUST generate DIFFERENT questions, each with different numbers or contexts. DO NOT duplicate the same question.
+
+IMPORTANT: Study the base question format in the REQUEST section and replicate it EXACTLY in your copy questions.
+
+Example for Word Problems (if base question was "Sarah bought 3 apples for $2 each. How much did she spend in total?"):
+[{"question": "Tom bought 5 oranges for $3 each. How much did he spend in total?", "options": [{"text": "$15", "logic": "CA"}, {"text": "$8", "logic": "Added instead of multiplied"}, {"text": "$6", "logic": "Multiplied price by quantity incorrectly"}, {"text": "$10", "logic": "Wrong calculation"}], "image": "", "solution": "Step 1: Multiply 5 oranges × $3 each. Step 2: 5 × 3 = 15. Step 3: Tom spent $15 in total."}, {"question": "Emma bought 4 bananas for $1.50 each. How much did she spend in total?", "options": [{"text": "$6", "logic": "CA"}, {"text": "$5.50", "logic": "Added instead of multiplied"}, {"text": "$4", "logic": "Multiplied price by quantity incorrectly"}, {"text": "$3", "logic": "Wrong calculation"}], "image": "", "solution": "Step 1: Multiply 4 bananas × $1.50 each. Step 2: 4 × 1.50 = 6. Step 3: Emma spent $6 in total."}]
+
+Notice: Same exact sentence structure "[Name] bought [number] [items] for $[price] each. How much did [he/she] spend in total?" - only the context (names, items, numbers) changed while preserving the exact wording pattern and structure."""
+
+_FINAL_CHECKLIST = f"""🔥 CRITICAL: Check that your response starts with [ (not {{) and ends with ] (not }}) 🔥
+🔥 If you see {{ at the start, you're returning a single object - that's WRONG! 🔥
+🔥 You MUST return an array: [{{...}}, {{...}}, ...] 🔥
+
+{'=' * 80}
+FINAL CHECKLIST BEFORE RESPONDING - COUNT YOUR QUESTIONS:
+{'=' * 80}
+1. Count how many question objects you are returning: it should be EXACTLY QUESTIONS TO GENERATE
+2. Verify: Your JSON array should contain that many objects (count the opening braces)
+3. Each question must be different (different numbers, different context, or different phrasing)
+4. Each question MUST match the base question's format and structure exactly
+5. Each question MUST use the same wording style as the base question
+6. Your JSON array should start with [ and end with ]
+7. NO other text before [ or after ]
+
+CRITICAL VERIFICATION:
+- If QUESTIONS TO GENERATE is 5, your array should look like: [{{...}}, {{...}}, {{...}}, {{...}}, {{...}}]
+- If QUESTIONS TO GENERATE is 3, your array should look like: [{{...}}, {{...}}, {{...}}]
+- If you return only 1 object when more are requested, THE REQUEST WILL FAIL
+- Each copy question must match the base question's format: same structure, same wording style, same type
+
+DOUBLE-CHECK:
+1. Count the question objects in your response.
+2. Verify each question matches the base question's format and structure
+3. Ensure each question uses the same wording style as the base question
+4. Verify each question has EXACTLY the number of options in OPTIONS PER QUESTION (same as base question)
+5. Ensure you followed ALL SME NOTES instructions (if provided)
+{'=' * 80}"""
+
+
+def _join(*blocks):
+    return '\n\n'.join(blocks)
+
+
+# Full instructions per internal question type, placed after SYSTEM_PROMPT in the system message
+INSTRUCTIONS = {
+    'mathematical': MATHEMATICAL_INSTRUCTIONS,
+    'word_problem': _join(_COUNT_REQUIREMENT, _GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS,
+                          _RULES_TEMPLATE.format(question_type='word_problem'), _JSON_FORMAT_INSTRUCTIONS,
+                          _FINAL_CHECKLIST),
+    'image_based': _join(_COUNT_REQUIREMENT, _GENERAL_INSTRUCTIONS, _IMAGE_BASED_INSTRUCTIONS,
+                         _RULES_TEMPLATE.format(question_type='image_based'), _JSON_FORMAT_INSTRUCTIONS,
+                         _FINAL_CHECKLIST),
+}
+
+SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                  for question_type, instructions in INSTRUCTIONS.items()}
+
+# Lean-output variants for the question types whose answers are numbers
+LEAN_INSTRUCTIONS = {
+    'mathematical': LEAN_MATHEMATICAL_INSTRUCTIONS,
+    'word_problem': _join(_COUNT_REQUIREMENT, _GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS, _LEAN_RULES),
+}
+
+LEAN_SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                       for question_type, instructions in LEAN_INSTRUCTIONS.items()}
+# Compact-output variants of both, for every question type and for the lean ones
+COMPACT_INSTRUCTIONS = {
+    'mathematical': _join(_MATHEMATICAL_RULES, _COMPACT_FORMAT),
+    'word_problem': _join(_GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS,
+                          _RULES_TEMPLATE.format(question_type='word_problem'), _COMPACT_FORMAT),
+    'image_based': _join(_GENERAL_INSTRUCTIONS, _IMAGE_BASED_INSTRUCTIONS,
+                         _RULES_TEMPLATE.format(question_type='image_based'), _COMPACT_FORMAT),
+}
+COMPACT_SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                          for question_type, instructions in COMPACT_INSTRUCTIONS.items()}
+LEAN_COMPACT_INSTRUCTIONS = {
+    'mathematical': _join(_LEAN_MATHEMATICAL_RULES, _LEAN_COMPACT_FORMAT),
+    'word_problem': _join(_GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS, _LEAN_COMPACT_FORMAT),
+}
+LEAN_COMPACT_SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                               for question_type, instructions in LEAN_COMPACT_INSTRUCTIONS.items()}
+# Structured-output variants, without the JSON format instructions the schema makes unnecessary
+STRUCTURED_INSTRUCTIONS = {
+    'mathematical': _join(_MATHEMATICAL_RULES, _STRUCTURED_FORMAT),
+    'word_problem': _join(_GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS,
+                          _RULES_TEMPLATE.format(question_type='word_problem'), _STRUCTURED_FORMAT),
+    'image_based': _join(_GENERAL_INSTRUCTIONS, _IMAGE_BASED_INSTRUCTIONS,
+                         _RULES_TEMPLATE.format(question_type='image_based'), _STRUCTURED_FORMAT),
+}
+STRUCTURED_SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                             for question_type, instructions in STRUCTURED_INSTRUCTIONS.items()}
+LEAN_STRUCTURED_INSTRUCTIONS = {
+    'mathematical': _join(_LEAN_MATHEMATICAL_RULES, _LEAN_STRUCTURED_FORMAT),
+    'word_problem': _join(_GENERAL_INSTRUCTIONS, _WORD_PROBLEM_INSTRUCTIONS, _LEAN_STRUCTURED_FORMAT),
+}
+LEAN_STRUCTURED_SYSTEM_PROMPTS = {question_type: _join(SYSTEM_PROMPT, instructions)
+                                  for question_type, instructions in LEAN_STRUCTURED_INSTRUCTIONS.items()}
+
+# System prompts by response format ('json', 'compact' or 'structured') and lean output
+SYSTEM_PROMPT_VARIANTS = {
+    ('json', False): SYSTEM_PROMPTS,
+    ('json', True): LEAN_SYSTEM_PROMPTS,
+    ('compact', False): COMPACT_SYSTEM_PROMPTS,
+    ('compact', True): LEAN_COMPACT_SYSTEM_PROMPTS,
+    ('structured', False): STRUCTURED_SYSTEM_PROMPTS,
+    ('structured', True): LEAN_STRUCTURED_SYSTEM_PROMPTS,
+}
@@ -0,0 +1,140 @@
+"""
+Incremental parser for question arrays returned by the model.
+
+The scanner walks the response text once, tracking strings and bracket depth,
+and emits each question object as soon as its closing brace arrives. Prose,
+markdown code fences and an unfinished trailing object are ignored.
+"""
+import json
+import re
+
+import metrics
+
+# Trailing commas before a closing bracket/brace (e.g. {"a": 1,}) are a common model mistake
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*[}\]])')
+# Characters that can change scanner state outside and inside strings
+_STRUCTURAL = re.compile(r'["{}\[\]:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+def loads_lenient(text):
+    """Parse a JSON fragment, retrying once with trailing commas removed"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        metrics.PARSE_FALLBACKS.labels(strategy='trailing_comma').inc()
+        return json.loads(TRAILING_COMMA_PATTERN.sub(r'\1', text))
+
+
+def extract_questions(text):
+    """Return (questions, truncated) for a complete model response, scanning it once
+
+    truncated is True when the text ends inside an unfinished question object,
+    e.g. when the completion hit its token limit; the complete ones are still returned.
+    """
+    parser = IncrementalQuestionParser()
+    questions = parser.feed(text)
+    return questions, parser.has_partial_object
+
+
+class IncrementalQuestionParser:
+    """Feed model output in chunks and collect question objects as they complete"""
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        # Most recently completed string, which becomes a key if a colon follows it
+        self.last_string = None
+        self.last_string_end = -1
+        # Open containers: [bracket, start offset, is a question object]
+        self.stack = []
+        self.emitted = 0
+
+    def feed(self, text):
+        """Consume more output and return the list of question objects completed by it"""
+        if not text:
+            return []
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        stack = self.stack
+        end = len(buffer)
+        i = self.position
+
+        while i < end:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    i += 1
+                    continue
+                # Jump straight to the next quote or backslash inside the string
+                match = _STRING_SPECIAL.search(buffer, i)
+                if match is None:
+                    i = end
+                    break
+                i = match.start()
+                if buffer[i] == '\\':
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                    self.last_string = buffer[self.string_start + 1:i]
+                    self.last_string_end = i
+                i += 1
+                continue
+
+            # Skip prose, whitespace, numbers and literals up to the next structural character
+            match = _STRUCTURAL.search(buffer, i)
+            if match is None:
+                i = end
+                break
+            i = match.start()
+            char = buffer[i]
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+            elif char == ':':
+                # A string followed only by whitespace and a colon is a key of the innermost object
+                if (self.last_string == 'question' and stack and stack[-1][0] == '{'
+                        and not buffer[self.last_string_end + 1:i].strip()
+                        # Nested copies of a question key inside a question are not separate questions
+                        and not any(entry[2] for entry in stack)):
+                    stack[-1][2] = True
+            elif char == '{' or char == '[':
+                stack.append([char, i, False])
+            else:
+                opener = '{' if char == '}' else '['
+                if stack and stack[-1][0] == opener:
+                    _, start, is_question = stack.pop()
+                    if is_question:
+                        question = self._decode(buffer[start:i + 1])
+                        if question is not None:
+                            completed.append(question)
+                # Otherwise it is an unbalanced closer in surrounding prose
+            i += 1
+
+        self.position = end
+        self.emitted += len(completed)
+        return completed
+
+    def _decode(self, fragment):
+        try:
+            parsed = loads_lenient(fragment)
+        except json.JSONDecodeError:
+            metrics.PARSE_FALLBACKS.labels(strategy='skipped_object').inc()
+            return None
+        if isinstance(parsed, dict) and 'question' in parsed:
+            return parsed
+        return None
+
+    def finish(self, complete=True):
+        """Questions completed by the end of the response: none, each object completes at its closing brace"""
+        return []
+
+    @property
+    def has_partial_object(self):
+        """True if the output so far ends inside an unfinished question object"""
+        return any(entry[2] for entry in self.stack)
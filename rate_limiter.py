@@ -0,0 +1,237 @@
+"""
+Rate limiting and retries for OpenAI calls, shared by all workers on the host.
+
+Requests per minute, tokens per minute and images per minute are token buckets
+stored in SQLite under STATE_DIR, so gunicorn workers draw from the same
+budget instead of each assuming it has the whole account limit. Calls wait for
+capacity before they are sent. 429s, timeouts and 5xx responses are retried
+with jittered exponential backoff that honours Retry-After. A 429 also drains
+the shared bucket, so the other workers back off too.
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+
+import openai
+
+from storage import connect, state_path
+
+# Account limits to stay under; 0 disables that bucket
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', '0'))
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', '0'))
+OPENAI_IMAGES_PER_MINUTE = int(os.getenv('OPENAI_IMAGES_PER_MINUTE', '0'))
+# Retries after the first attempt, and the backoff range between them
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv('OPENAI_BACKOFF_BASE_SECONDS', '1'))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv('OPENAI_BACKOFF_MAX_SECONDS', '30'))
+# Longest a call waits for bucket capacity (or a Retry-After) before giving up with RateLimitExceeded
+OPENAI_MAX_WAIT_SECONDS = float(os.getenv('OPENAI_MAX_WAIT_SECONDS', '60'))
+
+# Rough prompt size estimate for the tokens-per-minute bucket
+CHARS_PER_TOKEN = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                     openai.InternalServerError)
+
+
+class RateLimitExceeded(Exception):
+    """The upstream rate limit could not be satisfied in time; retry_after is a hint in seconds"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SharedTokenBucket:
+    """A token bucket refilled at per_minute per minute, stored in SQLite so every process shares it"""
+
+    _schema_lock = threading.Lock()
+    _schema_paths = set()
+
+    def __init__(self, name, per_minute, path=None):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.path = path or state_path('rate_limits.sqlite3')
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def _connect(self):
+        conn = connect(self.path)
+        with self._schema_lock:
+            if self.path not in self._schema_paths:
+                conn.execute(_SCHEMA)
+                self._schema_paths.add(self.path)
+        return conn
+
+    def _update(self, change):
+        """Atomically refill the bucket, apply change(tokens) -> (new_tokens, result) and return result"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE name = ?',
+                                   (self.name,)).fetchone()
+                if row is None:
+                    tokens = self.capacity
+                else:
+                    tokens = min(self.capacity, row['tokens'] + (now - row['updated_at']) * self.rate)
+                tokens, result = change(tokens)
+                conn.execute('INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                             (self.name, tokens, now))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        return result
+
+    def try_acquire(self, amount):
+        """Take amount tokens if available; return 0, or the seconds until they will be"""
+        amount = min(amount, self.capacity)
+
+        def take(tokens):
+            if tokens >= amount:
+                return tokens - amount, 0.0
+            return tokens, (amount - tokens) / self.rate
+        return self._update(take)
+
+    def acquire(self, amount, max_wait=None):
+        """Block until amount tokens are taken, raising RateLimitExceeded after max_wait seconds"""
+        if not self.enabled or amount <= 0:
+            return
+        max_wait = OPENAI_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(f"OpenAI {self.name} limit reached, try again shortly", retry_after=wait)
+            # Small random jitter so waiting threads don't all retry the bucket at the same instant
+            time.sleep(min(wait, remaining) + random.uniform(0, 0.05))
+
+    def refund(self, amount):
+        """Return unused tokens, e.g. when a completion used fewer tokens than were reserved"""
+        if not self.enabled or amount <= 0:
+            return
+        self._update(lambda tokens: (min(self.capacity, tokens + amount), None))
+
+    def drain(self, seconds):
+        """Empty the bucket so no process gets capacity for about `seconds` (after an upstream 429)"""
+        if not self.enabled or seconds <= 0:
+            return
+        self._update(lambda tokens: (min(tokens, -seconds * self.rate), None))
+
+
+requests_bucket = SharedTokenBucket('requests', OPENAI_RPM)
+tokens_bucket = SharedTokenBucket('tokens', OPENAI_TPM)
+images_bucket = SharedTokenBucket('images', OPENAI_IMAGES_PER_MINUTE)
+
+
+def retry_after_seconds(error):
+    """Read Retry-After (or retry-after-ms) from an API error's response, if it has one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (1-based)"""
+    cap = min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+def call_with_retry(call, buckets, label, max_wait=None):
+    """Run call() after taking capacity from each (bucket, amount) pair, retrying transient API errors
+
+    Waiting for capacity and between retries stops after max_wait seconds in total. After a 429 the
+    buckets are drained for the Retry-After time, so this and every other worker wait it out in acquire().
+    """
+    deadline = time.monotonic() + (OPENAI_MAX_WAIT_SECONDS if max_wait is None else max_wait)
+    attempt = 0
+    while True:
+        for bucket, amount in buckets:
+            bucket.acquire(amount, max_wait=max(0.0, deadline - time.monotonic()))
+        try:
+            return call()
+        except _RETRYABLE_ERRORS as e:
+            # Out of credits is also a 429 but waiting won't fix it
+            if isinstance(e, openai.RateLimitError) and getattr(e, 'code', None) == 'insufficient_quota':
+                raise
+            attempt += 1
+            retry_after = retry_after_seconds(e)
+            wait = retry_after if retry_after is not None else backoff_seconds(attempt)
+            drained = False
+            if isinstance(e, openai.RateLimitError):
+                for bucket, amount in buckets:
+                    if bucket.enabled and amount > 0:
+                        bucket.drain(wait)
+                        drained = True
+            remaining = deadline - time.monotonic()
+            if attempt > OPENAI_MAX_RETRIES or wait > remaining:
+                if isinstance(e, openai.RateLimitError):
+                    raise RateLimitExceeded(f"OpenAI rate limit reached for {label}, try again shortly",
+                                            retry_after=wait) from e
+                raise
+            print(f"WARNING: {label} failed ({type(e).__name__}), retry {attempt}/{OPENAI_MAX_RETRIES} "
+                  f"in {wait:.1f}s")
+            # A drained bucket already makes the next acquire() wait; sleeping as well would wait twice
+            if not drained:
+                time.sleep(wait)
+
+
+def estimate_request_tokens(params):
+    """Tokens a chat request counts against TPM: prompt size estimate plus the output budget"""
+    prompt_chars = sum(len(str(message.get('content', ''))) for message in params.get('messages', []))
+    max_output = params.get('max_completion_tokens') or params.get('max_tokens') or 0
+    return prompt_chars // CHARS_PER_TOKEN + max_output
+
+
+def create_chat_completion(client, **params):
+    """client.chat.completions.create(**params) under the shared limits, with retries"""
+    reserved = estimate_request_tokens(params) if tokens_bucket.enabled else 0
+    response = call_with_retry(lambda: client.chat.completions.create(**params),
+                               [(requests_bucket, 1), (tokens_bucket, reserved)],
+                               f"chat completion ({params.get('model')})")
+    # Give back what a finished completion didn't use; streams report usage too late to matter
+    usage = getattr(response, 'usage', None)
+    if reserved and getattr(usage, 'total_tokens', None):
+        tokens_bucket.refund(reserved - usage.total_tokens)
+    return response
+
+
+def generate_image(client, max_wait=None, **params):
+    """client.images.generate(**params) under the shared limits, with retries"""
+    return call_with_retry(lambda: client.images.generate(**params),
+                           [(images_bucket, params.get('n', 1))],
+                           f"image generation ({params.get('model')})", max_wait=max_wait)
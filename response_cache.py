@@ -0,0 +1,151 @@
+"""
+Content-addressed response cache for question generation.
+
+Results are keyed on a hash of the normalized generation inputs and stored in
+SQLite, so a repeated request hits the cache no matter which gunicorn worker
+serves it. Entries expire after a TTL and the least recently used entries are
+evicted once the entry count or total size limit is exceeded.
+"""
+import hashlib
+import json
+import os
+import time
+
+import metrics
+from storage import connect, state_path
+
+CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', str(24 * 3600)))
+# DALL-E image URLs expire after about an hour, so entries with generated images are kept for less
+CACHE_IMAGE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_IMAGE_TTL_SECONDS', '3000'))
+CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# Generation inputs that determine the output; tuning knobs such as chunk size are left out
+KEY_FIELDS = ('base_question', 'notes', 'solution', 'images', 'num_options', 'num_questions',
+              'difficulty', 'grade', 'curriculum', 'model', 'question_type_from_url')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+_schema_ready = False
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        # Collapse whitespace so trailing spaces or re-wrapped lines still hit
+        return ' '.join(value.split())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    return value
+
+
+def make_key(generation_kwargs):
+    """Hash the normalized generation inputs into a cache key"""
+    normalized = {field: _normalize(generation_kwargs.get(field)) for field in KEY_FIELDS}
+    for field in ('difficulty', 'curriculum', 'model', 'question_type_from_url'):
+        if isinstance(normalized[field], str):
+            normalized[field] = normalized[field].lower()
+    # Uploaded images are large data URLs; their digest is enough to tell them apart
+    image_files = generation_kwargs.get('image_files') or []
+    normalized['image_files'] = [
+        hashlib.sha256(json.dumps(image, sort_keys=True).encode('utf-8')).hexdigest()
+        for image in image_files
+    ]
+    # Locally computed questions are cached apart from model-written ones
+    if generation_kwargs.get('local_arithmetic'):
+        normalized['local_arithmetic'] = True
+    # So are questions whose options were computed from a lean (answer-only) response
+    if generation_kwargs.get('lean_output'):
+        normalized['lean_output'] = True
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _connect():
+    global _schema_ready
+    conn = connect(state_path('response_cache.sqlite3'))
+    if not _schema_ready:
+        conn.execute(_SCHEMA)
+        conn.execute('CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed_at)')
+        _schema_ready = True
+    return conn
+
+
+def get(key):
+    """Return the cached questions for a key, or None on a miss or expired entry"""
+    if not CACHE_ENABLED:
+        return None
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute('SELECT value FROM response_cache WHERE key = ? AND expires_at > ?',
+                               (key, now)).fetchone()
+            if row is None:
+                metrics.CACHE_LOOKUPS.labels(result='miss').inc()
+                return None
+            metrics.CACHE_LOOKUPS.labels(result='hit').inc()
+            conn.execute('UPDATE response_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            return json.loads(row['value'])
+        finally:
+            conn.close()
+    except Exception as e:
+        # The cache is an optimization; never fail a request because of it
+        print(f"WARNING: Response cache read failed: {str(e)}")
+        return None
+
+
+def put(key, questions, ttl=None):
+    """Store generated questions under a key and evict expired and least recently used entries"""
+    if not CACHE_ENABLED:
+        return
+    if ttl is None:
+        has_images = any(question.get('image') for question in questions)
+        ttl = min(CACHE_TTL_SECONDS, CACHE_IMAGE_TTL_SECONDS) if has_images else CACHE_TTL_SECONDS
+    value = json.dumps(questions, ensure_ascii=False)
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, size, created_at, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, value, len(value), now, now + ttl, now)
+            )
+            _evict(conn, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"WARNING: Response cache write failed: {str(e)}")
+
+
+def _evict(conn, now):
+    conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+    # Keep the most recently used entries within the entry limit
+    conn.execute(
+        'DELETE FROM response_cache WHERE key IN ('
+        'SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+        (CACHE_MAX_ENTRIES,)
+    )
+    # ...and within the total size limit
+    conn.execute(
+        'DELETE FROM response_cache WHERE key IN ('
+        'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running_size '
+        'FROM response_cache) WHERE running_size > ?)',
+        (CACHE_MAX_BYTES,)
+    )
@@ -0,0 +1,75 @@
+"""
+Strict JSON schema (structured outputs) for copy question responses.
+
+With structured outputs the API constrains decoding to a schema, so every
+response is {"questions": [...]} with exactly the requested number of
+questions and options, and exactly the fields validate_question expects. It
+parses with a single json.loads, and the prompt can drop the long JSON format
+instructions. Models without structured outputs, and any model the API
+rejects the schema for, keep the prompt-only JSON path and its lenient parser.
+"""
+import json
+import os
+from functools import lru_cache
+
+import metrics
+
+STRUCTURED_OUTPUT_ENABLED = os.getenv('STRUCTURED_OUTPUT_ENABLED', 'false').lower() not in ('0', 'false', 'no')
+# Models that accept a json_schema response_format; requests for other models use the JSON prompt
+STRUCTURED_OUTPUT_MODELS = frozenset(
+    name.strip() for name in os.getenv(
+        'STRUCTURED_OUTPUT_MODELS', 'gpt-4o,gpt-4o-mini,gpt-4.1,gpt-4.1-mini,gpt-4.1-nano,gpt-5,gpt-5-mini,gpt-5-nano'
+    ).split(',') if name.strip()
+)
+
+# Models the API rejected a schema for in this process (e.g. an older snapshot behind a listed name)
+_rejected_models = set()
+
+
+def supports(model):
+    return model in STRUCTURED_OUTPUT_MODELS and model not in _rejected_models
+
+
+def mark_unsupported(model):
+    _rejected_models.add(model)
+
+
+def is_schema_rejection(error):
+    """True for a 400 from the API that is about the response_format rather than the request itself"""
+    message = str(error).lower()
+    return (getattr(error, 'status_code', None) == 400
+            and any(word in message for word in ('response_format', 'json_schema', 'structured output')))
+
+
+def _strict_object(properties):
+    # Strict mode requires every property to be listed as required and no others to be allowed
+    return {'type': 'object', 'properties': properties, 'required': list(properties), 'additionalProperties': False}
+
+
+@lru_cache(maxsize=256)
+def response_format(num_questions, num_options, lean=False):
+    """The response_format parameter for a request; the same sizes give the same schema, which the API caches"""
+    if lean:
+        answer = {'answer': {'type': 'string'}}
+    else:
+        option = _strict_object({'text': {'type': 'string'}, 'logic': {'type': 'string'}})
+        answer = {'options': {'type': 'array', 'items': option, 'minItems': num_options, 'maxItems': num_options}}
+    question = _strict_object({'question': {'type': 'string'}, **answer, 'image': {'type': 'string'},
+                               'solution': {'type': 'string'}})
+    questions = {'type': 'array', 'items': question, 'minItems': num_questions, 'maxItems': num_questions}
+    return {'type': 'json_schema',
+            'json_schema': {'name': 'copy_questions', 'strict': True,
+                            'schema': _strict_object({'questions': questions})}}
+
+
+def parse_questions(content):
+    """The questions of a schema-conforming response, or None when it is not one (e.g. cut off at the token limit)"""
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        parsed = None
+    questions = parsed.get('questions') if isinstance(parsed, dict) else None
+    if not isinstance(questions, list):
+        metrics.PARSE_FALLBACKS.labels(strategy='structured_output').inc()
+        return None
+    return [question for question in questions if isinstance(question, dict)]
@@ -196,37 +196,39 @@ document.getElementById('questionForm').addEventListener('submit', async functio
     document.getElementById('generateBtn').disabled = true;
 
     try {
-        const response = await fetch('/api/generate', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(formData)
+        // Render questions one by one as the background job produces them
+        const container = document.getElementById('questionsContainer');
+        container.innerHTML = '';
+        window.generatedQuestions = [];
+        
+        await runGenerationJob(formData, {
+            onQuestion: (question) => {
+                const index = window.generatedQuestions.length;
+                window.generatedQuestions.push(question);
+                container.appendChild(renderQuestionCard(question, index));
+                document.getElementById('results').classList.remove('hidden');
+                document.getElementById('copyAllBtn').disabled = false;
+                updateSelectedCount();
+                
+                // Keep the spinner for the remaining questions
+                clearInterval(window.loadingInterval);
+                window.loadingInterval = null;
+                loadingText.textContent = `Generated ${index + 1} of ${numQuestions} questions...`;
+            }
         });
 
-        const data = await response.json();
-
-        if (!response.ok) {
-            throw new Error(data.error || 'Failed to generate questions');
-        }
-
         // Log how many questions were received
-        console.log(`DEBUG: Received ${data.questions ? data.questions.length : 0} questions from server`);
+        console.log(`DEBUG: Received ${window.generatedQuestions.length} questions from server`);
         
-        if (!data.questions || data.questions.length === 0) {
+        if (window.generatedQuestions.length === 0) {
             throw new Error('No questions were generated. Please try again.');
         }
         
         // Check if we got fewer questions than requested
         const requestedNum = formData.numCopyQuestions;
-        if (data.questions.length < requestedNum) {
-            console.warn(`Warning: Requested ${requestedNum} questions but received only ${data.questions.length}`);
+        if (window.generatedQuestions.length < requestedNum) {
+            console.warn(`Warning: Requested ${requestedNum} questions but received only ${window.generatedQuestions.length}`);
         }
-        
-        displayResults(data.questions);
-        document.getElementById('copyAllBtn').disabled = false;
-        document.getElementById('copySelectedBtn').disabled = false;
-        updateSelectedCount();
 
     } catch (error) {
         showError(error.message);
@@ -241,6 +243,100 @@ document.getElementById('questionForm').addEventListener('submit', async functio
     }
 });
 
+// Queue a generation job and poll it, calling onQuestion for each question as it becomes available
+async function runGenerationJob(formData, { onQuestion }) {
+    const response = await fetch('/api/jobs', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(formData)
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Failed to generate questions');
+    }
+
+    let received = 0;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+
+        const statusResponse = await fetch(data.statusUrl);
+        const job = await statusResponse.json();
+        if (!statusResponse.ok) {
+            throw new Error(job.error || 'Failed to check generation status');
+        }
+
+        // Questions are appended as they complete; only render the new ones
+        job.questions.slice(received).forEach(question => onQuestion(question));
+        received = job.questions.length;
+
+        if (job.status === 'succeeded') {
+            return;
+        }
+        if (job.status === 'failed') {
+            // Keep whatever already arrived; only fail if nothing did
+            if (received === 0) throw new Error(job.error || 'Failed to generate questions');
+            console.warn('Job ended with error:', job.error);
+            return;
+        }
+    }
+}
+
+// Build the card element for one generated question
+function renderQuestionCard(question, index) {
+    const questionCard = document.createElement('div');
+    questionCard.className = 'question-card';
+    
+    let html = `
+        <div class="question-header">
+            <div style="display: flex; align-items: center; gap: 10px;">
+                <input type="checkbox" class="question-checkbox" id="question-checkbox-${index}" data-question-index="${index}" onchange="updateSelectedCount()">
+                <span class="question-number">Question ${index + 1}</span>
+            </div>
+            <div class="button-group-inline">
+                <button class="copy-btn" onclick="copyQuestion(${index}, this)">Copy</button>
+                <button class="solution-btn" onclick="toggleSolution(${index}, this)">View Solution</button>
+            </div>
+        </div>
+        <div class="question-text">${escapeHtml(question.question)}</div>
+    `;
+
+    if (question.image) {
+        html += `<img src="${escapeHtml(question.image)}" alt="Question Image" class="question-image" onerror="this.style.display='none'">`;
+    }
+
+    if (question.options && question.options.length > 0) {
+        html += '<h3 class="options-heading">Options</h3>';
+        html += '<ul class="options-list">';
+        question.options.forEach((option, optIndex) => {
+            const isCorrect = option.logic === 'CA' || option.isCorrect;
+            html += `
+                <li class="${isCorrect ? 'correct' : 'incorrect'}">
+                    <span class="option-label">${String.fromCharCode(65 + optIndex)}.</span>
+                    <div>
+                        <div>${escapeHtml(option.text)}</div>
+                        <div class="option-logic">Logic: ${escapeHtml(option.logic || 'Unknown')}</div>
+                    </div>
+                </li>
+            `;
+        });
+        html += '</ul>';
+    }
+
+    // Add solution section (hidden by default)
+    if (question.solution) {
+        html += `<div class="solution-container" id="solution-${index}" style="display: none;">
+            <h3 class="solution-title">Solution:</h3>
+            <div class="solution-text">${escapeHtml(question.solution)}</div>
+        </div>`;
+    }
+
+    questionCard.innerHTML = html;
+    return questionCard;
+}
+
 // Display generated questions
 function displayResults(questions) {
     const container = document.getElementById('questionsContainer');
@@ -250,55 +346,7 @@ function displayResults(questions) {
     console.log(`DEBUG: Displaying ${questions.length} questions`);
 
     questions.forEach((question, index) => {
-        const questionCard = document.createElement('div');
-        questionCard.className = 'question-card';
-        
-        let html = `
-            <div class="question-header">
-                <div style="display: flex; align-items: center; gap: 10px;">
-                    <input type="checkbox" class="question-checkbox" id="question-checkbox-${index}" data-question-index="${index}" onchange="updateSelectedCount()">
-                    <span class="question-number">Question ${index + 1}</span>
-                </div>
-                <div class="button-group-inline">
-                    <button class="copy-btn" onclick="copyQuestion(${index}, this)">Copy</button>
-                    <button class="solution-btn" onclick="toggleSolution(${index}, this)">View Solution</button>
-                </div>
-            </div>
-            <div class="question-text">${escapeHtml(question.question)}</div>
-        `;
-
-        if (question.image) {
-            html += `<img src="${escapeHtml(question.image)}" alt="Question Image" class="question-image" onerror="this.style.display='none'">`;
-        }
-
-        if (question.options && question.options.length > 0) {
-            html += '<h3 class="options-heading">Options</h3>';
-            html += '<ul class="options-list">';
-            question.options.forEach((option, optIndex) => {
-                const isCorrect = option.logic === 'CA' || option.isCorrect;
-                html += `
-                    <li class="${isCorrect ? 'correct' : 'incorrect'}">
-                        <span class="option-label">${String.fromCharCode(65 + optIndex)}.</span>
-                        <div>
-                            <div>${escapeHtml(option.text)}</div>
-                            <div class="option-logic">Logic: ${escapeHtml(option.logic || 'Unknown')}</div>
-                        </div>
-                    </li>
-                `;
-            });
-            html += '</ul>';
-        }
-
-        // Add solution section (hidden by default)
-        if (question.solution) {
-            html += `<div class="solution-container" id="solution-${index}" style="display: none;">
-                <h3 class="solution-title">Solution:</h3>
-                <div class="solution-text">${escapeHtml(question.solution)}</div>
-            </div>`;
-        }
-
-        questionCard.innerHTML = html;
-        container.appendChild(questionCard);
+        container.appendChild(renderQuestionCard(question, index));
     });
 
     // Store questions globally for copy functionality
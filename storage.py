@@ -0,0 +1,27 @@
+"""
+Local SQLite storage shared by all gunicorn workers on the same host.
+
+Each helper opens a short-lived connection, so it is safe to call from any
+thread or worker process. WAL mode lets readers proceed while another worker
+is writing.
+"""
+import os
+import sqlite3
+
+# Directory for local state (caches, job queue, stats); created on first use
+STATE_DIR = os.getenv('STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance'))
+
+
+def state_path(filename):
+    """Return the path of a file inside the state directory, creating the directory if needed"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, filename)
+
+
+def connect(path, timeout=10.0):
+    """Open a SQLite connection configured for concurrent use by several processes"""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
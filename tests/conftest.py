@@ -0,0 +1,8 @@
+"""Import the app modules from the repository root, with local state in a throwaway directory"""
+import os
+import sys
+import tempfile
+
+# Set before any module reads STATE_DIR, so caches, history and jobs never touch instance/
+os.environ.setdefault('STATE_DIR', tempfile.mkdtemp(prefix='vm-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
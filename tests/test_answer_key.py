@@ -0,0 +1,68 @@
+"""Answer-key checks of computational questions, including fraction operands"""
+import answer_key
+
+
+def question(stem, options, correct, solution=''):
+    return {'question': stem, 'solution': solution,
+            'options': [{'text': text, 'logic': 'CA' if text == correct else 'Plausible distractor'}
+                        for text in options]}
+
+
+def marked(question_dict):
+    return [option['text'] for option in question_dict['options'] if option['logic'] == 'CA']
+
+
+def test_fraction_divided_by_fraction_is_verified():
+    item = question('What is 2/3 ÷ 4/5?', ['5/6', '1/30', '8/15', '6/5'], '5/6')
+    assert answer_key.verify_question(item, fix=True) == 'verified'
+    assert marked(item) == ['5/6']
+
+
+def test_whole_number_divided_by_fraction_is_verified():
+    item = question('What is 6 ÷ 1/2?', ['12', '3', '6 1/2', '1/12'], '12')
+    assert answer_key.verify_question(item, fix=True) == 'verified'
+    assert marked(item) == ['12']
+
+
+def test_wrong_key_with_fraction_operands_is_corrected():
+    item = question('What is 2/3 ÷ 4/5?', ['5/6', '1/30', '8/15', '6/5'], '1/30')
+    assert answer_key.verify_question(item, fix=True) == 'corrected'
+    assert marked(item) == ['5/6']
+
+
+def test_solution_with_fraction_division_verifies_the_key():
+    item = question('A rope is 6 m long. How many 1/2 m pieces can be cut from it?', ['12 pieces', '3 pieces',
+                                                                                       '6 pieces', '24 pieces'],
+                    '12 pieces', solution='Step 1: Divide the length by the piece length. Step 2: 6 ÷ 1/2 = 12.')
+    assert answer_key.verify_question(item, fix=True) == 'verified'
+    assert marked(item) == ['12 pieces']
+
+
+def test_mixed_number_options_and_solution():
+    item = question('A recipe uses 3/4 cup of milk per batch. How much milk do 2 batches use?',
+                    ['1 1/2 cups', '1 1/4 cups', '3/8 cup', '2 3/4 cups'], '1 1/4 cups',
+                    solution='Step 1: 2 × 3/4 = 1 1/2. Step 2: The batches use 1 1/2 cups.')
+    assert answer_key.verify_question(item, fix=True) == 'corrected'
+    assert marked(item) == ['1 1/2 cups']
+
+
+def test_mismatch_and_ambiguous_are_flagged_without_re_marking():
+    item = question('What is 36 + 47?', ['73', '713', '11', '84'], '73')
+    assert answer_key.verify_question(item, fix=True) == 'mismatch'
+    assert item['answer_check'] == 'mismatch'
+    assert marked(item) == ['73']
+
+    item = question('What is 3/4 + 1/8?', ['7/8', '14/16', '4/12', '1/2'], '7/8')
+    assert answer_key.verify_question(item, fix=True) == 'ambiguous'
+    assert item['answer_check'] == 'ambiguous'
+
+
+def test_report_only_mode_leaves_the_options():
+    item = question('What is 12 × 8?', ['96', '86', '20', '104'], '86')
+    assert answer_key.verify_question(item, fix=False) == 'corrected'
+    assert marked(item) == ['86']
+
+
+def test_non_numeric_options_are_unchecked():
+    item = question('Which shape has 4 equal sides?', ['Square', 'Triangle', 'Circle', 'Pentagon'], 'Square')
+    assert answer_key.verify_question(item, fix=True) == 'unchecked'
@@ -0,0 +1,74 @@
+"""Exact evaluation and locally generated copies of pure arithmetic questions"""
+from fractions import Fraction
+
+import arithmetic_engine
+from distractors import parse_answer
+
+
+def test_evaluate_whole_numbers_and_precedence():
+    assert arithmetic_engine.evaluate('36 + 47') == 83
+    assert arithmetic_engine.evaluate('(2 + 3) × 4') == 20
+    assert arithmetic_engine.evaluate('2 + 3 × 4') == 14
+    assert arithmetic_engine.evaluate('72 ÷ 8') == 9
+    assert arithmetic_engine.evaluate('72 / 8 / 3') == 3
+    assert arithmetic_engine.evaluate('2.5 × 1.2') == 3
+
+
+def test_evaluate_fraction_divided_by_fraction():
+    assert arithmetic_engine.evaluate('2/3 ÷ 4/5') == Fraction(5, 6)
+    assert arithmetic_engine.evaluate('4/6 ÷ 3/7') == Fraction(14, 9)
+
+
+def test_evaluate_whole_number_and_fraction():
+    assert arithmetic_engine.evaluate('6 ÷ 1/2') == 12
+    assert arithmetic_engine.evaluate('1/2 ÷ 6') == Fraction(1, 12)
+    assert arithmetic_engine.evaluate('3 × 2/3') == 2
+    assert arithmetic_engine.evaluate('3/4 + 1/8') == Fraction(7, 8)
+
+
+def test_evaluate_mixed_numbers():
+    assert arithmetic_engine.evaluate('1 1/2 + 3/4') == Fraction(9, 4)
+    assert arithmetic_engine.evaluate('2 1/2 × 2') == 5
+    assert arithmetic_engine.evaluate('6 ÷ 1 1/2') == 4
+
+
+def test_parse_arithmetic_rejects_word_problems():
+    assert arithmetic_engine.parse_arithmetic('Tom has 5 apples and buys 3 more. How many does he have?') is None
+    parsed = arithmetic_engine.parse_arithmetic('What is 2/3 ÷ 4/5?\nA) 5/6\nB) 1/30\nC) 8/15\nD) 10/12')
+    assert parsed['value'] == Fraction(5, 6)
+
+
+def _check_copies(base_question, num_options=4):
+    questions = arithmetic_engine.generate_copies(base_question, 5, num_options, seed=7)
+    assert questions is not None and len(questions) == 5
+    base = arithmetic_engine.parse_arithmetic(base_question)
+    for question in questions:
+        value = arithmetic_engine.parse_arithmetic(question['question'])['value']
+        options = question['options']
+        assert len(options) == num_options
+        assert len({option['text'] for option in options}) == num_options
+        correct = [option for option in options if option['logic'] == 'CA']
+        assert len(correct) == 1
+        assert parse_answer(correct[0]['text']).value == value
+        for option in options:
+            if option['logic'] != 'CA':
+                assert parse_answer(option['text']).value != value
+                if base['value'] >= 0:
+                    assert parse_answer(option['text']).value >= 0
+    return questions
+
+
+def test_copies_of_whole_number_questions_have_correct_keys():
+    for base_question in ('What is 36 + 47?', 'What is 82 - 47?', 'What is 12 × 8?', 'What is 96 ÷ 4?'):
+        _check_copies(base_question)
+
+
+def test_copies_of_fraction_division_have_correct_keys():
+    questions = _check_copies('What is 2/3 ÷ 4/5?')
+    for question in questions:
+        assert all(parse_answer(option['text']).value != 0 for option in question['options'])
+
+
+def test_copies_of_decimal_and_fraction_questions_have_correct_keys():
+    _check_copies('What is 3/4 + 1/8?')
+    _check_copies('What is 2.5 × 1.2?')
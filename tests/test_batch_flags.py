@@ -0,0 +1,58 @@
+"""Boolean and count fields that arrive as strings from CSV batch rows and query strings"""
+import pytest
+
+from app import app, build_generation_kwargs, get_cache_flags, parse_batch_items, parse_count, parse_flag
+
+CSV_BODY = (
+    "baseQuestion,numCopyQuestions,model,leanOutput,compactOutput,structuredOutput,localArithmetic,noCache,refreshCache\n"
+    "What is 12 + 7?,2,gpt-4o,false,0,no,false,false,false\n"
+    "What is 15 + 9?,2,gpt-4o,true,1,yes,true,FALSE,true\n"
+)
+
+
+def test_parse_flag():
+    for value in ('false', 'False', '0', 'no', 'off', '', ' false ', False, 0):
+        assert parse_flag(value, default=True) is False
+    for value in ('true', '1', 'yes', 'on', True, 1):
+        assert parse_flag(value) is True
+    assert parse_flag(None, default=True) is True
+    assert parse_flag(None) is False
+
+
+def test_csv_false_values_turn_flags_off():
+    items, _ = parse_batch_items(CSV_BODY, 'text/csv')
+    off, on = items
+
+    kwargs = build_generation_kwargs(off)
+    assert not any(kwargs[key] for key in ('lean_output', 'compact_output', 'structured_output', 'local_arithmetic'))
+    assert get_cache_flags(off) == (True, True)
+
+    kwargs = build_generation_kwargs(on)
+    assert all(kwargs[key] for key in ('lean_output', 'compact_output', 'structured_output', 'local_arithmetic'))
+    assert get_cache_flags(on) == (False, True)
+
+
+def test_query_string_defaults():
+    assert get_cache_flags({'noCache': 'false'}) == (True, True)
+    assert get_cache_flags({'noCache': 'true'}) == (False, False)
+
+
+def test_parse_count():
+    assert parse_count(None, 3, 1, 8) == 3
+    assert parse_count('', 3, 1, 8) == 3
+    assert parse_count(' 5 ', 3, 1, 8) == 5
+    assert parse_count('50', 3, 1, 8) == 8
+    assert parse_count(0, 3, 1, 8) == 1
+    for value in ('abc', '2.5', True, [2]):
+        with pytest.raises(ValueError):
+            parse_count(value, 3, 1, 8)
+
+
+def test_batch_rejects_non_numeric_concurrency():
+    client = app.test_client()
+    response = client.post('/api/generate/batch?concurrency=abc', data=CSV_BODY, content_type='text/csv')
+    assert response.status_code == 400
+    assert 'concurrency' in response.get_json()['error']
+    response = client.post('/api/generate/batch', json={'items': [{'baseQuestion': 'What is 2 + 2?'}],
+                                                        'concurrency': 'many'})
+    assert response.status_code == 400
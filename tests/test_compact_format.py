@@ -0,0 +1,67 @@
+"""Compact line format: encoding, streaming decode, truncation and the JSON fallback"""
+import json
+
+import compact_format
+
+QUESTIONS = [
+    {'question': 'Tom bought 5 oranges for $3 each. How much did he spend in total?',
+     'options': [{'text': '$15', 'logic': 'CA'}, {'text': '$8', 'logic': 'Added instead of multiplied'}],
+     'image': 'A basket with 5 oranges and a $3 price tag',
+     'solution': 'Step 1: Multiply 5 × $3. Step 2: Tom spent $15 in total.'},
+    {'question': 'What is |-3| + 2?',
+     'options': [{'text': '5', 'logic': 'CA'}, {'text': '|-3|', 'logic': 'Did not evaluate'}],
+     'solution': 'Step 1: |-3| = 3. Step 2: 3 + 2 = 5.'},
+]
+
+
+def test_round_trip():
+    questions, truncated = compact_format.extract_questions(compact_format.encode(QUESTIONS))
+    assert questions == QUESTIONS
+    assert not truncated
+
+
+def test_lean_answer_lines():
+    text = 'Q: What is 12 × 8?\nA: 96\nS: 12 × 8 = 96.'
+    questions, _ = compact_format.extract_questions(text)
+    assert questions == [{'question': 'What is 12 × 8?', 'answer': '96', 'solution': '12 × 8 = 96.'}]
+
+
+def test_streaming_in_small_chunks_matches_one_feed():
+    text = compact_format.encode(QUESTIONS)
+    parser = compact_format.CompactQuestionParser()
+    streamed = []
+    for start in range(0, len(text), 7):
+        streamed += parser.feed(text[start:start + 7])
+    # The first question completes when the second Q: line arrives, the last one at finish()
+    assert streamed == QUESTIONS[:1]
+    streamed += parser.finish()
+    assert streamed == QUESTIONS
+
+
+def test_cut_off_response_drops_the_last_question():
+    text = compact_format.encode(QUESTIONS)
+    cut = text[:text.rindex('S:') + 8]
+    questions, truncated = compact_format.extract_questions(cut, complete=False)
+    assert questions == QUESTIONS[:1]
+    assert truncated
+
+
+def test_wrapped_fields_and_surrounding_prose():
+    text = ('Here you go:\n```\nQ: What is 3 + 4?\nO: 7 | CA\nO: 1 | Subtracted instead of added\n'
+            'S: Step 1: Add 3 and 4.\nStep 2: The answer is 7.\n```\nHope this helps!')
+    questions, _ = compact_format.extract_questions(text)
+    assert questions == [{'question': 'What is 3 + 4?',
+                          'options': [{'text': '7', 'logic': 'CA'}, {'text': '1', 'logic': 'Subtracted instead of added'}],
+                          'solution': 'Step 1: Add 3 and 4.\nStep 2: The answer is 7.'}]
+
+
+def test_json_response_falls_back_to_the_json_parser():
+    questions, truncated = compact_format.extract_questions(json.dumps(QUESTIONS))
+    assert questions == QUESTIONS
+    assert not truncated
+
+
+def test_parse_option():
+    assert compact_format.parse_option('$15 | CA') == {'text': '$15', 'logic': 'CA'}
+    assert compact_format.parse_option('24') == {'text': '24'}
+    assert compact_format.parse_option('|-3|') == {'text': '|-3|'}
@@ -0,0 +1,74 @@
+"""Distractors computed from the correct answer: formats, units and error models"""
+from fractions import Fraction
+
+import distractors
+
+
+def texts(options):
+    return {option['text'] for option in options}
+
+
+def test_parse_answer_formats():
+    assert distractors.parse_answer('1,200').value == 1200
+    assert distractors.parse_answer('$3.75').value == Fraction(375, 100)
+    assert distractors.parse_answer('1 1/2 cups').value == Fraction(3, 2)
+    assert distractors.parse_answer('7/8').value == Fraction(7, 8)
+    assert distractors.parse_answer('Paris') is None
+
+
+def test_units_agree_with_the_value():
+    cups = distractors.parse_answer('1 1/2 cups')
+    assert cups.format(Fraction(1)) == '1 cup'
+    assert cups.format(Fraction(1, 2)) == '1/2 cup'
+    assert cups.format(Fraction(11, 4)) == '2 3/4 cups'
+    assert distractors.parse_answer('1 cup').format(Fraction(2)) == '2 cups'
+    assert distractors.parse_answer('5 boxes').format(Fraction(1)) == '1 box'
+    assert distractors.parse_answer('4 feet').format(Fraction(1)) == '1 foot'
+    assert distractors.parse_answer('2 cups of flour').format(Fraction(1)) == '1 cup of flour'
+    # Abbreviations are the same for one and many
+    assert distractors.parse_answer('2.5 km').format(Fraction(1)) == '1 km'
+
+
+def test_operation_errors_of_a_division():
+    options = distractors.build_options('24', 4, 'What is 96 ÷ 4?', 'Step 1: 96 ÷ 4 = 24.', seed=1)
+    assert len(options) == 4
+    assert '384' in texts(options)
+
+
+def test_unit_conversion_skips_operation_swaps():
+    stem = 'A trail is 2500 m long. How many kilometers long is it?'
+    for solution in ('Step 1: 2500 ÷ 1000 = 2.5. Step 2: The trail is 2.5 km.',
+                     'Step 1: Divide 2500 m by 1000: 2500 ÷ 1000 = 2.5 km.'):
+        options = distractors.build_options('2.5 km', 4, stem, solution, seed=1)
+        assert len(options) == 4
+        logic = {option['logic'] for option in options}
+        assert not any('instead of' in item or 'wrong order' in item for item in logic)
+        assert not {'2500000 km', '1500 km', '2502.5 km'} & texts(options)
+        assert '2500 km' in texts(options)
+
+
+def test_mixed_number_answers():
+    options = distractors.build_options('1 1/2 cups', 4, 'A recipe uses 3/4 cup of milk per batch. How much do '
+                                        '2 batches use?', 'Step 1: 2 × 3/4 = 1 1/2. Step 2: 1 1/2 cups.', seed=1)
+    assert len(options) == 4
+    assert '15 cups' not in texts(options)
+    for option in options:
+        answer = distractors.parse_answer(option['text'])
+        assert answer is not None and answer.suffix.strip() in ('cup', 'cups')
+        assert ('cups' in option['text']) == (answer.value > 1)
+
+
+def test_implausible_candidates_are_rejected():
+    assert not distractors.plausible(Fraction(5, 2), Fraction(2500000), 'Multiplied instead of divided')
+    assert not distractors.plausible(Fraction(2, 3), Fraction(0), 'Calculation error')
+    assert distractors.plausible(Fraction(5, 2), Fraction(2500), 'Did not convert m to km')
+    assert distractors.plausible(Fraction(24), Fraction(384), 'Multiplied instead of divided')
+
+
+def test_fill_options_tops_up_without_duplicates():
+    options = [{'text': '$3.75', 'logic': 'CA'}, {'text': '$4.25', 'logic': 'Added instead of multiplied'}]
+    extra = distractors.fill_options(options, 4, '3 pens cost $1.25 each. What is the total?',
+                                     'Step 1: 3 × $1.25 = $3.75.')
+    assert len(extra) == 2
+    assert not texts(extra) & {'$3.75', '$4.25'}
+    assert all(text.startswith('$') for text in texts(extra))
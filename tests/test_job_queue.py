@@ -0,0 +1,68 @@
+"""SQLite job queue: claiming, partial results, stale job recovery and the runner threads"""
+import time
+
+import job_queue
+from job_queue import JobRunner, JobStore
+
+
+def test_job_lifecycle(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    first = store.enqueue({'baseQuestion': 'What is 1 + 1?'})
+    second = store.enqueue({'baseQuestion': 'What is 2 + 2?'})
+    assert store.get(first)['status'] == 'queued'
+
+    job = store.claim_next('worker-1')
+    assert job['id'] == first
+    assert job['status'] == 'running' and job['attempts'] == 1
+    assert job['payload'] == {'baseQuestion': 'What is 1 + 1?'}
+
+    store.add_question(first, {'question': 'What is 3 + 1?'})
+    store.add_question(first, {'question': 'What is 5 + 1?'})
+    assert [q['question'] for q in store.get(first)['questions']] == ['What is 3 + 1?', 'What is 5 + 1?']
+    store.finish(first)
+    assert store.get(first)['status'] == 'succeeded'
+    assert len(store.get(first)['questions']) == 2
+
+    assert store.claim_next('worker-1')['id'] == second
+    store.fail(second, 'boom')
+    assert store.get(second)['status'] == 'failed' and store.get(second)['error'] == 'boom'
+    assert store.claim_next('worker-1') is None
+    assert store.get('missing') is None
+
+
+def test_stale_jobs_are_retried_then_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_STALE_SECONDS', -1)
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 2)
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.enqueue({})
+    store.claim_next('dead-worker')
+    store.add_question(job_id, {'question': 'partial'})
+
+    # The worker stopped heartbeating: the job is queued again without its partial results
+    job = store.claim_next('worker-2')
+    assert job['id'] == job_id and job['attempts'] == 2 and job['questions'] == []
+
+    assert store.claim_next('worker-3') is None
+    assert store.get(job_id)['status'] == 'failed'
+
+
+def test_runner_executes_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_POLL_SECONDS', 0.05)
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+    def handler(job, job_store):
+        if job['payload'].get('fail'):
+            raise ValueError('bad request')
+        job_store.add_question(job['id'], {'question': 'streamed'})
+        return None
+
+    runner = JobRunner(store, handler, num_threads=1)
+    runner.start()
+    ok, failed = store.enqueue({}), store.enqueue({'fail': True})
+    runner.notify()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and {store.get(ok)['status'], store.get(failed)['status']} & {'queued', 'running'}:
+        time.sleep(0.05)
+    assert store.get(ok)['status'] == 'succeeded'
+    assert store.get(ok)['questions'] == [{'question': 'streamed'}]
+    assert store.get(failed)['status'] == 'failed' and 'bad request' in store.get(failed)['error']
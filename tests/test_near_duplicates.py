@@ -0,0 +1,31 @@
+"""Near-duplicate detection: name swaps are duplicates, changed numbers are not"""
+import near_duplicates
+
+
+def test_name_and_pronoun_swaps_are_duplicates():
+    index = near_duplicates.DuplicateIndex(enabled=True, history=False)
+    assert index.add('Maya has 42 apples and gives 12 to her friend. How many apples does she have left?')
+    assert not index.add('Leo has 42 apples and gives 12 to his friend. How many apples does he have left?')
+    assert not index.add('maya has 42 apples and gives 12 to her friend.  How many apples does she have left?')
+    assert index.dropped == {'batch': 2, 'history': 0}
+
+
+def test_copies_with_different_numbers_are_kept():
+    index = near_duplicates.DuplicateIndex(enabled=True, history=False)
+    for number in ('3,456', '7,812', '5,149'):
+        assert index.add(f'Round {number} to the nearest hundred. Which digit in the tens place changes?')
+    assert index.add('Maya has 35 apples and gives 12 to her friend. How many apples does she have left?')
+    assert index.add('Maya has 42 apples and gives 12 to her friend. How many apples does she have left?')
+
+
+def test_history_rejects_questions_generated_before():
+    base = 'Sam has 8 pencils and buys 5 more. How many pencils does he have?'
+    stem = 'Ava has 9 pencils and buys 4 more. How many pencils does she have?'
+    first = near_duplicates.DuplicateIndex(base, enabled=True, history=True)
+    assert first.add(stem)
+    first.remember()
+
+    second = near_duplicates.DuplicateIndex(base, enabled=True, history=True)
+    assert not second.add(stem.replace('Ava', 'Noah').replace('she', 'he'))
+    assert second.dropped['history'] == 1
+    assert second.add('Ava has 7 pencils and buys 6 more. How many pencils does she have?')
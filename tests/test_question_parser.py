@@ -0,0 +1,42 @@
+"""Incremental JSON question parser on well-formed and messy model output"""
+import json
+
+from question_parser import IncrementalQuestionParser, extract_questions
+
+QUESTIONS = [
+    {'question': 'What is 36 + 47?', 'options': [{'text': '83', 'logic': 'CA'}], 'image': '',
+     'solution': 'Step 1: {tens} 30 + 40 = 70. Step 2: "ones" 6 + 7 = 13.'},
+    {'question': 'What is 12 × 8?', 'options': [{'text': '96', 'logic': 'CA'}], 'image': '',
+     'solution': 'Step 1: 12 × 8 = 96.'},
+]
+
+
+def test_messy_wrappers():
+    text = json.dumps(QUESTIONS)
+    for wrapped in (text, f"```json\n{text}\n```", f"Here are the questions:\n{text}\nAnything else?",
+                    json.dumps({'questions': QUESTIONS})):
+        assert extract_questions(wrapped) == (QUESTIONS, False)
+
+
+def test_trailing_commas():
+    text = json.dumps(QUESTIONS)[:-1] + ',]'
+    assert extract_questions(text.replace('"CA"}]', '"CA"},]'))[0] == QUESTIONS
+
+
+def test_truncated_response_keeps_complete_questions():
+    text = json.dumps(QUESTIONS)
+    questions, truncated = extract_questions(text[:text.rindex('"solution"')])
+    assert questions == QUESTIONS[:1]
+    assert truncated
+
+
+def test_questions_are_emitted_as_their_closing_brace_arrives():
+    text = json.dumps(QUESTIONS)
+    parser = IncrementalQuestionParser()
+    emitted = []
+    for char in text:
+        emitted.append(len(parser.feed(char)))
+    assert sum(emitted) == 2
+    # The first question is out before the second one starts
+    assert emitted.index(1) < text.index('What is 12')
+    assert parser.finish() == []
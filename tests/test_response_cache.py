@@ -0,0 +1,40 @@
+"""Cache keys of generation inputs and the SQLite response cache"""
+import response_cache
+
+KWARGS = dict(base_question='What is 36 + 47?\nA) 83\nB) 73', notes='', solution='', images='', image_files=[],
+              num_options=2, num_questions=5, difficulty='Medium', grade='3', curriculum='Common Core',
+              model='gpt-4o', question_type_from_url='Mathematical', chunk_size=5, max_workers=4)
+
+
+def key(**changes):
+    return response_cache.make_key({**KWARGS, **changes})
+
+
+def test_key_ignores_whitespace_case_and_tuning_knobs():
+    assert key() == key(base_question='What is   36 + 47? \nA) 83\nB) 73  ')
+    assert key() == key(difficulty='medium', model='GPT-4o', curriculum='common core')
+    assert key() == key(chunk_size=2, max_workers=8, max_topup_rounds=0)
+
+
+def test_key_changes_with_the_inputs():
+    assert key() != key(num_questions=6)
+    assert key() != key(base_question='What is 36 + 48?')
+    assert key() != key(grade='4')
+    assert key() != key(image_files=[{'data': 'data:image/png;base64,AAAA'}])
+    assert key(image_files=[{'data': 'a'}]) != key(image_files=[{'data': 'b'}])
+
+
+def test_local_and_lean_results_are_cached_apart():
+    assert key() != key(local_arithmetic=True)
+    assert key() != key(lean_output=True)
+    assert key() == key(local_arithmetic=False, lean_output=False)
+
+
+def test_put_and_get():
+    questions = [{'question': 'What is 12 + 7?', 'options': [{'text': '19', 'logic': 'CA'}], 'image': ''}]
+    cache_key = key(base_question='What is 12 + 7?')
+    assert response_cache.get(cache_key) is None
+    response_cache.put(cache_key, questions)
+    assert response_cache.get(cache_key) == questions
+    response_cache.put(cache_key, questions, ttl=-1)
+    assert response_cache.get(cache_key) is None
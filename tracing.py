@@ -0,0 +1,263 @@
+"""
+Request-scoped tracing for generation requests.
+
+A trace is started per request and kept in a context variable, so any code
+running for that request can open timed spans and attach events without
+passing it around. Thread pools propagate it by submitting bind(fn).
+
+When a trace ends it can produce a Server-Timing header. One structured JSON
+line is printed for a sample of requests, and always for slow or failed ones.
+Requests slower than TRACE_SLOW_MS are also stored (span tree, prompt size,
+token usage) in a bounded ring buffer in SQLite; run `python tracing.py` to
+list them.
+"""
+import argparse
+import contextvars
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from storage import connect, state_path
+
+# Requests slower than this are kept in the slow-request buffer
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '30000'))
+# Number of slow requests kept; older ones are overwritten
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '200'))
+# Fraction of normal requests whose trace is logged (slow and failed requests are always logged)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+# Events per trace beyond this are counted but not kept
+MAX_EVENTS_PER_TRACE = 200
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_traces (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trace_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    duration_ms REAL NOT NULL,
+    created_at REAL NOT NULL,
+    trace TEXT NOT NULL
+)
+"""
+_schema_ready = False
+
+
+class Trace:
+    """Spans, events and counters collected for one request"""
+
+    def __init__(self, name, trace_id=None, **attrs):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.attrs = dict(attrs)
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.status = 'ok'
+        self.spans = []
+        self.events = []
+        self.dropped_events = 0
+        self.counters = {}
+        self._next_span_id = 0
+        # Spans and events arrive from the request's worker threads
+        self._lock = threading.Lock()
+        self._tokens = None
+
+    def _offset_ms(self, at=None):
+        return round(((time.perf_counter() if at is None else at) - self.started) * 1000, 3)
+
+    def _new_span(self, name, parent, start, attrs):
+        with self._lock:
+            self._next_span_id += 1
+            span = {'id': self._next_span_id, 'parent': parent, 'name': name,
+                    'start_ms': self._offset_ms(start), 'duration_ms': None, 'attrs': attrs}
+            self.spans.append(span)
+        return span
+
+    def add(self, **counters):
+        with self._lock:
+            for key, value in counters.items():
+                if value:
+                    self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'trace_id': self.trace_id, 'name': self.name, 'status': self.status,
+                'started_at': self.started_at, 'duration_ms': self.duration_ms,
+                'attrs': dict(self.attrs), 'counters': dict(self.counters),
+                'spans': [dict(span) for span in self.spans],
+                'events': list(self.events), 'dropped_events': self.dropped_events,
+            }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_trace(name, trace_id=None, **attrs):
+    """Start a trace and make it current in this context"""
+    trace = Trace(name, trace_id=trace_id, **attrs)
+    trace._tokens = (_current_trace.set(trace), _current_span.set(None))
+    return trace
+
+
+def end_trace(trace, status=None):
+    """Finish a trace, log it if sampled or slow, and store it if slow"""
+    if trace is None or trace.duration_ms is not None:
+        return
+    trace.duration_ms = trace._offset_ms()
+    if status:
+        trace.status = status
+    if trace._tokens is not None:
+        trace_token, span_token = trace._tokens
+        trace._tokens = None
+        try:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+        except ValueError:
+            # Ended from a different context (e.g. a generator resumed elsewhere); just clear it here
+            _current_trace.set(None)
+            _current_span.set(None)
+
+    slow = trace.duration_ms >= TRACE_SLOW_MS
+    if slow or trace.status != 'ok' or random.random() < TRACE_SAMPLE_RATE:
+        record = trace.to_dict()
+        record['slow'] = slow
+        print('TRACE ' + json.dumps(record, default=str))
+        if slow:
+            _store_slow(record)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the with-block as a child of the current span; a no-op outside a trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    start = time.perf_counter()
+    record = trace._new_span(name, _current_span.get(), start, attrs)
+    token = _current_span.set(record['id'])
+    try:
+        yield record
+    except BaseException as e:
+        record['attrs']['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        record['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def record_span(name, start, end=None, **attrs):
+    """Add an already-measured span (perf_counter start/end), e.g. one that spans generator yields"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    end = time.perf_counter() if end is None else end
+    record = trace._new_span(name, _current_span.get(), start, attrs)
+    record['duration_ms'] = round((end - start) * 1000, 3)
+
+
+def event(message, **fields):
+    """Attach a structured debug event to the current span; dropped outside a trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    with trace._lock:
+        if len(trace.events) >= MAX_EVENTS_PER_TRACE:
+            trace.dropped_events += 1
+            return
+        trace.events.append({'at_ms': trace._offset_ms(), 'span': _current_span.get(),
+                             'message': message, **fields})
+
+
+def add(**counters):
+    """Add to numeric counters on the current trace (prompt size, tokens, ...)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(**counters)
+
+
+def bind(fn):
+    """Wrap fn so it runs with the caller's trace and span, for thread pools and threads"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Each call gets its own copy: one Context can't be entered by two threads at once
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def server_timing(trace):
+    """Server-Timing header value: total time plus the summed duration of each span name"""
+    totals = {}
+    with trace._lock:
+        for span_record in trace.spans:
+            if span_record['duration_ms'] is None:
+                continue
+            total, count = totals.get(span_record['name'], (0.0, 0))
+            totals[span_record['name']] = (total + span_record['duration_ms'], count + 1)
+    duration = trace.duration_ms if trace.duration_ms is not None else trace._offset_ms()
+    entries = [f'total;dur={duration:.1f}']
+    for name, (total, count) in totals.items():
+        # Spans with the same name may overlap (concurrent chunks), so the sum can exceed the total
+        desc = f';desc="{count} calls"' if count > 1 else ''
+        entries.append(f'{name}{desc};dur={total:.1f}')
+    return ', '.join(entries)
+
+
+def _connect():
+    global _schema_ready
+    conn = connect(state_path('traces.sqlite3'))
+    if not _schema_ready:
+        conn.execute(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def _store_slow(record):
+    try:
+        conn = _connect()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO slow_traces (trace_id, name, duration_ms, created_at, trace) VALUES (?, ?, ?, ?, ?)',
+                (record['trace_id'], record['name'], record['duration_ms'], time.time(),
+                 json.dumps(record, default=str))
+            )
+            conn.execute('DELETE FROM slow_traces WHERE id <= ?', (cursor.lastrowid - TRACE_BUFFER_SIZE,))
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"WARNING: Could not store slow trace: {str(e)}")
+
+
+def recent_slow_traces(limit=20):
+    """Return the most recent slow traces, newest first"""
+    conn = _connect()
+    try:
+        rows = conn.execute('SELECT trace FROM slow_traces ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(row['trace']) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print recent slow request traces as JSON lines')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+    for record in recent_slow_traces(args.limit):
+        print(json.dumps(record))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
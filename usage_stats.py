@@ -0,0 +1,177 @@
+"""
+Observed token usage per model, question type and option count.
+
+Each completion records how many output tokens it used per returned question.
+The max-token budget for the next request is then sized from a high percentile
+of recent samples for the same (model, question type, option count), instead
+of a fixed per-option guess. Samples live in SQLite so all workers learn from
+each other.
+
+Prompt tokens served from the provider's prompt cache are recorded as well;
+run `python usage_stats.py` for the cached-token ratio per model and type.
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+
+from storage import connect, state_path
+
+USAGE_STATS_ENABLED = os.getenv('USAGE_STATS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+# Percentile of per-question usage used for the budget, and how many recent samples it looks at
+TOKEN_BUDGET_PERCENTILE = float(os.getenv('TOKEN_BUDGET_PERCENTILE', '95'))
+TOKEN_BUDGET_WINDOW = int(os.getenv('TOKEN_BUDGET_WINDOW', '200'))
+# Fewer samples than this falls back to the static formula
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv('TOKEN_BUDGET_MIN_SAMPLES', '10'))
+# Estimates are cached per worker for this long to keep SQLite off the hot path
+ESTIMATE_CACHE_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    num_options INTEGER NOT NULL,
+    num_questions INTEGER NOT NULL,
+    prompt_tokens INTEGER,
+    cached_tokens INTEGER,
+    completion_tokens INTEGER NOT NULL,
+    tokens_per_question REAL NOT NULL,
+    truncated INTEGER NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+_schema_ready = False
+_estimates = {}
+_estimates_lock = threading.Lock()
+
+
+def _connect():
+    global _schema_ready
+    conn = connect(state_path('usage_stats.sqlite3'))
+    if not _schema_ready:
+        conn.execute(_SCHEMA)
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(usage_samples)')}
+        if 'cached_tokens' not in columns:
+            conn.execute('ALTER TABLE usage_samples ADD COLUMN cached_tokens INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS usage_samples_key '
+                     'ON usage_samples (model, question_type, num_options, id)')
+        _schema_ready = True
+    return conn
+
+
+def cached_tokens(usage):
+    """Prompt tokens that were served from the provider's prompt cache, or None if not reported"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if isinstance(details, dict):
+        return details.get('cached_tokens')
+    return getattr(details, 'cached_tokens', None)
+
+
+def record_usage(model, question_type, num_options, num_questions, usage, truncated=False):
+    """Record one completion's usage; num_questions is how many valid questions it produced"""
+    if not USAGE_STATS_ENABLED or usage is None or num_questions <= 0:
+        return
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if not completion_tokens:
+        return
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT INTO usage_samples (model, question_type, num_options, num_questions, prompt_tokens, '
+                'cached_tokens, completion_tokens, tokens_per_question, truncated, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (model, question_type, num_options, num_questions, getattr(usage, 'prompt_tokens', None),
+                 cached_tokens(usage), completion_tokens, completion_tokens / num_questions, int(bool(truncated)), time.time())
+            )
+            # Only the most recent window is ever read, so drop older samples for this key
+            conn.execute(
+                'DELETE FROM usage_samples WHERE model = ? AND question_type = ? AND num_options = ? AND id NOT IN ('
+                'SELECT id FROM usage_samples WHERE model = ? AND question_type = ? AND num_options = ? '
+                'ORDER BY id DESC LIMIT ?)',
+                (model, question_type, num_options, model, question_type, num_options, TOKEN_BUDGET_WINDOW)
+            )
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"WARNING: Could not record token usage: {str(e)}")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def tokens_per_question_estimate(model, question_type, num_options):
+    """Return the high-percentile output tokens per question, or None without enough data"""
+    if not USAGE_STATS_ENABLED:
+        return None
+    key = (model, question_type, num_options)
+    now = time.monotonic()
+    with _estimates_lock:
+        cached = _estimates.get(key)
+    if cached and now - cached[1] < ESTIMATE_CACHE_SECONDS:
+        return cached[0]
+
+    estimate = None
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                'SELECT tokens_per_question FROM usage_samples WHERE model = ? AND question_type = ? '
+                'AND num_options = ? ORDER BY id DESC LIMIT ?',
+                (model, question_type, num_options, TOKEN_BUDGET_WINDOW)
+            ).fetchall()
+        finally:
+            conn.close()
+        if len(rows) >= TOKEN_BUDGET_MIN_SAMPLES:
+            estimate = percentile([row[0] for row in rows], TOKEN_BUDGET_PERCENTILE)
+    except Exception as e:
+        print(f"WARNING: Could not read token usage stats: {str(e)}")
+
+    with _estimates_lock:
+        _estimates[key] = (estimate, now)
+    return estimate
+
+
+def prompt_cache_report():
+    """Return prompt and cached token totals per (model, question type) over the recorded samples"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            'SELECT model, question_type, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, '
+            'SUM(COALESCE(cached_tokens, 0)) AS cached_tokens FROM usage_samples '
+            'WHERE prompt_tokens IS NOT NULL GROUP BY model, question_type ORDER BY model, question_type'
+        ).fetchall()
+    finally:
+        conn.close()
+    report = []
+    for row in rows:
+        entry = dict(row)
+        entry['cached_ratio'] = entry['cached_tokens'] / entry['prompt_tokens'] if entry['prompt_tokens'] else 0.0
+        report.append(entry)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report recorded token usage and prompt cache hits')
+    parser.parse_args(argv)
+    report = prompt_cache_report()
+    if not report:
+        print('No usage recorded yet')
+        return 0
+    print(f"{'model':<16} {'type':<14} {'calls':>7} {'prompt':>11} {'cached':>11} {'ratio':>7}")
+    for entry in report:
+        print(f"{entry['model']:<16} {entry['question_type']:<14} {entry['calls']:>7} {entry['prompt_tokens']:>11} "
+              f"{entry['cached_tokens']:>11} {entry['cached_ratio']:>7.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())